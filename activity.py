@@ -1,6 +1,11 @@
 from datetime import datetime
-from typing import List
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
 from calculation_data import AerobicDecoupling
+from metrics import ActivityMetrics
+from peaks import MeanMaxCurve, Peak
 
 
 class Activity:
@@ -12,6 +17,12 @@ class Activity:
     zwift_id: str = None
     s3_url: str = None
 
+    # Content hash of the archived FIT file
+    content_hash: str = None
+
+    # Fingerprint of the FIT file (see fit_prescan)
+    fingerprint: str = None
+
     # Start and end times.
     start_time: datetime = None
     end_time: datetime = None
@@ -29,9 +40,26 @@ class Activity:
     avg_hr: int = None
     max_hr: int = None
 
-    # Raw data
-    raw_power: List[int] = None
-    raw_hr: List[int] = None
+    # Per-second channels, keyed by name (see stream_store); only set while loading
+    streams: Dict[str, np.ndarray] = None
+
+    # Reads some of the stored per-second channels, given their names (see
+    # Persistence.load_streams); only set once stored, as they're only read
+    # when they're asked for
+    read_streams: Callable[..., Dict[str, np.ndarray]] = None
+
+    # Mean-maximal curves, keyed by channel (see peaks.MeanMaxCurve); only set while loading
+    mean_max: Dict[str, MeanMaxCurve] = None
+
+    # Peaks, and where they were, for every window we're configured for, keyed
+    # by stream and then window in seconds (see peaks.get_peak_windows), with
+    # zeros dropped and with them included (see peaks.calculate_peaks); only
+    # set while loading
+    peaks: Dict[str, Dict[int, Optional[Peak]]] = None
+    peaks_with_zeros: Dict[str, Dict[int, Optional[Peak]]] = None
+
+    # Seconds spent decoding the file and calculating the figures; only set while loading
+    load_seconds: Dict[str, float] = None
 
     # Power data.
     peak_5sec_power: int = None
@@ -63,9 +91,14 @@ class Activity:
     ftp: int = None
     intensity_factor: float = None
     tss: int = None
+    work: int = None
     speed_in_kmhr: float = None
     aerobic_decoupling: AerobicDecoupling = None
     aerobic_efficiency: float = None
     ctl: int = None
     atl: int = None
     first_for_day: bool = True
+
+    # The figures worked out from the raw data (see metrics.calculate_metrics); only set
+    # once they're asked for (see calculations.get_activity_metrics)
+    metrics: ActivityMetrics = None
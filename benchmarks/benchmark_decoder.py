@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+import numpy as np
+from fitparse import FitFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fit_decoder import decode_records  # noqa: E402
+from load_file_data import LoadedData, _build_loaded_data, _read_records  # noqa: E402
+
+REPEATS = 5  # The number of times we decode each file; we report the quickest
+
+
+def main():
+    """
+    Time our FIT decoder against fitparse on the FIT files named on the command
+    line, and check the two load the same data.
+
+    Usage: python benchmarks/benchmark_decoder.py FILE.fit [FILE.fit ...]
+    """
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            content = f.read()
+
+        # Time each decoder
+        ours = _best_time(lambda: decode_records(content))
+        theirs = _best_time(lambda: _read_records(fitfile=FitFile(content)))
+
+        # Check they agree on what we load
+        same = _same(_build_loaded_data(streams=decode_records(content)), _build_loaded_data(streams=_read_records(fitfile=FitFile(content))))
+        print(f"{path}: decoder {ours * 1000:.1f}ms, fitparse {theirs * 1000:.1f}ms (x{theirs / ours:.0f}); {'same' if same else 'DIFFERENT'} data")
+
+
+def _same(ours: LoadedData, theirs: LoadedData) -> bool:
+    """
+    Check two loads of the same file agree.
+
+    Args:
+        ours:   What our decoder loaded.
+        theirs: What fitparse loaded.
+
+    Returns:
+        True if they agree.
+    """
+    summary = ["start_time", "end_time", "distance", "elevation", "moving_time"]
+    if any(getattr(ours, name) != getattr(theirs, name) for name in summary):
+        return False
+    if ours.streams.keys() != theirs.streams.keys():
+        return False
+    return all(np.array_equal(ours.streams[name], theirs.streams[name], equal_nan=ours.streams[name].dtype.kind == "f") for name in ours.streams)
+
+
+def _best_time(run) -> float:
+    """
+    Time something, taking the quickest of REPEATS runs.
+
+    Args:
+        run: What to time.
+
+    Returns:
+        The quickest run, in seconds.
+    """
+    best = None
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    main()
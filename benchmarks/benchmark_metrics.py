@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calculation_data import AerobicDecoupling  # noqa: E402
+from calculations import calculate_normalised_power  # noqa: E402
+from fit_decoder import decode_records  # noqa: E402
+from load_file_data import _build_loaded_data  # noqa: E402
+from metrics import calculate_metrics  # noqa: E402
+from peaks import calculate_mean_max, calculate_peaks, get_peak_windows  # noqa: E402
+
+REPEATS = 5  # The number of times we time each approach; we report the quickest
+
+
+def main():
+    """
+    Time working out an activity's figures, the old way (a pass over the
+    streams for each figure) against calculate_metrics, on the FIT files named
+    on the command line. Both ways must agree.
+
+    Two costs are timed: loading (every figure, curves included), and
+    reporting (the aerobic decoupling and the zone counts, from the stored
+    streams).
+
+    Usage: python benchmarks/benchmark_metrics.py FILE.fit [FILE.fit ...]
+    """
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+    windows = get_peak_windows()
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            loaded = _build_loaded_data(streams=decode_records(f.read()))
+        power, hr, moving_time = loaded.power, loaded.hr, loaded.moving_time
+        raw_power, raw_hr = power.tolist(), hr.tolist()
+
+        # Check the two ways agree
+        metrics = calculate_metrics(power=power, hr=hr, moving_time=moving_time, windows=windows, curves=True)
+        assert metrics.normalised_power == calculate_normalised_power(power=raw_power), path
+        assert metrics.aerobic_decoupling == _old_aerobic_decoupling(power=raw_power, hr=raw_hr), path
+        assert metrics.peaks == {"power": calculate_peaks(source=power, windows=windows), "heart_rate": calculate_peaks(source=hr, windows=windows)}, path
+
+        # Time loading
+        old_load = _best_time(lambda: _old_load(power=power, hr=hr, moving_time=moving_time, windows=windows))
+        new_load = _best_time(lambda: calculate_metrics(power=power, hr=hr, moving_time=moving_time, windows=windows, curves=True))
+
+        # Time reporting
+        old_report = _best_time(lambda: (_old_aerobic_decoupling(power=raw_power, hr=raw_hr), Counter(raw_power), Counter(raw_hr)))
+        new_report = _best_time(lambda: calculate_metrics(power=np.asarray(raw_power), hr=np.asarray(raw_hr), moving_time=moving_time))
+        print(f"{path} ({len(power)}s): load {old_load * 1000:.1f} -> {new_load * 1000:.1f}ms, report {old_report * 1000:.2f} -> {new_report * 1000:.2f}ms")
+
+
+def _old_load(*, power: np.ndarray, hr: np.ndarray, moving_time: int, windows):
+    """
+    Work out an activity's figures the old way, a pass for each.
+
+    Args:
+        power:       The power stream.
+        hr:          The HR stream.
+        moving_time: The number of moving seconds.
+        windows:     The peak windows.
+    """
+    raw_power, raw_hr = power.tolist(), hr.tolist()
+    int(power.sum() / moving_time), int(power.max()), calculate_normalised_power(power=raw_power)
+    int(hr.sum() / moving_time), int(hr.max())
+    calculate_peaks(source=power, windows=windows), calculate_peaks(source=hr, windows=windows)
+    calculate_mean_max(source=power), calculate_mean_max(source=hr)
+    _old_aerobic_decoupling(power=raw_power, hr=raw_hr)
+
+
+def _old_aerobic_decoupling(*, power: List[int], hr: List[int]) -> Optional[AerobicDecoupling]:
+    """
+    Calculate the aerobic decoupling the way calculations.calculate_aerobic_decoupling
+    did before calculate_metrics replaced it (see tests/test_metrics.py).
+
+    Args:
+        power: The power stream.
+        hr:    The HR stream.
+
+    Returns:
+        The aerobic decoupling.
+    """
+    half_way_point = int(len(power) / 2)
+    if not power[0:half_way_point] or not power[half_way_point:]:
+        return None
+    ratios = []
+    for half_power, half_hr in ((power[0:half_way_point], hr[0:half_way_point]), (power[half_way_point:], hr[half_way_point:])):
+        hr_avg = sum(half_hr) / len(half_hr)
+        if not hr_avg:
+            return None
+        ratios.append(calculate_normalised_power(power=half_power) / hr_avg)
+    if not ratios[0]:
+        return None
+    return AerobicDecoupling(coupling=((ratios[0] - ratios[1]) / ratios[0]) * 100, first_half_ratio=ratios[0], second_half_ratio=ratios[1])
+
+
+def _best_time(run) -> float:
+    """
+    Time something, taking the quickest of REPEATS runs.
+
+    Args:
+        run: What to time.
+
+    Returns:
+        The quickest run, in seconds.
+    """
+    best = None
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    main()
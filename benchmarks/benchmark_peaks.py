@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calculations import get_moving_average  # noqa: E402
+from fit_decoder import decode_records  # noqa: E402
+from load_file_data import _build_loaded_data  # noqa: E402
+from peaks import PEAK_WINDOWS, calculate_peaks  # noqa: E402
+
+REPEATS = 5  # The number of times we time each approach; we report the quickest
+RANDOM_SECONDS = 4 * 3600  # The length of the made up ride we use if no files are named
+
+
+def main():
+    """
+    Time finding an activity's peaks, the old way (a moving average per window)
+    against calculate_peaks, on the FIT files named on the command line, or on
+    a made up four hour ride if there aren't any. Both ways must agree.
+
+    Usage: python benchmarks/benchmark_peaks.py [FILE.fit ...]
+    """
+    for name, power, hr in _rides():
+        old_peaks = _best_time(lambda: (_old_peaks(source=power.tolist(), windows=PEAK_WINDOWS), _old_peaks(source=hr.tolist(), windows=PEAK_WINDOWS)))
+        new_peaks = _best_time(lambda: (calculate_peaks(source=power, windows=PEAK_WINDOWS), calculate_peaks(source=hr, windows=PEAK_WINDOWS)))
+        for source in (power, hr):
+            peaks = calculate_peaks(source=source, windows=PEAK_WINDOWS)
+            assert _old_peaks(source=source.tolist(), windows=PEAK_WINDOWS) == {window: peak.value if peak else None for window, peak in peaks.items()}, name
+        print(f"{name} ({len(power)}s): moving averages {old_peaks * 1000:.1f}ms, calculate_peaks {new_peaks * 1000:.2f}ms (x{old_peaks / new_peaks:.0f})")
+
+
+def _rides():
+    """
+    Get the rides to time.
+
+    Returns:
+        Each ride's name, and its power and HR streams.
+    """
+    if len(sys.argv) < 2:
+        rng = np.random.default_rng(1)
+        power = rng.integers(0, 900, RANDOM_SECONDS)
+        power[rng.random(RANDOM_SECONDS) < 0.1] = 0
+        return [("random", power, rng.integers(100, 190, RANDOM_SECONDS))]
+    rides = []
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            loaded = _build_loaded_data(streams=decode_records(f.read()))
+        rides.append((path, loaded.power, loaded.hr))
+    return rides
+
+
+def _old_peaks(*, source: List[int], windows: Iterable[int]) -> Dict[int, Optional[int]]:
+    """
+    Find the peaks the way we used to: the best of each window's moving averages.
+
+    Args:
+        source:  The stream.
+        windows: The windows.
+
+    Returns:
+        The peak for each window, or None if the stream is too short.
+    """
+    peaks = {}
+    for window in windows:
+        averages = get_moving_average(source=source, window=window)
+        peaks[window] = int(max(averages)) if averages else None
+    return peaks
+
+
+def _best_time(run) -> float:
+    """
+    Time something, taking the quickest of REPEATS runs.
+
+    Args:
+        run: What to time.
+
+    Returns:
+        The quickest run, in seconds.
+    """
+    best = None
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    main()
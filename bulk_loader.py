@@ -0,0 +1,273 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+from persistence import Persistence
+from activity import Activity
+from load_file_data import load_file_data
+from file_loader import derive_title
+from fit_sources import FitEntry, find_entries, read_entry
+from fit_archive import FitArchive
+from fit_prescan import prescan, verify_crc
+from peaks import get_peak_windows
+
+BATCH_SIZE = 50  # The number of activities we store in each transaction
+
+# The fingerprints of the files already in the database, as seen by a worker
+# process; set up by _init_worker.
+_known_fingerprints: Dict[str, str] = {}
+
+
+class LoadResult(NamedTuple):
+    """
+    This class represents the result of loading one file in a worker process.
+    """
+
+    name: str  # The name of the file we loaded
+    activity: Optional[Activity]  # The activity, if it loaded
+    error: Optional[str]  # Why it didn't load, if it didn't
+    duplicate: bool = False  # True if it wasn't loaded because we already have it
+
+
+def load_from_directory(*, directory: str, workers: Optional[int] = None):
+    """
+    Load every FIT file in a directory tree, including gzip compressed files
+    and the FIT files inside zip archives.
+
+    Args:
+        directory: The directory to search for FIT files.
+        workers:   The number of worker processes to decode with. Defaults to
+                   the number of CPUs.
+    """
+    _load_from_directory(directory=directory, workers=workers)
+
+
+def _load_from_directory(*, directory: str, workers: Optional[int]):
+    """
+    Load every FIT file in a directory tree.
+
+    Files are decoded, and their peaks calculated, in a pool of worker
+    processes. The results come back to this process, which is the only one
+    that writes to the database, and are stored in batches.
+    """
+
+    # Initialise
+    started = time.perf_counter()
+    db = Persistence()
+
+    # Find the files we haven't already imported
+    entries = _find_fit_files(directory=directory)
+    known_ids = db.get_known_ids()
+    new_entries = [entry for entry in entries if entry.name not in known_ids]
+    skipped = len(entries) - len(new_entries)
+    print(f"Found {len(entries)} FIT files ({skipped} already imported)")
+    if not new_entries:
+        return
+
+    # Decode in the pool, storing the results as they arrive. The workers
+    # pre-scan each file, so files we already have are never decoded.
+    loaded = 0
+    failed = 0
+    duplicates = 0
+    batch: List[Activity] = []
+    seen_fingerprints = db.get_known_fingerprints()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(seen_fingerprints,)) as executor:
+        for result in executor.map(_load_file, new_entries, chunksize=4):
+
+            # Note failures and move on
+            if result.duplicate:
+                duplicates += 1
+                continue
+            if not result.activity:
+                print(f"Couldn't load {result.name}: {result.error}")
+                failed += 1
+                continue
+
+            # The same recording can turn up twice in one directory tree; we
+            # keep the first one
+            if fingerprint := result.activity.fingerprint:
+                if fingerprint in seen_fingerprints:
+                    duplicates += 1
+                    continue
+                seen_fingerprints[fingerprint] = result.name
+
+            # Store full batches
+            batch.append(result.activity)
+            if len(batch) >= BATCH_SIZE:
+                loaded += _store_batch(db=db, batch=batch, loaded=loaded, started=started)
+                batch = []
+
+        # Store the final batch
+        if batch:
+            loaded += _store_batch(db=db, batch=batch, loaded=loaded, started=started)
+
+    # Done.
+    elapsed = time.perf_counter() - started
+    rate = len(new_entries) / elapsed if elapsed else 0
+    print(f"Loaded {loaded} of {len(new_entries)} files in {elapsed:.1f}s ({rate:.1f} files/sec); {failed} failed, {duplicates} duplicates, {skipped} skipped")
+
+
+def reprocess_archive(*, workers: Optional[int] = None):
+    """
+    Reload every activity whose FIT file is in the local archive.
+
+    This recalculates everything we derive from the FIT files, without going
+    back to Zwift (or wherever they came from) for them.
+
+    Args:
+        workers: The number of worker processes to decode with. Defaults to
+                 the number of CPUs.
+    """
+
+    # Initialise
+    started = time.perf_counter()
+    db = Persistence()
+
+    # Find what we've archived
+    archived = db.load_archived()
+    print(f"Found {len(archived)} archived activities")
+    if not archived:
+        return
+
+    # Decode in the pool, storing the results in their original order
+    loaded = 0
+    failed = 0
+    batch: List[Activity] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(_reload_archived, archived, chunksize=4):
+            if not result.activity:
+                print(f"Couldn't reload {result.name}: {result.error}")
+                failed += 1
+                continue
+            batch.append(result.activity)
+            if len(batch) >= BATCH_SIZE:
+                loaded += _store_batch(db=db, batch=batch, loaded=loaded, started=started)
+                batch = []
+        if batch:
+            loaded += _store_batch(db=db, batch=batch, loaded=loaded, started=started)
+
+    # Done.
+    elapsed = time.perf_counter() - started
+    print(f"Reprocessed {loaded} activities in {elapsed:.1f}s; {failed} failed")
+
+
+def backfill_peaks():
+    """
+    Work out the peaks any activity is missing for the windows we're
+    configured for, e.g. after a window is added to the config file.
+    """
+    started = time.perf_counter()
+    db = Persistence()
+    backfilled = db.backfill_peaks(windows=list(get_peak_windows()))
+    print(f"Worked out the missing peaks for {backfilled} activities in {time.perf_counter() - started:.1f}s")
+
+
+def _find_fit_files(*, directory: str) -> List[FitEntry]:
+    """
+    Find the FIT files in a directory tree.
+
+    Args:
+        directory: The directory to search.
+
+    Returns:
+        The FIT files, sorted by file name. Zwift names its files by date, so
+        this loads older activities first.
+    """
+    entries = find_entries(directory)
+    return sorted(entries, key=lambda entry: (entry.file_name, entry.name))
+
+
+def _store_batch(*, db: Persistence, batch: List[Activity], loaded: int, started: float) -> int:
+    """
+    Store a batch of activities, and report progress.
+
+    Args:
+        db:      The database to store into.
+        batch:   The activities to store.
+        loaded:  The number of activities stored before this batch.
+        started: When the load started.
+
+    Returns:
+        The number of activities stored.
+    """
+    db.store_all(activities=batch)
+    elapsed = time.perf_counter() - started
+    total = loaded + len(batch)
+    print(f"Stored {total} activities ({total / elapsed:.1f} files/sec)")
+    return len(batch)
+
+
+def _init_worker(known_fingerprints: Dict[str, str]):
+    """
+    Set up a worker process.
+
+    Args:
+        known_fingerprints: The fingerprints of the files already in the database.
+    """
+    global _known_fingerprints
+    _known_fingerprints = known_fingerprints
+
+
+def _load_file(entry: FitEntry) -> LoadResult:
+    """
+    Load a single FIT file. This runs in a worker process.
+
+    Args:
+        entry: The file to load.
+
+    Returns:
+        The result of loading it.
+    """
+
+    # Check the file before we decode it, keeping any failure to report back.
+    # Duplicates are spotted from the fingerprint alone; only new files have
+    # their CRC checked.
+    try:
+        content = read_entry(entry)
+        fingerprint = prescan(content, check_crc=False)
+        if fingerprint in _known_fingerprints:
+            return LoadResult(name=entry.name, activity=None, error=None, duplicate=True)
+        verify_crc(content)
+        activity = load_file_data(source=content)
+    except Exception as e:
+        return LoadResult(name=entry.name, activity=None, error=str(e) or type(e).__name__)
+
+    # Add details, as the load command does
+    activity.zwift_id = entry.name
+    activity.s3_url = f"file://{entry.name}"
+    activity.content_hash = FitArchive().put(content)
+    activity.fingerprint = fingerprint
+    activity.activity_name = derive_title(filename=entry.file_name)
+
+    # Done
+    return LoadResult(name=entry.name, activity=activity, error=None)
+
+
+def _reload_archived(archived: Activity) -> LoadResult:
+    """
+    Reload a single archived activity. This runs in a worker process.
+
+    Args:
+        archived: The activity's stored details, including its content hash.
+
+    Returns:
+        The result of reloading it.
+    """
+
+    # Load the archived file, keeping any failure to report back
+    try:
+        activity = load_file_data(source=FitArchive().get(archived.content_hash))
+    except Exception as e:
+        return LoadResult(name=archived.zwift_id, activity=None, error=str(e) or type(e).__name__)
+
+    # Carry over the details that don't come from the file. An elevation gain
+    # from Zwift (or the user) is kept over the one we calculate.
+    activity.zwift_id = archived.zwift_id
+    activity.s3_url = archived.s3_url
+    activity.activity_name = archived.activity_name
+    if archived.elevation:
+        activity.elevation = archived.elevation
+    activity.content_hash = archived.content_hash
+
+    # Done
+    return LoadResult(name=archived.zwift_id, activity=activity, error=None)
@@ -1,13 +1,16 @@
 from activity import Activity
 from collections import namedtuple
-from typing import List, Optional
-from calculation_data import AerobicDecoupling, Fitness
+from typing import List
+from calculation_data import Fitness
 from athlete import get_ftp
 from collections import deque
+from metrics import ActivityMetrics, calculate_metrics
 import datetime
 import itertools
 import math
 
+import numpy as np
+
 
 def calculate_transient_values(activity: Activity):
     """
@@ -30,13 +33,36 @@ def calculate_transient_values(activity: Activity):
     speed_in_ms = distance_in_meters / activity.duration_in_seconds
     activity.speed_in_kmhr = speed_in_ms * 3600 / 1000
 
-    # Now calculate aerobic decoupling
+    # Now take the aerobic decoupling
     # See https://www.trainingpeaks.com/blog/aerobic-endurance-and-decoupling.
     if distance_in_meters >= 10000:
-        activity.aerobic_decoupling = calculate_aerobic_decoupling(activity)
+        activity.aerobic_decoupling = get_activity_metrics(activity).aerobic_decoupling
         activity.aerobic_efficiency = activity.normalised_power / activity.avg_hr
 
 
+def get_activity_metrics(activity: Activity) -> ActivityMetrics:
+    """
+    Get the figures that come from an activity's per-second power and HR (see
+    metrics.calculate_metrics), working them out the first time they're asked
+    for. That's a read of the two channels and one pass over them, so reports
+    that don't use the figures don't pay for it.
+
+    This also sets the activity's work.
+
+    Args:
+        activity: The activity.
+
+    Returns:
+        The figures.
+    """
+    if not activity.metrics:
+        streams = activity.streams or activity.read_streams(channels=["power", "heart_rate"])
+        empty = np.zeros(0, dtype=np.int64)
+        activity.metrics = calculate_metrics(power=streams.get("power", empty), hr=streams.get("heart_rate", empty), moving_time=activity.moving_time)
+        activity.work = activity.metrics.work
+    return activity.metrics
+
+
 def calculate_progressive_fitness(activities: List[Activity]):
     """
     Calculate the CTL and ATL for each day in the list of activities.
@@ -117,44 +143,6 @@ def _determine_first_for_day(activities: List[Activity]):
             activity.first_for_day = False
 
 
-def calculate_aerobic_decoupling(activity: Activity) -> Optional[AerobicDecoupling]:
-    """
-    Calculate the aerobic decoupling for an activity.
-
-    Args:
-        activity (Activity): The activity to calculate for.
-
-    Returns:
-        The aerobic decoupling.
-    """
-
-    # Split the power and HR data in half
-    assert len(activity.raw_power) == len(activity.raw_hr)
-    half_way_point = int(len(activity.raw_power) / 2)
-
-    first_half_power = activity.raw_power[0:half_way_point]
-    first_half_hr = activity.raw_hr[0:half_way_point]
-
-    second_half_power = activity.raw_power[half_way_point:]
-    second_half_hr = activity.raw_hr[half_way_point:]
-
-    # If either is empty, we don't have enough data to calculate
-    if not first_half_power or not second_half_power:
-        return None
-
-    # Calculate the first half's power-to-hr ratio
-    first_half_ratio = _calculate_aerobic_ratio(power=first_half_power, hr=first_half_hr)
-    second_half_ratio = _calculate_aerobic_ratio(power=second_half_power, hr=second_half_hr)
-    if first_half_ratio is None or second_half_ratio is None:
-        return None
-
-    # Calculate the decoupling of the two
-    coupling = ((first_half_ratio - second_half_ratio) / first_half_ratio) * 100
-
-    # Done
-    return AerobicDecoupling(coupling=coupling, first_half_ratio=first_half_ratio, second_half_ratio=second_half_ratio)
-
-
 def calculate_fitness(*, activities: List[Activity]) -> Fitness:
     """
     Calculate fitness given a list of activities.
@@ -348,24 +336,3 @@ def _calculate_daily_tss(*, activities: List[Activity], days: int) -> List[int]:
 
     # Done
     return tss_list
-
-
-def _calculate_aerobic_ratio(*, power: List[int], hr: List[int]) -> Optional[float]:
-    """
-    Given a list of power and HR details, find the ratio between their averages.
-
-    Args:
-        power: The list of power values.
-        hr: The list of HR values.
-
-    Returns:
-        The ratio between their averages.
-    """
-
-    # Calculate power and HR averages
-    assert len(power) == len(hr)
-    power_avg = calculate_normalised_power(power=power)
-    hr_avg = sum(hr) / len(hr)
-
-    # Determine ratio
-    return power_avg / hr_avg if hr_avg else None
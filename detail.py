@@ -4,12 +4,13 @@ import base64
 from persistence import Persistence
 from activity import Activity
 from athlete import get_ftp, get_hr, HeartRateData
-from typing import List
-from collections import namedtuple, Counter
-from calculations import calculate_transient_values, calculate_progressive_fitness
+from typing import Dict, List, Optional
+from collections import namedtuple
+from calculations import calculate_transient_values, calculate_progressive_fitness, get_activity_metrics
 from calculation_data import AerobicDecoupling
 from formatting import format_aero_decoupling, format_aero_efficiency, format_variability_index, LeftRightPrinter
 from datetime import timedelta
+from peaks import PEAK_COLUMNS, MeanMaxCurve, Peak, calculate_peaks, format_duration, get_mean_max
 
 ZoneDefinition = namedtuple("PowerZoneDefinition", "name upper colour")
 
@@ -35,12 +36,19 @@ CalculatedZone = namedtuple("PowerZone", "name lower upper colour")
 ZoneResult = namedtuple("ZoneResult", "name lower upper colour count")
 
 
-def detail_report(id: int):
+def detail_report(id: int, durations: Optional[List[int]] = None, with_zeros: bool = False):
     """
     Print a detailed report.
 
     This will fetch a specific activity from the database, then provide a detailed
     report for it.
+
+    Args:
+        id:         The activity's ID.
+        durations:  Extra peak durations to report, in seconds, read from the
+                    activity's mean-maximal curves.
+        with_zeros: Whether to report the peaks with zeros included, rather
+                    than dropped (see peaks.calculate_peaks).
     """
 
     # Load the peak data.
@@ -49,8 +57,9 @@ def detail_report(id: int):
         print(f"Cannot find activity #{id}")
         return
 
-    # Calculate transient data
+    # Calculate transient data, and the figures the work and zones come from
     calculate_transient_values(activity)
+    get_activity_metrics(activity)
 
     # Print our data
     _print_basic_data(activity)
@@ -60,7 +69,16 @@ def detail_report(id: int):
     # Finish off
     if activity.aerobic_decoupling:
         _print_aerobic_decoupling(activity)
-    _print_peaks(activity)
+    durations = durations or []
+    peaks = db.load_peaks(activity=activity, with_zeros=with_zeros)
+    if with_zeros and durations:
+        # The curves drop zeros, so these come from the streams instead
+        streams = db.load_streams(activity=activity, channels=list(PEAK_COLUMNS))
+        for metric, source in streams.items():
+            peaks.setdefault(metric, {}).update(calculate_peaks(source=source, windows=durations, with_zeros=True))
+        durations = []
+    curves = {channel: db.load_mean_max(activity=activity, channel=channel) for channel in ["power", "heart_rate"]} if durations else {}
+    _print_peaks(activity, peaks=peaks, durations=durations, curves=curves, with_zeros=with_zeros)
 
     # Done
     print()
@@ -136,6 +154,7 @@ def _print_power_data(activity: Activity, lrp: LeftRightPrinter):
     lrp.add_left(f"    Average .............. {int(activity.avg_power)}W")
     lrp.add_left(f"    Maximum .............. {activity.max_power}W")
     lrp.add_left(f"    Normalised ........... {int(activity.normalised_power)}W")
+    lrp.add_left(f"    Work ................. {activity.work:,d}kJ")
     if variability_index_text:
         lrp.add_left(f"    Variability index .... {variability_index_text}")
     lrp.add_left("")
@@ -152,16 +171,13 @@ def _print_power_zones(activity: Activity, lrp: LeftRightPrinter):
     # First calculate the actual zones
     zones = _calculate_power_zones(activity)
 
-    # Now count the number of power values in each zone
-    distribution = Counter(activity.raw_power)
-
-    # Now go through each zone and count the number of power values in that zone
+    # Now go through each zone and count the number of power values in that
+    # zone, from the number of seconds at each wattage
+    distribution = activity.metrics.power_histogram
     zone_results: List[ZoneResult] = []
 
     for zone in zones:
-        count = 0
-        for power in range(zone.lower, zone.upper + 1 if zone.upper else activity.max_power + 1):
-            count += distribution[power]
+        count = int(distribution[zone.lower : zone.upper + 1 if zone.upper else None].sum())
         zone_results.append(ZoneResult(name=zone.name, lower=zone.lower, upper=zone.upper, colour=zone.colour, count=count))
 
     # Print the result
@@ -217,16 +233,13 @@ def _print_hr_zones(activity: Activity, lrp: LeftRightPrinter):
     # First calculate the actual zones
     zones = _calculate_hr_zones(activity)
 
-    # Now count the number of power values in each zone
-    distribution = Counter(activity.raw_hr)
-
-    # Now go through each zone and count the number of power values in that zone
+    # Now go through each zone and count the number of HR values in that
+    # zone, from the number of seconds at each HR
+    distribution = activity.metrics.hr_histogram
     zone_results: List[ZoneResult] = []
 
     for zone in zones:
-        count = 0
-        for power in range(zone.lower, zone.upper + 1 if zone.upper else activity.max_power + 1):
-            count += distribution[power]
+        count = int(distribution[zone.lower : zone.upper + 1 if zone.upper else None].sum())
         zone_results.append(ZoneResult(name=zone.name, lower=zone.lower, upper=zone.upper, colour=zone.colour, count=count))
 
     # Find max HR
@@ -279,61 +292,67 @@ def _print_aerobic_decoupling(activity: Activity):
     print(f"    Second half .......... {second_half_text} (pAvg:hrAvg)")
 
 
-def _print_peaks(activity: Activity):
+def _print_peaks(
+    activity: Activity, *, peaks: Dict[str, Dict[int, Optional[Peak]]], durations: List[int], curves: Dict[str, Optional[MeanMaxCurve]], with_zeros: bool
+):
     """
-    Print the peak details for an activity.
+    Print the peak details for an activity, and when each was.
 
     Args:
-        activity: The activity to report on.
+        activity:   The activity to report on.
+        peaks:      The activity's peaks, keyed by stream and then window.
+        durations:  Extra durations to report on, in seconds. We only have the
+                    values of these, not when they were.
+        curves:     The activity's mean-maximal curves, keyed by channel.
+        with_zeros: Whether the peaks include zeros.
     """
 
-    # Find power details
-    p5sec = str(activity.peak_5sec_power).rjust(9) if activity.peak_5sec_power else "         "
-    p30sec = str(activity.peak_30sec_power).rjust(9) if activity.peak_30sec_power else "         "
-    p60sec = str(activity.peak_60sec_power).rjust(9) if activity.peak_60sec_power else "         "
-    p5min = str(activity.peak_5min_power).rjust(9) if activity.peak_5min_power else "         "
-    p10min = str(activity.peak_10min_power).rjust(9) if activity.peak_10min_power else "         "
-    p20min = str(activity.peak_20min_power).rjust(9) if activity.peak_20min_power else "         "
-    p30min = str(activity.peak_30min_power).rjust(9) if activity.peak_30min_power else "         "
-    p60min = str(activity.peak_60min_power).rjust(9) if activity.peak_60min_power else "         "
-    p90min = str(activity.peak_90min_power).rjust(9) if activity.peak_90min_power else "         "
-    p120min = str(activity.peak_120min_power).rjust(9) if activity.peak_120min_power else "         "
-
-    # Find HR details
-    hr5sec = str(activity.peak_5sec_hr).rjust(9) if activity.peak_5sec_hr else "         "
-    hr30sec = str(activity.peak_30sec_hr).rjust(9) if activity.peak_30sec_hr else "         "
-    hr60sec = str(activity.peak_60sec_hr).rjust(9) if activity.peak_60sec_hr else "         "
-    hr5min = str(activity.peak_5min_hr).rjust(9) if activity.peak_5min_hr else "         "
-    hr10min = str(activity.peak_10min_hr).rjust(9) if activity.peak_10min_hr else "         "
-    hr20min = str(activity.peak_20min_hr).rjust(9) if activity.peak_20min_hr else "         "
-    hr30min = str(activity.peak_30min_hr).rjust(9) if activity.peak_30min_hr else "         "
-    hr60min = str(activity.peak_60min_hr).rjust(9) if activity.peak_60min_hr else "         "
-    hr90min = str(activity.peak_90min_hr).rjust(9) if activity.peak_90min_hr else "         "
-    hr120min = str(activity.peak_120min_hr).rjust(9) if activity.peak_120min_hr else "         "
+    # Helper to format a peak, and when it was
+    def _format_peak(peak: Optional[Peak]) -> str:
+        if not peak or not peak.value:
+            return " " * 30
+        started = (activity.start_time + timedelta(seconds=peak.start)).strftime("%H:%M:%S")
+        ended = (activity.start_time + timedelta(seconds=peak.end)).strftime("%H:%M:%S")
+        return f"{peak.value:9}  {started} - {ended}"
 
     print()
-    print("\x1B[34m\x1B[1mPeaks\x1B[0m")
+    print("\x1B[34m\x1B[1mPeaks (zeros included)\x1B[0m" if with_zeros else "\x1B[34m\x1B[1mPeaks\x1B[0m")
     print("")
-    print("           Power (W)   HR (bpm)")
-    print("           ─────────  ─────────")
-    print(f"    5 sec  {p5sec}  {hr5sec}")
-    print(f"    30 sec {p30sec}  {hr30sec}")
-    print(f"    60 sec {p60sec}  {hr60sec}")
-    if activity.peak_5min_power or activity.peak_5min_hr:
-        print(f"    5 min  {p5min}  {hr5min}")
-    if activity.peak_10min_power or activity.peak_10min_hr:
-        print(f"    10 min {p10min}  {hr10min}")
-    if activity.peak_20min_power or activity.peak_20min_hr:
-        print(f"    20 min {p20min}  {hr20min}")
-    if activity.peak_30min_power or activity.peak_30min_hr:
-        print(f"    30 min {p30min}  {hr30min}")
-    if activity.peak_60min_power or activity.peak_60min_hr:
-        print(f"    60 min {p60min}  {hr60min}")
-    if activity.peak_90min_power or activity.peak_90min_hr:
-        print(f"    90 min {p90min}  {hr90min}")
-    if activity.peak_120min_power or activity.peak_120min_hr:
-        print(f"    120 min{p120min}  {hr120min}")
-    print("           ─────────  ─────────")
+    print("           Power (W)  When                  HR (bpm)  When")
+    print("           ─────────  ───────────────────  ─────────  ───────────────────")
+    for window in sorted(set(peaks.get("power", {})) | set(peaks.get("heart_rate", {}))):
+        power = peaks.get("power", {}).get(window)
+        hr = peaks.get("heart_rate", {}).get(window)
+        if (power and power.value) or (hr and hr.value) or window <= 60:
+            print(f"    {_format_window(window):7}{_format_peak(power)}  {_format_peak(hr)}".rstrip())
+
+    # Add any other durations we were asked for
+    if durations:
+        print("           ─────────  ───────────────────  ─────────  ───────────────────")
+    for duration in sorted(set(durations)):
+        power = get_mean_max(curves["power"], duration) if curves.get("power") else None
+        hr = get_mean_max(curves["heart_rate"], duration) if curves.get("heart_rate") else None
+        power_text = str(power).rjust(9) if power else "         "
+        hr_text = str(hr).rjust(9) if hr else "         "
+        print(f"    {format_duration(duration):7}{power_text}  {' ' * 19}  {hr_text}".rstrip())
+    print("           ─────────  ───────────────────  ─────────  ───────────────────")
+
+
+def _format_window(seconds: int) -> str:
+    """
+    Format a peak's window, e.g. "30 sec" or "20 min".
+
+    Args:
+        seconds: The window, in seconds.
+
+    Returns:
+        The formatted window.
+    """
+    if seconds <= 60:
+        return f"{seconds} sec"
+    if seconds % 60 == 0:
+        return f"{seconds // 60} min"
+    return format_duration(seconds)
 
 
 def _calculate_power_zones(activity: Activity) -> List[CalculatedZone]:
@@ -4,7 +4,9 @@ import base64
 from persistence import Persistence
 from activity import Activity
 from calculations import calculate_transient_values
+from peaks import Peak, format_duration
 from datetime import timedelta
+from typing import Dict, Optional
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -14,12 +16,17 @@ from scipy.interpolate import make_interp_spline, BSpline
 from scipy.ndimage.filters import gaussian_filter1d
 
 
-def detail_plot_report(id: int):
+def detail_plot_report(id: int, with_zeros: bool = False):
     """
     Plot the result of an activity.
 
     This will fetch a specific activity from the database, then plot its power
     and heart rate data.
+
+    Args:
+        id:         The activity's ID.
+        with_zeros: Whether to shade the power peaks with zeros included,
+                    rather than dropped (see peaks.calculate_peaks).
     """
 
     # Load the peak data.
@@ -31,19 +38,25 @@ def detail_plot_report(id: int):
     # Calculate transient data
     calculate_transient_values(activity)
 
+    # Load the channels we plot, and where the power peaks were
+    streams = db.load_streams(activity=activity, channels=["power", "heart_rate"])
+    peaks = db.load_peaks(activity=activity, with_zeros=with_zeros).get("power", {})
+
     # Do the plot
-    _generate_power_plot(activity)
+    _generate_power_plot(activity, streams=streams, peaks=peaks)
 
     # Done
     print()
 
 
-def _generate_power_plot(activity: Activity):
+def _generate_power_plot(activity: Activity, *, streams: Dict[str, np.ndarray], peaks: Dict[int, Optional[Peak]]):
     """
-    Generate a plot of power over the activity.
+    Generate a plot of power over the activity, with its power peaks shaded.
 
     Args:
         activity: The activity whose power we're plotting.
+        streams:  The activity's power and heart rate channels.
+        peaks:    The activity's power peaks, keyed by window.
     """
 
     # Setup colours
@@ -53,10 +66,11 @@ def _generate_power_plot(activity: Activity):
     hr_trend_color = "brown"
     time_color = "dimgrey"
     title_color = "cyan"
+    peak_color = "gold"
 
     # Smooth our inputs
-    power_smoothed = gaussian_filter1d(activity.raw_power, sigma=1.5)
-    hr_smoothed = gaussian_filter1d(activity.raw_hr, sigma=1.5)
+    power_smoothed = gaussian_filter1d(streams["power"], sigma=1.5)
+    hr_smoothed = gaussian_filter1d(streams["heart_rate"], sigma=1.5)
 
     # Setup the numpy arrays
     power_array = np.array(power_smoothed)
@@ -88,6 +102,22 @@ def _generate_power_plot(activity: Activity):
     ax1.grid(linewidth=0.5, color=power_color)
     ax1.tick_params(axis="y", colors=power_color, labelsize=16)
 
+    # Shade where the power peaks were. The shorter ones are inside the
+    # longer ones as often as not, so the shading builds up where they overlap.
+    for row, (window, peak) in enumerate(sorted(peaks.items())):
+        if peak and peak.value:
+            ax1.axvspan(peak.start, peak.end, color=peak_color, alpha=0.08, linewidth=0)
+            ax1.annotate(
+                f"{_format_window(window)} {peak.value}W",
+                xy=(peak.start, 1),
+                xycoords=("data", "axes fraction"),
+                xytext=(2, -4 - 16 * row),
+                textcoords="offset points",
+                va="top",
+                color=peak_color,
+                fontsize=12,
+            )
+
     # Setup the heart rate Y axis
     hr_z = np.polyfit(x_coords, hr_array, 1)
     hr_p = np.poly1d(hr_z)
@@ -112,3 +142,16 @@ def _generate_power_plot(activity: Activity):
     # Display it in iTerm
     # ESC ] 1337 ; File = [optional arguments] : base-64 encoded file contents ^G
     print(f"\x1B]1337;File=inline=1;preserveAspectRatio=1:{b64_image}\x07")
+
+
+def _format_window(seconds: int) -> str:
+    """
+    Format a peak's window for its label, e.g. "30s" or "20m".
+
+    Args:
+        seconds: The window, in seconds.
+
+    Returns:
+        The formatted window.
+    """
+    return format_duration(seconds).replace(" sec", "s").replace(" min", "m")
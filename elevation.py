@@ -0,0 +1,62 @@
+import numpy as np
+
+ELEVATION_HYSTERESIS = 3.0  # A climb (or descent) must be at least this many metres to count
+
+
+def calculate_elevation_gain(*, altitude: np.ndarray, hysteresis: float = ELEVATION_HYSTERESIS) -> int:
+    """
+    Calculate the total ascent from an altitude stream.
+
+    Noise in the altitude (barometric jitter, GPS wander, rounding) would add up
+    to a lot of phantom climbing if we summed every rise, so the altitude is
+    first passed through a hysteresis filter: the filtered altitude only moves
+    once the real altitude is more than half the hysteresis away from it. The
+    filtered altitude lags each climb by half the hysteresis at either end, so
+    that's added back for each climb we find. The upshot is that every climb of
+    at least the hysteresis counts in full, and anything smaller is ignored.
+
+    The filter is a chain of clamps, one per sample, and a chain of clamps is
+    itself a clamp, so the whole chain is worked out with a parallel prefix
+    scan over arrays rather than a loop over samples.
+
+    Args:
+        altitude:   The altitude, in metres, one per second.
+        hysteresis: The smallest climb that counts, in metres.
+
+    Returns:
+        The total ascent, in metres.
+    """
+
+    # We need a couple of readings to see any change
+    altitude = altitude[~np.isnan(altitude)]
+    if len(altitude) < 2:
+        return 0
+
+    # Each sample clamps the filtered altitude to within half the hysteresis of
+    # it. Compose the clamps: after the scan, (low[i], high[i]) is the clamp
+    # that all the samples up to i amount to.
+    half = hysteresis / 2
+    low = altitude - half
+    high = altitude + half
+    shift = 1
+    while shift < len(altitude):
+        low[shift:], high[shift:] = (
+            np.clip(low[:-shift], low[shift:], high[shift:]),
+            np.clip(high[:-shift], low[shift:], high[shift:]),
+        )
+        shift *= 2
+
+    # Start the filter as if we'd just come down a hill, so the first climb
+    # is treated the same as every other one
+    filtered = np.clip(altitude[0] + half, low, high)
+
+    # Total up the rises, then add back what the filter lost on each climb. A
+    # climb is a run of rises; flat spots don't end it, but a descent does.
+    changes = np.diff(filtered)
+    changes = changes[changes != 0]
+    rising = changes > 0
+    climbs = np.count_nonzero(rising[1:] & ~rising[:-1]) + int(rising[:1].sum())
+    gain = changes[rising].sum() + climbs * hysteresis
+
+    # Done
+    return int(round(gain))
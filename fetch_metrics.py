@@ -0,0 +1,220 @@
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+STAGES = ["listing", "download", "decode", "peaks", "store"]  # The stages we time, in the order they happen
+PROGRESS_INTERVAL = 0.25  # The fewest seconds between redraws of the progress line
+
+
+class FetchMetrics:
+    """
+    This class keeps track of where the time goes in a fetch, shows a progress
+    line while the activities load, and summarises the run at the end.
+
+    Downloads and parsing run in several workers at once, so the time we add up
+    for those stages is the time the workers spent on them, which can be more
+    than the time that passed. The pipeline overlaps the stages, too, so the
+    stage times don't add up to the total.
+    """
+
+    def __init__(self):
+        """
+        Initialise ourself.
+        """
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.seconds: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self.login_seconds = 0.0
+        self.login_method: Optional[str] = None
+        self.bytes_downloaded = 0
+        self.downloaded = 0
+        self.from_archive = 0
+        self.total = 0
+        self.loaded = 0
+        self.failed = 0
+
+        # Downloads are timed in their own threads
+        self._lock = threading.Lock()
+
+        # The progress line
+        self._show_progress = sys.stdout.isatty()
+        self._load_started = 0.0
+        self._last_drawn = 0.0
+        self._progress_drawn = False
+
+    def add_time(self, stage: str, seconds: float):
+        """
+        Add to the time spent in a stage.
+
+        Args:
+            stage:   The stage.
+            seconds: The time spent.
+        """
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    def add_download(self, *, seconds: float, size: int, from_archive: bool):
+        """
+        Note a download. This is called from the download threads.
+
+        Args:
+            seconds:      How long it took.
+            size:         How many bytes it was.
+            from_archive: True if it was read from the archive, rather than downloaded.
+        """
+        with self._lock:
+            if from_archive:
+                self.from_archive += 1
+            else:
+                self.seconds["download"] += seconds
+                self.bytes_downloaded += size
+                self.downloaded += 1
+
+    def start_loading(self, *, total: int):
+        """
+        Note that we're about to load the activities.
+
+        Args:
+            total: The number of activities to load.
+        """
+        self.total = total
+        self._load_started = time.perf_counter()
+        self._draw_progress(force=True)
+
+    def finish_activity(self, *, loaded: bool):
+        """
+        Note that we've finished with an activity, whether it loaded or not.
+
+        Args:
+            loaded: True if it loaded.
+        """
+        if loaded:
+            self.loaded += 1
+        else:
+            self.failed += 1
+        self._draw_progress(force=self.loaded + self.failed == self.total)
+
+    def print(self, message: str):
+        """
+        Print a message, keeping the progress line below it.
+
+        Args:
+            message: The message.
+        """
+        self._clear_progress()
+        print(message)
+        self._draw_progress(force=True)
+
+    def summarise(self):
+        """
+        Print a summary of the run, and clear the progress line.
+        """
+
+        # Clear the progress line
+        self._clear_progress()
+        self._show_progress = False
+        elapsed = time.perf_counter() - self.started
+
+        # Listing
+        print(f"Fetch took {elapsed:.2f}s:")
+        how = {"saved": "saved token", "refreshed": "refreshed token", "password": "password"}.get(self.login_method, "-")
+        print(f"    listing      {self.seconds['listing']:7.2f}s  (login {self.login_seconds:.2f}s by {how})")
+
+        # Downloading
+        download_seconds = self.seconds["download"]
+        rate = _format_bytes(self.bytes_downloaded / download_seconds) + "/s" if download_seconds else "-"
+        archived = f", {self.from_archive} from the archive" if self.from_archive else ""
+        files = "file" if self.downloaded == 1 else "files"
+        print(f"    downloading  {download_seconds:7.2f}s  ({self.downloaded} {files}, {_format_bytes(self.bytes_downloaded)}, {rate} per download{archived})")
+
+        # Decoding, peaks, and storing
+        print(f"    decoding     {self.seconds['decode']:7.2f}s")
+        print(f"    peaks        {self.seconds['peaks']:7.2f}s")
+        print(f"    storing      {self.seconds['store']:7.2f}s  ({self.loaded} loaded, {self.failed} failed)")
+
+    def get_record(self) -> Dict:
+        """
+        Get the run's numbers, to be stored.
+
+        Returns:
+            The numbers, keyed by their fetch_metrics column.
+        """
+        record = {f"{stage}_seconds": seconds for stage, seconds in self.seconds.items()}
+        record.update(
+            started=self.started_at.isoformat(timespec="seconds"),
+            total_seconds=time.perf_counter() - self.started,
+            login_seconds=self.login_seconds,
+            activities=self.total,
+            loaded=self.loaded,
+            failed=self.failed,
+            downloaded=self.downloaded,
+            bytes_downloaded=self.bytes_downloaded,
+        )
+        return record
+
+    def _draw_progress(self, *, force: bool = False):
+        """
+        Draw the progress line, if we're showing one.
+
+        Args:
+            force: Draw it even if we drew it very recently.
+        """
+
+        # Only draw it on a terminal, and not too often
+        now = time.perf_counter()
+        if not self._show_progress or not self.total or (not force and now - self._last_drawn < PROGRESS_INTERVAL):
+            return
+        self._last_drawn = now
+
+        # Work out how long the rest will take, from how long the rest took
+        done = self.loaded + self.failed
+        elapsed = now - self._load_started
+        eta = _format_seconds(elapsed / done * (self.total - done)) if done else "--:--"
+        rate = _format_bytes(self.bytes_downloaded / elapsed) + "/s" if elapsed else "-"
+
+        # Draw it
+        sys.stdout.write(f"\r\x1B[K{done}/{self.total} activities ({100 * done // self.total}%), {rate}, ETA {eta}")
+        sys.stdout.flush()
+        self._progress_drawn = True
+
+    def _clear_progress(self):
+        """
+        Clear the progress line, if we've drawn it.
+        """
+        if self._progress_drawn:
+            sys.stdout.write("\r\x1B[K")
+            sys.stdout.flush()
+            self._progress_drawn = False
+
+
+def _format_bytes(count: float) -> str:
+    """
+    Format a number of bytes for people.
+
+    Args:
+        count: The number of bytes.
+
+    Returns:
+        The formatted number.
+    """
+    for unit in ["B", "KB", "MB"]:
+        if count < 1024:
+            return f"{count:.0f}{unit}" if unit == "B" else f"{count:.1f}{unit}"
+        count /= 1024
+    return f"{count:.1f}GB"
+
+
+def _format_seconds(seconds: float) -> str:
+    """
+    Format a number of seconds as minutes and seconds.
+
+    Args:
+        seconds: The number of seconds.
+
+    Returns:
+        The formatted time.
+    """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}:{seconds:02d}"
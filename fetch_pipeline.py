@@ -0,0 +1,194 @@
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from activity import Activity
+
+DOWNLOAD_WORKERS = 4  # The number of downloads we run at once
+MAX_IN_FLIGHT = 8  # The most items that can be between download and storage at once
+
+_DONE = None  # Marks the end of a stage's output
+
+
+class _Downloaded(NamedTuple):
+    """
+    An item that's been through the download stage.
+    """
+
+    index: int  # Where the item sits in the input
+    item: Any  # The item itself
+    content: Optional[bytes]  # What we downloaded, if we did
+    error: Optional[str]  # Why we didn't, if we didn't
+
+
+class _Parsing(NamedTuple):
+    """
+    An item that's been handed to the parse stage.
+    """
+
+    index: int  # Where the item sits in the input
+    item: Any  # The item itself
+    future: Optional[Future]  # The parse result, if there's anything to parse
+    error: Optional[str]  # Why there isn't, if there isn't
+
+
+def run_fetch_pipeline(
+    *,
+    items: List[Any],
+    download: Callable[[Any], bytes],
+    parse: Callable[[bytes], Activity],
+    store: Callable[[Any, Activity], None],
+    fail: Callable[[Any, str], None],
+    advance: Optional[Callable[[Any, str], None]] = None,
+    download_workers: int = DOWNLOAD_WORKERS,
+    parse_workers: Optional[int] = None,
+):
+    """
+    Download, parse, and store a list of items, overlapping the three stages.
+
+    Downloads run in a pool of threads, parsing runs in a pool of processes, and
+    storing runs here, in the calling thread, so there's only ever one database
+    writer. The stages are joined by bounded queues, and no more than
+    MAX_IN_FLIGHT items are between download and storage at once, so a slow
+    stage holds the others back rather than letting work pile up in memory.
+
+    Items are stored in the order they're given, whatever order they finish
+    downloading and parsing in.
+
+    Args:
+        items:            The items to fetch, in the order they should be stored.
+        download:         Fetches an item's content. Runs in a thread; raises on failure.
+        parse:            Turns content into an activity. Runs in a worker process,
+                          so it must be a module-level function; raises on failure.
+        store:            Stores an item's activity.
+        fail:             Reports an item that couldn't be fetched, and why.
+        advance:          Told when an item has been "downloaded", and when it's
+                          been "parsed". Called here, like store, so it can
+                          write to the database.
+        download_workers: The number of downloads to run at once.
+        parse_workers:    The number of parsing processes. Defaults to the number of CPUs.
+    """
+
+    # Setup the queues between the stages
+    slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+    to_download: queue.Queue = queue.Queue()
+    downloaded: queue.Queue = queue.Queue(maxsize=MAX_IN_FLIGHT)
+    parsing: queue.Queue = queue.Queue(maxsize=MAX_IN_FLIGHT)
+
+    # Start the stages
+    with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+        threads = [threading.Thread(target=_feed, args=(items, slots, to_download, download_workers), daemon=True)]
+        threads += [threading.Thread(target=_download, args=(download, to_download, downloaded), daemon=True) for _ in range(download_workers)]
+        threads += [threading.Thread(target=_parse, args=(parse, executor, downloaded, parsing, download_workers), daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        # Store the results here, in order
+        _store(store=store, fail=fail, advance=advance, parsing=parsing, slots=slots)
+
+        # Done
+        for thread in threads:
+            thread.join()
+
+
+def _feed(items: List[Any], slots: threading.BoundedSemaphore, to_download: queue.Queue, download_workers: int):
+    """
+    Feed items to the download stage, no faster than they're stored.
+
+    Args:
+        items:            The items to fetch.
+        slots:            Limits the number of items in flight.
+        to_download:      The download stage's input.
+        download_workers: The number of download threads.
+    """
+    for index, item in enumerate(items):
+        slots.acquire()
+        to_download.put((index, item))
+    for _ in range(download_workers):
+        to_download.put(_DONE)
+
+
+def _download(download: Callable[[Any], bytes], to_download: queue.Queue, downloaded: queue.Queue):
+    """
+    The download stage: download items until there are none left.
+
+    Args:
+        download:    Fetches an item's content.
+        to_download: Our input.
+        downloaded:  Our output.
+    """
+    while (work := to_download.get()) is not _DONE:
+        index, item = work
+        try:
+            downloaded.put(_Downloaded(index=index, item=item, content=download(item), error=None))
+        except Exception as e:
+            downloaded.put(_Downloaded(index=index, item=item, content=None, error=str(e) or type(e).__name__))
+    downloaded.put(_DONE)
+
+
+def _parse(parse: Callable[[bytes], Activity], executor: ProcessPoolExecutor, downloaded: queue.Queue, parsing: queue.Queue, download_workers: int):
+    """
+    The parse stage: hand downloaded content to the process pool.
+
+    Args:
+        parse:            Turns content into an activity.
+        executor:         The process pool.
+        downloaded:       Our input.
+        parsing:          Our output.
+        download_workers: The number of download threads, each of which will tell us when it's done.
+    """
+    finished = 0
+    while finished < download_workers:
+        if (result := downloaded.get()) is _DONE:
+            finished += 1
+            continue
+        future = executor.submit(parse, result.content) if result.content is not None else None
+        parsing.put(_Parsing(index=result.index, item=result.item, future=future, error=result.error))
+    parsing.put(_DONE)
+
+
+def _store(
+    *,
+    store: Callable[[Any, Activity], None],
+    fail: Callable[[Any, str], None],
+    advance: Optional[Callable[[Any, str], None]],
+    parsing: queue.Queue,
+    slots: threading.BoundedSemaphore,
+):
+    """
+    The store stage: store parsed activities in their original order.
+
+    Args:
+        store:   Stores an item's activity.
+        fail:    Reports an item that couldn't be fetched.
+        advance: Told how far each item has got, if anyone wants to know.
+        parsing: Our input.
+        slots:   Limits the number of items in flight; we free a slot for each item we finish with.
+    """
+
+    # Items that finished ahead of their turn wait here
+    waiting: Dict[int, _Parsing] = {}
+    next_index = 0
+
+    while (result := parsing.get()) is not _DONE:
+        waiting[result.index] = result
+        if advance and result.future is not None:
+            advance(result.item, "downloaded")
+
+        # Store everything that's now next in line
+        while next_index in waiting:
+            ready = waiting.pop(next_index)
+            if ready.future is None:
+                fail(ready.item, ready.error)
+            else:
+                try:
+                    activity = ready.future.result()
+                except Exception as e:
+                    fail(ready.item, str(e) or type(e).__name__)
+                else:
+                    if advance:
+                        advance(ready.item, "parsed")
+                    store(ready.item, activity)
+            next_index += 1
+            slots.release()
@@ -1,40 +1,77 @@
+from typing import Optional
+
 from persistence import Persistence
 from activity import Activity
 from load_file_data import load_file_data
+from fit_sources import UnreadableFitFile, find_entries, read_entry
+from fit_archive import FitArchive
+from fit_prescan import InvalidFitFile, prescan, verify_crc
 
 
-def load_from_file(*, filename: str, elevation: int):
+def load_from_file(*, filename: str, elevation: Optional[int] = None):
     """
     Load a FIT file
     """
     _load_from_file(filename=filename, elevation=elevation)
 
 
-def _load_from_file(*, filename: str, elevation: int):
+def _load_from_file(*, filename: str, elevation: Optional[int]):
     """
     Load a FIT file.
+
+    The file can be a plain FIT file, a gzip compressed one (.fit.gz), or a zip
+    archive; every FIT file in an archive is loaded.
+
+    The elevation gain is calculated from the file's altitude data, unless we're
+    given one to use instead.
     """
 
-    # Load the file
-    if not (activity_record := load_file_data(path=filename)):
-        print(f"Couldn't find and load {filename}")
+    # Visit each FIT file we've been pointed at
+    db = Persistence()
+    archive = FitArchive()
+    known_fingerprints = db.get_known_fingerprints()
+    for entry in find_entries(filename):
 
-    # Add details
-    activity_record.zwift_id = filename
-    activity_record.s3_url = f"file://{filename}"
+        # Read and check the file before we decode it: files we've already
+        # loaded under another name are skipped, as are damaged and unreadable
+        # files. Duplicates are spotted from the fingerprint alone; only new
+        # files have their CRC checked.
+        try:
+            content = read_entry(entry)
+            fingerprint = prescan(content, check_crc=False)
+            if known_fingerprints.get(fingerprint, entry.name) != entry.name:
+                print(f"Skipping {entry.name}: already loaded as {known_fingerprints[fingerprint]}")
+                continue
+            verify_crc(content)
+        except (InvalidFitFile, UnreadableFitFile) as e:
+            print(f"Skipping {entry.name}: {e}")
+            continue
 
-    # Derive the title from the filename
-    activity_record.activity_name = _derive_title(filename=filename)
+        # Load the file
+        if not (activity_record := load_file_data(source=content)):
+            print(f"Couldn't find and load {entry.name}")
+            continue
 
-    # Capture the elevation
-    activity_record.elevation = elevation
+        # Add details
+        activity_record.zwift_id = entry.name
+        activity_record.s3_url = f"file://{entry.name}"
+        activity_record.content_hash = archive.put(content)
+        activity_record.fingerprint = fingerprint
 
-    # Save it
-    db = Persistence()
-    db.store(activity=activity_record)
+        # Derive the title from the filename
+        activity_record.activity_name = derive_title(filename=entry.file_name)
+
+        # Use the elevation we've been given, if we have
+        if elevation is not None:
+            activity_record.elevation = elevation
+
+        # Save it
+        db.store(activity=activity_record)
+        if fingerprint:
+            known_fingerprints[fingerprint] = entry.name
 
 
-def _derive_title(*, filename: str) -> str:
+def derive_title(*, filename: str) -> str:
 
     # replace any underscores with spaces
     title: str = filename.replace("_", " ")
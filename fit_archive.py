@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Union
+
+ARCHIVE_DIRECTORY = str(Path.home()) + "/.fit-peaks-archive"
+
+
+class FitArchive:
+    """
+    This class keeps a local copy of every FIT file we load.
+
+    Files are stored gzip compressed, keyed by the SHA-256 of their (uncompressed)
+    content, so the same file loaded twice is only stored once. The layout is
+    <directory>/<first two hash digits>/<hash>.fit.gz.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIRECTORY):
+        """
+        Initialise ourself.
+
+        Args:
+            directory: Where the archive lives.
+        """
+        self.directory = directory
+
+    def put(self, content: Union[bytes, bytearray, memoryview]) -> str:
+        """
+        Add a FIT file to the archive, unless it's already there.
+
+        Args:
+            content: The FIT file's content.
+
+        Returns:
+            The content hash the file is archived under.
+        """
+
+        # Find where this content belongs; if it's there, we're done
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = self._path(content_hash)
+        if os.path.exists(path):
+            return content_hash
+
+        # Write it to a temporary file alongside, then move it into place, so
+        # concurrent writers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(gzip.compress(content, mtime=0))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        # Done
+        return content_hash
+
+    def get(self, content_hash: str) -> bytes:
+        """
+        Fetch a FIT file from the archive.
+
+        Args:
+            content_hash: The content hash the file is archived under.
+
+        Returns:
+            The FIT file's content.
+        """
+        with gzip.open(self._path(content_hash), "rb") as archived_file:
+            return archived_file.read()
+
+    def contains(self, content_hash: str) -> bool:
+        """
+        Check whether a FIT file is in the archive.
+
+        Args:
+            content_hash: The content hash the file would be archived under.
+
+        Returns:
+            True if it's there.
+        """
+        return os.path.exists(self._path(content_hash))
+
+    def _path(self, content_hash: str) -> str:
+        """
+        Find where a FIT file lives in the archive.
+
+        Args:
+            content_hash: The content hash the file is archived under.
+
+        Returns:
+            The path of the archived file.
+        """
+        return os.path.join(self.directory, content_hash[:2], content_hash + ".fit.gz")
@@ -0,0 +1,299 @@
+import struct
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+FIT_EPOCH = datetime(1989, 12, 31)  # FIT timestamps count seconds from here (UTC)
+FIT_SIGNATURE = b".FIT"  # The signature every FIT header carries
+RECORD_MESSAGE = 20  # The global message number of a "record" message
+
+
+class RecordField(NamedTuple):
+    """
+    This class describes a record field that we decode.
+    """
+
+    name: str  # The name of the stream we decode it into
+    size: int  # The size, in bytes, we expect the field to be
+    dtype: str  # The numpy type we decode it as (without byte order)
+
+
+# This dictionary describes the record fields we decode, keyed by their FIT
+# field number. Any other field in a record message is skipped without being
+# looked at.
+RECORD_FIELDS = {
+    253: RecordField("timestamp", 4, "u4"),
+    7: RecordField("power", 2, "u2"),
+    3: RecordField("heart_rate", 1, "u1"),
+    5: RecordField("distance", 4, "u4"),
+    2: RecordField("altitude", 2, "u2"),
+    78: RecordField("enhanced_altitude", 4, "u4"),
+    4: RecordField("cadence", 1, "u1"),
+    6: RecordField("speed", 2, "u2"),
+    73: RecordField("enhanced_speed", 4, "u4"),
+}
+
+
+class FitDecodeError(Exception):
+    """
+    Raised when the fast decoder can't (or won't) decode a file. Callers should
+    fall back to fitparse when they see this.
+    """
+
+
+@dataclass
+class RecordStreams:
+    """
+    This class represents the record data we decoded from a FIT file. There is
+    one entry in each array for each record message, in file order.
+    """
+
+    timestamp: np.ndarray  # Seconds since the FIT epoch (uint32)
+    power: np.ndarray  # Power in watts; zero where missing (uint16)
+    heart_rate: np.ndarray  # Heart rate in bpm; zero where missing (uint8)
+    distance: np.ndarray  # Cumulative distance in metres; NaN where missing (float64)
+    altitude: np.ndarray  # Altitude in metres; NaN where missing (float64)
+    cadence: np.ndarray  # Cadence in rpm; zero where missing (uint8)
+    speed: np.ndarray  # Speed in metres per second; NaN where missing (float64)
+
+
+class _RecordDefinition(NamedTuple):
+    """
+    A record message definition, reduced to the fields we decode.
+    """
+
+    fields: Dict[str, Tuple[int, str]]  # Stream name -> (offset into the message, dtype)
+
+
+def decode_records(data: bytes) -> RecordStreams:
+    """
+    Decode the record messages in a FIT file.
+
+    This walks the message headers once, noting where each record message starts.
+    The fields we want are then lifted out of every record in bulk, straight from
+    the raw bytes into typed arrays. Anything we don't understand (compressed
+    timestamp headers, unexpected field sizes, a damaged file) raises a
+    FitDecodeError so the caller can fall back to fitparse.
+
+    Args:
+        data: The content of the FIT file.
+
+    Returns:
+        The decoded record streams.
+    """
+
+    # Find every record message in the file
+    definitions: List[_RecordDefinition] = []
+    offsets: List[int] = []
+    kinds: List[int] = []
+    pos = 0
+    try:
+        while pos < len(data):
+            pos = _walk_segment(data=data, start=pos, definitions=definitions, offsets=offsets, kinds=kinds)
+    except (IndexError, struct.error) as e:
+        raise FitDecodeError("Truncated FIT message") from e
+
+    # We need records to do anything useful
+    if not offsets:
+        raise FitDecodeError("No record messages found")
+
+    # Preallocate the output arrays
+    count = len(offsets)
+    streams = RecordStreams(
+        timestamp=np.zeros(count, dtype=np.uint32),
+        power=np.zeros(count, dtype=np.uint16),
+        heart_rate=np.zeros(count, dtype=np.uint8),
+        distance=np.full(count, np.nan, dtype=np.float64),
+        altitude=np.full(count, np.nan, dtype=np.float64),
+        cadence=np.zeros(count, dtype=np.uint8),
+        speed=np.full(count, np.nan, dtype=np.float64),
+    )
+
+    # Lift the fields out of each set of records that share a definition
+    raw = np.frombuffer(data, dtype=np.uint8)
+    all_offsets = np.array(offsets, dtype=np.int64)
+    all_kinds = np.array(kinds, dtype=np.int32) if len(definitions) > 1 else None
+    for kind, definition in enumerate(definitions):
+        rows = np.flatnonzero(all_kinds == kind) if all_kinds is not None else slice(None)
+        _extract_fields(raw=raw, offsets=all_offsets[rows], definition=definition, rows=rows, streams=streams)
+
+    # Done
+    return streams
+
+
+def to_datetime(timestamp: int) -> datetime:
+    """
+    Convert a FIT timestamp to a (naive, UTC) datetime, the same way fitparse does.
+
+    Args:
+        timestamp: Seconds since the FIT epoch.
+
+    Returns:
+        The corresponding datetime.
+    """
+    return FIT_EPOCH + timedelta(seconds=int(timestamp))
+
+
+def _walk_segment(*, data: bytes, start: int, definitions: List[_RecordDefinition], offsets: List[int], kinds: List[int]) -> int:
+    """
+    Walk the messages in one FIT segment (a header, its data, and its CRC).
+
+    Args:
+        data:        The content of the FIT file.
+        start:       Where this segment starts.
+        definitions: The record definitions we've seen; new ones are appended.
+        offsets:     The offsets of record message content; new ones are appended.
+        kinds:       The definition index of each record; new ones are appended.
+
+    Returns:
+        The position just after this segment.
+    """
+
+    # Check the file header
+    if len(data) - start < 12:
+        raise FitDecodeError("Truncated FIT header")
+    header_size = data[start]
+    if header_size < 12 or data[start + 8 : start + 12] != FIT_SIGNATURE:
+        raise FitDecodeError("Not a FIT file")
+    data_size = struct.unpack_from("<I", data, start + 4)[0]
+    pos = start + header_size
+    end = pos + data_size
+    if end > len(data):
+        raise FitDecodeError("Truncated FIT data")
+
+    # Message sizes and record definition indices, by local message type
+    sizes: List[Optional[int]] = [None] * 16
+    record_kinds: List[Optional[int]] = [None] * 16
+
+    # Walk the messages
+    while pos < end:
+        header = data[pos]
+
+        # We don't resolve compressed timestamps; fitparse can do that
+        if header & 0x80:
+            raise FitDecodeError("Compressed timestamp headers aren't supported")
+
+        local_type = header & 0x0F
+
+        # Definition message?
+        if header & 0x40:
+            pos = _read_definition(data=data, pos=pos, local_type=local_type, sizes=sizes, record_kinds=record_kinds, definitions=definitions)
+            continue
+
+        # Data message
+        size = sizes[local_type]
+        if size is None:
+            raise FitDecodeError(f"Data message for undefined local type {local_type}")
+        if record_kinds[local_type] is not None:
+            offsets.append(pos + 1)
+            kinds.append(record_kinds[local_type])
+        pos += size + 1
+
+    # Make sure we ended on the boundary, then skip the CRC
+    if pos != end:
+        raise FitDecodeError("Message overruns the FIT data")
+    return end + 2
+
+
+def _read_definition(
+    *, data: bytes, pos: int, local_type: int, sizes: List[Optional[int]], record_kinds: List[Optional[int]], definitions: List[_RecordDefinition]
+) -> int:
+    """
+    Read a definition message.
+
+    Args:
+        data:         The content of the FIT file.
+        pos:          The position of the definition message header.
+        local_type:   The local message type being defined.
+        sizes:        Message sizes by local type; updated for this type.
+        record_kinds: Record definition indices by local type; updated for this type.
+        definitions:  The record definitions we've seen; appended to if this is a record.
+
+    Returns:
+        The position just after the definition message.
+    """
+
+    # Read the fixed part
+    if pos + 6 > len(data):
+        raise FitDecodeError("Truncated definition message")
+    byte_order = ">" if data[pos + 2] else "<"
+    global_number = struct.unpack_from(byte_order + "H", data, pos + 3)[0]
+    field_count = data[pos + 5]
+
+    # Read the field definitions, noting those we want
+    fields: Dict[str, Tuple[int, str]] = {}
+    size = 0
+    field_pos = pos + 6
+    for _ in range(field_count):
+        field_number, field_size = data[field_pos], data[field_pos + 1]
+        if global_number == RECORD_MESSAGE and (wanted := RECORD_FIELDS.get(field_number)):
+            if field_size != wanted.size:
+                raise FitDecodeError(f"Unexpected size {field_size} for record field {wanted.name}")
+            fields[wanted.name] = (size, byte_order + wanted.dtype)
+        size += field_size
+        field_pos += 3
+
+    # Skip over any developer fields, but count their size
+    if data[pos] & 0x20:
+        developer_count = data[field_pos]
+        field_pos += 1
+        for _ in range(developer_count):
+            size += data[field_pos + 1]
+            field_pos += 3
+
+    # Every record must have a timestamp, or we can't place it in time
+    if global_number == RECORD_MESSAGE and "timestamp" not in fields:
+        raise FitDecodeError("Record definition has no timestamp")
+
+    # Remember this local type
+    sizes[local_type] = size
+    if global_number == RECORD_MESSAGE:
+        record_kinds[local_type] = len(definitions)
+        definitions.append(_RecordDefinition(fields=fields))
+    else:
+        record_kinds[local_type] = None
+
+    # Done
+    return field_pos
+
+
+def _extract_fields(*, raw: np.ndarray, offsets: np.ndarray, definition: _RecordDefinition, rows, streams: RecordStreams):
+    """
+    Lift the fields we want out of a set of records that share a definition.
+
+    Args:
+        raw:        The content of the FIT file, as bytes.
+        offsets:    The offset of each record's content.
+        definition: The definition these records share.
+        rows:       Where these records sit in the output arrays.
+        streams:    The output arrays.
+    """
+
+    for name, (field_offset, dtype) in definition.fields.items():
+
+        # Devices that record enhanced altitude or speed may record the plain
+        # one too; we prefer the enhanced one, which has more range
+        if "enhanced_" + name in definition.fields:
+            continue
+
+        # Gather the field's bytes from every record, then view them as values
+        dtype = np.dtype(dtype)
+        starts = offsets + field_offset
+        values = raw[starts[:, None] + np.arange(dtype.itemsize)].view(dtype).ravel()
+
+        # Store the values, minding each field's invalid marker
+        invalid = values == np.iinfo(dtype).max
+        if name == "distance":
+            streams.distance[rows] = np.where(invalid, np.nan, values / 100.0)
+        elif name in ("altitude", "enhanced_altitude"):
+            streams.altitude[rows] = np.where(invalid, np.nan, values / 5.0 - 500.0)
+        elif name in ("speed", "enhanced_speed"):
+            streams.speed[rows] = np.where(invalid, np.nan, values / 1000.0)
+        elif name == "timestamp":
+            if invalid.any():
+                raise FitDecodeError("Record with an invalid timestamp")
+            streams.timestamp[rows] = values
+        else:
+            getattr(streams, name)[rows] = np.where(invalid, 0, values)
@@ -0,0 +1,315 @@
+import struct
+import threading
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from fit_decoder import FIT_SIGNATURE
+
+FILE_ID_MESSAGE = 0  # The global message number of the "file_id" message
+FILE_ID_FIELDS = {1: "manufacturer", 2: "product", 3: "serial_number", 4: "time_created"}  # The file_id fields we fingerprint
+TIMESTAMP_FIELD = 253  # The field number of the timestamp in any message
+
+# FIT uses the CRC-16 with the 0x8005 polynomial (bit-reversed here, as we
+# process bytes least significant bit first).
+_CRC_TABLE = []
+for _byte in range(256):
+    _crc = _byte
+    for _ in range(8):
+        _crc = (_crc >> 1) ^ 0xA001 if _crc & 1 else _crc >> 1
+    _CRC_TABLE.append(_crc)
+_CRC_BYTE_TABLE = np.array(_CRC_TABLE, dtype=np.uint16)
+
+_CRC_WORD_TABLE: Optional[np.ndarray] = None  # Built on first use; see _get_word_table
+_CRC_SHIFT_TABLES: List[np.ndarray] = []  # Built as needed; see _get_shift_table
+_CRC_TABLE_LOCK = threading.Lock()  # Held while building those, as downloads check CRCs in several threads at once
+
+
+class InvalidFitFile(Exception):
+    """
+    Raised when a pre-scan finds a file isn't a valid FIT file.
+    """
+
+
+def prescan(content: Union[bytes, bytearray, memoryview], *, check_crc: bool = True) -> Optional[str]:
+    """
+    Check a FIT file is intact, and find its fingerprint, without decoding it.
+
+    The header and sizes are checked first, and the fingerprint is found by
+    reading just the first few messages; these take microseconds. The CRC check
+    reads the whole file (see verify_crc), so callers that look the
+    fingerprint up first can skip it here, and only check the files that are
+    new to them.
+
+    The fingerprint identifies the recording rather than the file, so the same
+    ride exported twice (or from two places) has the same fingerprint. It's
+    made from the recording device (manufacturer, product, and serial number),
+    when the file was created, and the first timestamp in it.
+
+    Args:
+        content:   The FIT file's content.
+        check_crc: True to check the CRC of every segment in the file.
+
+    Returns:
+        The file's fingerprint, or None if it doesn't have enough in it to
+        fingerprint.
+    """
+
+    # Check the segment headers and sizes
+    segments = _check_segments(content)
+
+    # Find the fingerprint from the start of the first segment
+    fingerprint = _find_fingerprint(content=content, start=segments[0][0], end=segments[0][1])
+
+    # Check the CRC of each segment
+    if check_crc:
+        _check_crcs(content=content, segments=segments)
+
+    # Done
+    return fingerprint
+
+
+def verify_crc(content: Union[bytes, bytearray, memoryview]):
+    """
+    Check the CRC of every segment in a FIT file.
+
+    Args:
+        content: The FIT file's content.
+    """
+    _check_crcs(content=content, segments=_check_segments(content))
+
+
+def _check_crcs(*, content: Union[bytes, bytearray, memoryview], segments: List[tuple]):
+    """
+    Check the CRC of each segment in a FIT file.
+
+    Args:
+        content:  The FIT file's content.
+        segments: The (start, end) of each segment (see _check_segments).
+    """
+    for start, end in segments:
+        expected = struct.unpack_from("<H", content, end)[0]
+        if calculate_crc(memoryview(content)[start:end]) != expected:
+            raise InvalidFitFile("CRC mismatch")
+
+
+def calculate_crc(data: Union[bytes, bytearray, memoryview], crc: int = 0) -> int:
+    """
+    Calculate a FIT CRC.
+
+    The CRC is linear, so rather than feeding the data through it a byte at a
+    time, we work it out for every byte on its own, then combine neighbouring
+    pairs: the CRC of two pieces is the CRC of the first, moved on over as many
+    zero bytes as the second has (see _get_shift_table), combined with the CRC
+    of the second. Each round halves the number of pieces, and every pair in a
+    round is combined at once, so there are only as many rounds as there are
+    bits in the length of the data.
+
+    Zero bytes in front of the data don't change a CRC that starts at zero, so
+    where a round has an odd number of pieces, we put an empty one (all zeros)
+    in front, and every pair in a round is the same length. The first round is
+    done by looking up the CRC of each word of the data.
+
+    Args:
+        data: The data to calculate the CRC of.
+        crc:  The CRC to start from.
+
+    Returns:
+        The CRC.
+    """
+
+    # Work out the CRC of each (little endian) word on its own, with a zero in
+    # front if there's an odd byte out
+    values = np.frombuffer(data, dtype=np.uint8)
+    length = len(values)
+    if not length:
+        return crc
+    if length & 1:
+        values = np.concatenate((np.zeros(1, dtype=np.uint8), values))
+    crcs = _get_word_table()[values.view("<u2")]
+
+    # Combine them a pair at a time
+    level = 1
+    while len(crcs) > 1:
+        if len(crcs) & 1:
+            crcs = np.concatenate((np.zeros(1, dtype=np.uint16), crcs))
+        crcs = _get_shift_table(level)[crcs[0::2]] ^ crcs[1::2]
+        level += 1
+
+    # Bring in the CRC we started from, moved on over the whole of the data
+    for level in range(length.bit_length()):
+        if length >> level & 1:
+            crc = int(_get_shift_table(level)[crc])
+
+    # Done
+    return crc ^ int(crcs[0])
+
+
+def _get_word_table() -> np.ndarray:
+    """
+    Get the table of the CRC of every 16 bit (little endian) word, building it
+    the first time we need it.
+
+    Returns:
+        The table, indexed by word.
+    """
+    global _CRC_WORD_TABLE
+    if _CRC_WORD_TABLE is None:
+        shift = _get_shift_table(0)
+        with _CRC_TABLE_LOCK:
+            words = np.arange(65536, dtype=np.uint16)
+            _CRC_WORD_TABLE = shift[_CRC_BYTE_TABLE[words & 0xFF]] ^ _CRC_BYTE_TABLE[words >> 8]
+    return _CRC_WORD_TABLE
+
+
+def _get_shift_table(level: int) -> np.ndarray:
+    """
+    Get the table that moves a CRC on over 2 ** level zero bytes, building it
+    (and those for the levels below it) the first time we need it.
+
+    Args:
+        level: The level.
+
+    Returns:
+        The table, indexed by CRC.
+    """
+    if len(_CRC_SHIFT_TABLES) <= level:
+        with _CRC_TABLE_LOCK:
+            if not _CRC_SHIFT_TABLES:
+                crcs = np.arange(65536, dtype=np.uint16)
+                _CRC_SHIFT_TABLES.append((crcs >> 8) ^ _CRC_BYTE_TABLE[crcs & 0xFF])
+            while len(_CRC_SHIFT_TABLES) <= level:
+                table = _CRC_SHIFT_TABLES[-1]
+                _CRC_SHIFT_TABLES.append(table[table])
+    return _CRC_SHIFT_TABLES[level]
+
+
+def _check_segments(content: Union[bytes, bytearray, memoryview]) -> List[tuple]:
+    """
+    Check the header and size of every segment in a FIT file.
+
+    Args:
+        content: The FIT file's content.
+
+    Returns:
+        The (start, end) of each segment's header and data; the segment's CRC
+        follows its end.
+    """
+
+    # Visit each segment
+    segments = []
+    pos = 0
+    while pos < len(content):
+
+        # Check the header
+        if len(content) - pos < 12:
+            raise InvalidFitFile("Truncated FIT header")
+        header_size = content[pos]
+        if header_size < 12 or bytes(content[pos + 8 : pos + 12]) != FIT_SIGNATURE:
+            raise InvalidFitFile("Not a FIT file")
+        if header_size >= 14:
+            header_crc = struct.unpack_from("<H", content, pos + 12)[0]
+            if header_crc and calculate_crc(memoryview(content)[pos : pos + 12]) != header_crc:
+                raise InvalidFitFile("Header CRC mismatch")
+
+        # Check the data (and its CRC) is all there
+        data_size = struct.unpack_from("<I", content, pos + 4)[0]
+        end = pos + header_size + data_size
+        if end + 2 > len(content):
+            raise InvalidFitFile(f"Truncated FIT data ({len(content) - pos} bytes of {header_size + data_size + 2})")
+
+        # Move on
+        segments.append((pos, end))
+        pos = end + 2
+
+    # Done
+    if not segments:
+        raise InvalidFitFile("Empty FIT file")
+    return segments
+
+
+def _find_fingerprint(*, content: Union[bytes, bytearray, memoryview], start: int, end: int) -> Optional[str]:
+    """
+    Find a FIT file's fingerprint, reading only as far as the first timestamp.
+
+    Args:
+        content: The FIT file's content.
+        start:   The start of the first segment.
+        end:     The end of the first segment's data.
+
+    Returns:
+        The fingerprint, if we found a timestamp.
+    """
+
+    # Message layouts by local type: global number, size, and field offsets
+    layouts: Dict[int, tuple] = {}
+    file_id: Dict[str, int] = {}
+
+    # Walk the messages until we find a timestamp
+    pos = start + content[start]
+    try:
+        while pos < end:
+            header = content[pos]
+
+            # A compressed timestamp header means a timestamp has been seen already
+            if header & 0x80:
+                break
+
+            # Definition message
+            local_type = header & 0x0F
+            if header & 0x40:
+                byte_order = ">" if content[pos + 2] else "<"
+                global_number = struct.unpack_from(byte_order + "H", content, pos + 3)[0]
+                fields = {}
+                size = 0
+                field_pos = pos + 6
+                for _ in range(content[pos + 5]):
+                    field_number, field_size = content[field_pos], content[field_pos + 1]
+                    fields[field_number] = (size, field_size)
+                    size += field_size
+                    field_pos += 3
+                if header & 0x20:
+                    developer_count = content[field_pos]
+                    field_pos += 1
+                    for _ in range(developer_count):
+                        size += content[field_pos + 1]
+                        field_pos += 3
+                layouts[local_type] = (global_number, size, fields, byte_order)
+                pos = field_pos
+                continue
+
+            # Data message
+            global_number, size, fields, byte_order = layouts[local_type]
+            if global_number == FILE_ID_MESSAGE:
+                for field_number, name in FILE_ID_FIELDS.items():
+                    if field_number in fields:
+                        file_id[name] = _read_unsigned(content, pos + 1, fields[field_number], byte_order)
+            elif TIMESTAMP_FIELD in fields:
+                first_timestamp = _read_unsigned(content, pos + 1, fields[TIMESTAMP_FIELD], byte_order)
+                device = ":".join(str(file_id.get(name, "")) for name in FILE_ID_FIELDS.values())
+                return f"{device}:{first_timestamp}"
+            pos += size + 1
+
+    # A damaged message; we'll let the CRC check or the decoder deal with that
+    except (KeyError, IndexError, struct.error):
+        pass
+
+    # No timestamp, so no fingerprint
+    return None
+
+
+def _read_unsigned(content: Union[bytes, bytearray, memoryview], pos: int, field: tuple, byte_order: str) -> int:
+    """
+    Read an unsigned integer field.
+
+    Args:
+        content:    The FIT file's content.
+        pos:        The start of the message's content.
+        field:      The field's (offset, size).
+        byte_order: The message's byte order.
+
+    Returns:
+        The field's value.
+    """
+    offset, size = field
+    return int.from_bytes(bytes(content[pos + offset : pos + offset + size]), "big" if byte_order == ">" else "little")
@@ -0,0 +1,175 @@
+import gzip
+import os
+import zipfile
+import zlib
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+FIT_SUFFIXES = (".fit", ".fit.gz")  # The names of the FIT files we load (any case)
+ARCHIVE_SUFFIX = ".zip"  # The names of the archives we look inside (any case)
+
+# What reading a damaged, partly written, or unreadable file can raise
+READ_ERRORS = (zipfile.BadZipFile, gzip.BadGzipFile, zlib.error, EOFError, OSError)
+
+
+class UnreadableFitFile(Exception):
+    """
+    Raised when a FIT file (or the archive it's in) can't be read.
+    """
+
+
+class FitEntry(NamedTuple):
+    """
+    This class represents a FIT file we can load: either a file on disk, or a
+    member of a zip archive. Either may be gzip compressed.
+    """
+
+    path: str  # The file on disk
+    member: Optional[str] = None  # The archive member, if it's in an archive
+
+    @property
+    def name(self) -> str:
+        """
+        The name we know this FIT file by; archive members are named as if the
+        archive were a directory.
+        """
+        return f"{self.path}/{self.member}" if self.member else self.path
+
+    @property
+    def file_name(self) -> str:
+        """
+        The name of the FIT file itself, without any directory.
+        """
+        return os.path.basename(self.member or self.path)
+
+
+def is_fit_name(name: str) -> bool:
+    """
+    Check whether a file name looks like a FIT file we can load.
+
+    Args:
+        name: The file name.
+
+    Returns:
+        True if it's a FIT file, compressed or not.
+    """
+    return name.lower().endswith(FIT_SUFFIXES)
+
+
+def is_archive_name(name: str) -> bool:
+    """
+    Check whether a file name looks like a zip archive.
+
+    Args:
+        name: The file name.
+
+    Returns:
+        True if it's a zip archive.
+    """
+    return name.lower().endswith(ARCHIVE_SUFFIX)
+
+
+def get_canonical_path(path: str) -> str:
+    """
+    Get the name we know a file by: its absolute path, with any symbolic links
+    resolved. Activities loaded from files are named by it, however the file
+    was pointed at, so the same file always has the same name.
+
+    Args:
+        path: The path to the file.
+
+    Returns:
+        The canonical path.
+    """
+    return os.path.realpath(path)
+
+
+def find_entries(path: str) -> List[FitEntry]:
+    """
+    Find the FIT files a path refers to. Each is named by its canonical path
+    (see get_canonical_path).
+
+    Archives we can't read (e.g. because they're damaged, or still being
+    written) are reported and skipped, so one bad archive doesn't stop us
+    finding the rest.
+
+    Args:
+        path: A FIT file (compressed or not), a zip archive, or a directory tree
+              containing any of those.
+
+    Returns:
+        The FIT files we found.
+    """
+
+    # A directory tree
+    path = get_canonical_path(path)
+    if os.path.isdir(path):
+        entries: List[FitEntry] = []
+        for file_path in Path(path).rglob("*"):
+            if file_path.is_file() and (is_fit_name(file_path.name) or is_archive_name(file_path.name)):
+                entries.extend(find_entries(str(file_path)))
+        return entries
+
+    # An archive; we only read its directory here
+    if is_archive_name(path):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                return [FitEntry(path=path, member=info.filename) for info in archive.infolist() if not info.is_dir() and is_fit_name(info.filename)]
+        except READ_ERRORS as e:
+            print(f"Skipping {path}: {str(e) or type(e).__name__}")
+            return []
+
+    # A plain FIT file
+    return [FitEntry(path=path)]
+
+
+def read_entry(entry: FitEntry) -> bytes:
+    """
+    Read the content of a FIT file. Archive members and gzip compressed files
+    are decompressed in memory as they're read; nothing is unpacked to disk.
+
+    Args:
+        entry: The FIT file to read.
+
+    Returns:
+        The (uncompressed) FIT content.
+
+    Raises:
+        UnreadableFitFile: If the file can't be read or decompressed.
+    """
+    try:
+        return _read_entry(entry)
+    except READ_ERRORS as e:
+        raise UnreadableFitFile(str(e) or type(e).__name__) from e
+
+
+def _read_entry(entry: FitEntry) -> bytes:
+    """
+    Read the content of a FIT file (see read_entry).
+
+    Args:
+        entry: The FIT file to read.
+
+    Returns:
+        The (uncompressed) FIT content.
+    """
+
+    # Plain files we read directly
+    compressed = entry.file_name.lower().endswith(".gz")
+    if not entry.member and not compressed:
+        with open(entry.path, "rb") as fit_file:
+            return fit_file.read()
+
+    # Otherwise, stream the content through whatever decompression it needs
+    with open(entry.path, "rb") as raw_file:
+        archive = zipfile.ZipFile(raw_file) if entry.member else None
+        try:
+            stream = archive.open(entry.member) if archive else raw_file
+            with stream:
+                if compressed:
+                    with gzip.GzipFile(fileobj=stream) as gzip_stream:
+                        return gzip_stream.read()
+                return stream.read()
+        finally:
+            if archive:
+                archive.close()
@@ -1,10 +1,17 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
 import click
 
 from zwift_loader import load_from_zwift
 from file_loader import load_from_file
+from bulk_loader import backfill_peaks, load_from_directory, reprocess_archive
+from watcher import POLL_INTERVAL, watch_directory
 from power import power_report
+from peaks import parse_duration
 from hr import hr_report
 from detail import detail_report
+from top import top_report
 from week import week_report
 from detail_plot import detail_plot_report
 
@@ -18,21 +25,33 @@ def cli(ctx):
 
 # Add in a "fetch" command.
 @click.command("fetch")
-def fetch():
+@click.option("--metadata-only", is_flag=True, help="Only refresh the names and elevations of activities we already have.")
+@click.option("--since", type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help="Also load older activities, back to this date.")
+@click.option("--max", "max_activities", type=click.IntRange(min=1), default=None, help="The most activities to load in this run.")
+def fetch(metadata_only: bool, since: Optional[datetime], max_activities: Optional[int]):
     """
     Load any new Zwift data.
     """
-    load_from_zwift()
+    load_from_zwift(metadata_only=metadata_only, since=since, max_activities=max_activities)
+
+
+# Turn the --duration options into seconds.
+def _parse_durations(ctx: click.Context, param: click.Parameter, values: Tuple[str, ...]) -> List[int]:
+    try:
+        return [parse_duration(value) for value in values]
+    except ValueError as e:
+        raise click.BadParameter(str(e))
 
 
 # Add in a "power" command.
 @click.command("power")
 @click.option("--all", is_flag=True)
-def do_power_report(all: bool):
+@click.option("--duration", "durations", multiple=True, callback=_parse_durations, help="Also show the best efforts for this duration, e.g. 8m or 1h30m.")
+def do_power_report(all: bool, durations: List[int]):
     """
     Report on peak power data.
     """
-    power_report(all)
+    power_report(all, durations)
 
 
 # Add in a "hr" command.
@@ -47,41 +66,109 @@ def do_hr_report():
 # Add in a "detail" command
 @click.command("detail")
 @click.argument("id", required=True, type=int)
-def do_detail_report(id: int):
+@click.option("--duration", "durations", multiple=True, callback=_parse_durations, help="Also show the peaks for this duration, e.g. 8m or 1h30m.")
+@click.option("--with-zeros", is_flag=True, help="Include zero readings in the peaks, so each covers exactly its window.")
+def do_detail_report(id: int, durations: List[int], with_zeros: bool):
     """
     Provide an ID, and this command will show that activity's details.
     """
-    detail_report(id)
+    detail_report(id, durations, with_zeros)
 
 
 # Add in a "plot" command
 @click.command("plot")
 @click.argument("id", required=True, type=int)
-def do_detail_plot_report(id: int):
+@click.option("--with-zeros", is_flag=True, help="Include zero readings in the peaks, so each covers exactly its window.")
+def do_detail_plot_report(id: int, with_zeros: bool):
     """
     Provide an ID, and this command will plot that activity.
     """
-    detail_plot_report(id)
+    detail_plot_report(id, with_zeros)
 
 
 # Add in a "load" command
 @click.command("load")
 @click.argument("filename", required=True, type=str)
-@click.argument("elevation", required=True, type=int)
-def do_load(filename: str, elevation: int):
+@click.argument("elevation", required=False, type=int)
+def do_load(filename: str, elevation: Optional[int]):
     """
-    Load a FIT file
+    Load a FIT file, optionally overriding its elevation gain
     """
     load_from_file(filename=filename, elevation=elevation)
 
 
+# Add in a "load-dir" command
+@click.command("load-dir")
+@click.argument("directory", required=True, type=click.Path(exists=True, file_okay=False))
+@click.option("--workers", type=int, default=None, help="Number of decoding processes (defaults to the CPU count).")
+def do_load_dir(directory: str, workers: int):
+    """
+    Load every FIT file in a directory tree
+    """
+    load_from_directory(directory=directory, workers=workers)
+
+
+# Add in a "reprocess" command
+@click.command("reprocess")
+@click.option("--workers", type=int, default=None, help="Number of decoding processes (defaults to the CPU count).")
+def do_reprocess(workers: int):
+    """
+    Reload every activity from the local FIT archive
+    """
+    reprocess_archive(workers=workers)
+
+
+# Add in a "backfill" command
+@click.command("backfill")
+def do_backfill():
+    """
+    Work out the peaks for any windows added to the config file
+    """
+    backfill_peaks()
+
+
+# Add in a "top" command
+@click.command("top")
+@click.argument("window", required=True, type=str)
+@click.option("--hr", is_flag=True, help="Rank by heart rate, rather than power.")
+@click.option("--count", type=click.IntRange(min=1), default=10, help="How many activities to show.")
+@click.option("--days", type=click.IntRange(min=1), default=None, help="Only look at the last this many days.")
+@click.option("--with-zeros", is_flag=True, help="Include zero readings in the peaks, so each covers exactly its window.")
+def do_top_report(window: str, hr: bool, count: int, days: Optional[int], with_zeros: bool):
+    """
+    Show the activities with the best peaks for a window, e.g. 20m
+    """
+    try:
+        window_seconds = parse_duration(window)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="WINDOW")
+    top_report(window=window_seconds, metric="heart_rate" if hr else "power", count=count, days=days, with_zeros=with_zeros)
+
+
+# Add in a "watch" command
+@click.command("watch")
+@click.argument("directory", required=True, type=click.Path(exists=True, file_okay=False))
+@click.option("--interval", type=float, default=POLL_INTERVAL, help="Seconds between looks for new files.")
+@click.option("--once", is_flag=True, help="Look once, load anything new, and stop.")
+def do_watch(directory: str, interval: float, once: bool):
+    """
+    Watch a directory, loading new FIT files as they appear
+    """
+    watch_directory(directory=directory, interval=interval, once=once)
+
+
 def main():
     cli.add_command(fetch)
     cli.add_command(do_power_report)
     cli.add_command(do_hr_report)
     cli.add_command(do_detail_report)
     cli.add_command(do_detail_plot_report)
+    cli.add_command(do_top_report)
     cli.add_command(do_load)
+    cli.add_command(do_load_dir)
+    cli.add_command(do_reprocess)
+    cli.add_command(do_backfill)
+    cli.add_command(do_watch)
     cli(None)
 
 
@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT = 5.0  # Seconds to wait for a connection
+READ_TIMEOUT = 30.0  # Seconds to wait between bytes of a response
+POOL_SIZE = 16  # The most connections we keep open to any one host
+MAX_ATTEMPTS = 5  # The most times we'll try a request
+BACKOFF_BASE = 0.5  # Seconds we wait (at most) before the first retry; doubled for each one after
+BACKOFF_MAX = 15.0  # The longest we'll wait before any retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}  # Responses that are worth trying again
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Get the HTTP session every request goes through.
+
+    The session keeps connections alive between requests, so each download
+    after the first to a host skips the connection (and TLS) setup. It's safe
+    to share between the download threads.
+
+    Returns:
+        The session.
+    """
+
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """
+    Make a GET request, retrying if it fails in a way that might not last.
+
+    Args:
+        url:    The URL to get.
+        kwargs: Passed to requests.
+
+    Returns:
+        The response. This may be an error response, if retrying didn't help.
+    """
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """
+    Make a POST request, retrying if it fails in a way that might not last.
+
+    Only use this for requests that are safe to repeat.
+
+    Args:
+        url:    The URL to post to.
+        kwargs: Passed to requests.
+
+    Returns:
+        The response. This may be an error response, if retrying didn't help.
+    """
+    return request("POST", url, **kwargs)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Make a request, retrying if it fails in a way that might not last.
+
+    Connection errors, timeouts, and the responses in RETRY_STATUSES are retried
+    up to MAX_ATTEMPTS times in all. Between attempts we back off for a random
+    time up to an exponentially growing limit ("full jitter"), so a crowd of
+    clients that failed together don't all retry together. A Retry-After header
+    is honoured if it asks for longer.
+
+    Args:
+        method: The HTTP method.
+        url:    The URL.
+        kwargs: Passed to requests.
+
+    Returns:
+        The response. This may be an error response, if retrying didn't help.
+    """
+
+    # Every request gets a timeout, unless the caller chose one
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    session = get_session()
+
+    for attempt in range(MAX_ATTEMPTS):
+        last_attempt = attempt == MAX_ATTEMPTS - 1
+
+        # Make the request; give up on errors that aren't worth retrying
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if last_attempt:
+                raise
+            response = None
+
+        # Done, unless it's worth another try
+        if response is not None and (response.status_code not in RETRY_STATUSES or last_attempt):
+            return response
+
+        # Back off before trying again
+        time.sleep(_get_backoff(attempt=attempt, response=response))
+
+
+def _get_backoff(*, attempt: int, response: Optional[requests.Response]) -> float:
+    """
+    Work out how long to wait before retrying.
+
+    Args:
+        attempt:  The attempt that just failed, counting from zero.
+        response: The response to the attempt, if there was one.
+
+    Returns:
+        The number of seconds to wait.
+    """
+
+    # Full jitter: anywhere from nothing up to the exponential limit
+    backoff = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    # The server may know better
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        backoff = max(backoff, min(BACKOFF_MAX, float(retry_after)))
+
+    # Done
+    return backoff
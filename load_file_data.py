@@ -1,13 +1,23 @@
-from typing import List, Dict
-from datetime import datetime, timedelta
-from dataclasses import dataclass
+import time
+from typing import BinaryIO, List, Dict, Optional, Union
+from datetime import datetime
+from dataclasses import dataclass, replace
 
+import numpy as np
 from fitparse import FitFile
-from calculations import calculate_normalised_power, get_moving_average
 from activity import Activity
+from fit_decoder import FIT_EPOCH, FitDecodeError, RecordStreams, decode_records, to_datetime
+from resampling import resample
+from elevation import calculate_elevation_gain
+from metrics import calculate_metrics
+from peaks import PEAK_COLUMNS, Peak, get_peak_windows
 
 MAX_REASONABLE_POWER = 1500  # The maximum reasonable power reading we'll accept.
 
+# The places we can load FIT content from: a file path, the content itself, or
+# a readable file-like object.
+FitSource = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
 
 @dataclass
 class LoadedData:
@@ -17,59 +27,40 @@ class LoadedData:
 
     start_time: datetime  # The event start time
     end_time: datetime  # The event end time
-    power: List[int]  # The list of power values
-    hr: List[int]  # The list of HR values
+    power: np.ndarray  # The power values, one per second
+    hr: np.ndarray  # The HR values, one per second
     distance: float  # The total distance travelled
+    elevation: int  # The total elevation gain, in metres
     moving_time: int  # The number of moving seconds
+    streams: Dict[str, np.ndarray]  # The per-second channels we store (see stream_store)
 
 
-# This dictionary describes the time periods (in seconds) that we break power
-# averages into, along with the Peaks attribute that the data is stored in.
-POWER_AVERAGES = {
-    5: "peak_5sec_power",
-    30: "peak_30sec_power",
-    60: "peak_60sec_power",
-    300: "peak_5min_power",
-    600: "peak_10min_power",
-    1200: "peak_20min_power",
-    1800: "peak_30min_power",
-    3600: "peak_60min_power",
-    5400: "peak_90min_power",
-    7200: "peak_120min_power",
-}
-
-# This dictionary describes the time periods (in seconds) that we break HR
-# averages into, along with the Peaks attribute that the data is stored in.
-HR_AVERAGES = {
-    5: "peak_5sec_hr",
-    30: "peak_30sec_hr",
-    60: "peak_60sec_hr",
-    300: "peak_5min_hr",
-    600: "peak_10min_hr",
-    1200: "peak_20min_hr",
-    1800: "peak_30min_hr",
-    3600: "peak_60min_hr",
-    5400: "peak_90min_hr",
-    7200: "peak_120min_hr",
-}
-
-
-def load_file_data(*, path: str) -> Activity:
+def load_file_data(*, source: FitSource) -> Activity:
     """
-    Get the peak data from the nominated file.
+    Get the peak data from the nominated FIT content.
 
     Args:
-        path: The file to load.
+        source: The file to load. This can be a path, the FIT content itself
+                (e.g., a downloaded response body), or a file-like object.
 
     Returns:
         The peak data we loaded from the file.
     """
 
-    # Open the file.
-    fitfile = FitFile(path)
+    # Get hold of the content. Content we're handed directly is used in place.
+    started = time.perf_counter()
+    content = _read_source(source=source)
+
+    # Load the power and heart rate data. Our own decoder is much quicker than
+    # fitparse, but it only handles the common cases; fitparse does the rest.
+    try:
+        streams = decode_records(content)
+    except FitDecodeError:
+        streams = _read_records(fitfile=FitFile(content))
 
-    # Load the power and heart rate data.
-    loaded_data = _load_file_data(fitfile=fitfile)
+    # Lay the data out one entry per second.
+    loaded_data = _build_loaded_data(streams=streams)
+    decoded = time.perf_counter()
 
     # Setup the activity object
     activity = Activity()
@@ -77,112 +68,171 @@ def load_file_data(*, path: str) -> Activity:
     activity.end_time = loaded_data.end_time
     activity.moving_time = loaded_data.moving_time
     activity.activity_name = None
-    activity.elevation = None
+    activity.elevation = loaded_data.elevation
     activity.distance = loaded_data.distance
-    activity.avg_power = int(sum(loaded_data.power) / loaded_data.moving_time)
-    activity.max_power = max(loaded_data.power)
-    activity.normalised_power = calculate_normalised_power(power=loaded_data.power)
-    activity.avg_hr = int(sum(loaded_data.hr) / loaded_data.moving_time)
-    activity.max_hr = max(loaded_data.hr)
-    activity.raw_power = loaded_data.power
-    activity.raw_hr = loaded_data.hr
-    _load_peaks(source=loaded_data.power, attributes=POWER_AVERAGES, activity=activity)
-    _load_peaks(source=loaded_data.hr, attributes=HR_AVERAGES, activity=activity)
+    activity.streams = loaded_data.streams
+
+    # Work out its figures, all from one pass over each stream
+    metrics = calculate_metrics(power=loaded_data.power, hr=loaded_data.hr, moving_time=loaded_data.moving_time, windows=get_peak_windows(), curves=True)
+    activity.avg_power = metrics.avg_power
+    activity.max_power = metrics.max_power
+    activity.normalised_power = metrics.normalised_power
+    activity.avg_hr = metrics.avg_hr
+    activity.max_hr = metrics.max_hr
+    activity.peaks = metrics.peaks
+    activity.peaks_with_zeros = metrics.peaks_with_zeros
+    for metric, peaks in metrics.peaks.items():
+        _load_peaks(peaks=peaks, metric=metric, activity=activity)
+    activity.mean_max = metrics.mean_max
+    activity.load_seconds = {"decode": decoded - started, "peaks": time.perf_counter() - decoded}
 
     # Done.
     return activity
 
 
-def _load_peaks(source: List[int], attributes: Dict[int, str], activity: Activity):
+def _load_peaks(*, peaks: Dict[int, Optional[Peak]], metric: str, activity: Activity):
     """
-    Load a set of peak data from the nominated source data.
+    Load the values of the fixed peaks into their activity attributes.
 
-    The source data we're given is either the time-series collection of power figures,
-    or the time-series collection of HR figures.
-
-    The attributes we're provided tells us what time periods we need to average that
-    over. For example: given power data, and an attribute of (5, "peak_5sec_power")
-    means that we need to take a moving 5 second average of the source data, find the
-    maximum of those 5 second averages, and store that in the "peak_5sec_power" property
-    of the Peaks object.
+    The peaks are for every window we're configured for (see get_peak_windows),
+    and they all go into the activity's peaks. The fixed ones also go into
+    their own attributes: for example, the best 5 second average power is
+    stored in the "peak_5sec_power" property (see PEAK_COLUMNS).
 
     Args:
-        source:     The source data to load from.
-        attributes: The attributes we load.
-        activity:   The activity object we're populating.
+        peaks:    The peaks for one stream, keyed by window.
+        metric:   The stream they're for: "power" or "heart_rate".
+        activity: The activity object we're populating.
     """
-
-    for window, attr_name in attributes.items():
-        if moving_average := get_moving_average(source=source, window=window):
-            activity.__dict__[attr_name] = int(max(moving_average))
-        else:
-            activity.__dict__[attr_name] = None
+    for window, attr_name in PEAK_COLUMNS[metric].items():
+        activity.__dict__[attr_name] = peaks[window].value if peaks[window] else None
 
 
-def _load_file_data(*, fitfile: FitFile) -> LoadedData:
+def _read_source(*, source: FitSource) -> Union[bytes, bytearray, memoryview]:
     """
-    Load the data from the nominated file.
+    Get the content of a FIT source.
 
     Args:
-        fitfile: The file to load the data from.
+        source: A path, FIT content, or a file-like object.
 
     Returns:
-        The data we loaded.
+        The FIT content.
     """
 
-    # Initialise.
-    start_time = None
-    end_time = None
-    power = []
-    hr = []
-    distance = 0.0
-    moving_time = 0
-    last_power = 0
+    # Content we can use as is
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
 
-    # Iterate over the file.
-    for record in fitfile.get_messages("record"):
+    # A path
+    if isinstance(source, str):
+        with open(source, "rb") as fit_file:
+            return fit_file.read()
 
-        # Bump the moving time
-        moving_time += 1
+    # An in-memory buffer we can borrow, or any other file-like object
+    if hasattr(source, "getbuffer"):
+        return source.getbuffer()
+    return source.read()
 
-        # Go through all the data entries in this record.
-        for record_data in record:
 
-            # Start time?
-            if start_time is None and record_data.name == "timestamp":
-                start_time = record_data.value
+def _build_loaded_data(*, streams: RecordStreams) -> LoadedData:
+    """
+    Build our loaded data from record streams.
 
-            # End time? We need to deal carefully with this, because if we've
-            # got missing data (the next value isn't exactly one second later
-            # than the current value) we have to fill power and HR with
-            # zeroes.
-            if record_data.name == "timestamp":
+    Args:
+        streams: The record streams, from either decoder.
 
-                # Check that this data is one second later; if not, extrapolate
-                if end_time is not None and end_time + timedelta(seconds=1) < record_data.value:
-                    seconds_to_add = (record_data.value - end_time).seconds - 1
-                    zeroes = [0] * seconds_to_add
-                    power.extend(zeroes)
-                    hr.extend(zeroes)
+    Returns:
+        The data we loaded.
+    """
 
-                # Capture the end time
-                end_time = record_data.value
+    # Replace any unreasonable power reading with the last reasonable one
+    power = streams.power.astype(np.int64)
+    unreasonable = power > MAX_REASONABLE_POWER
+    if unreasonable.any():
+        last_reasonable = np.where(unreasonable, 0, np.arange(1, len(power) + 1))
+        np.maximum.accumulate(last_reasonable, out=last_reasonable)
+        power = np.concatenate(([0], power))[last_reasonable]
+
+    # Lay the records out one per second
+    aligned = resample(replace(streams, power=power))
+
+    # The distance only ever accumulates, so the total is the largest we saw
+    distance = float(np.nanmax(streams.distance)) if not np.isnan(streams.distance).all() else 0.0
+
+    # Gather the channels we store
+    streams = {
+        "power": aligned.power,
+        "heart_rate": aligned.heart_rate,
+        "cadence": aligned.cadence,
+        "speed": aligned.speed,
+        "distance": aligned.distance,
+    }
+    if aligned.altitude is not None:
+        streams["altitude"] = aligned.altitude
 
-            # Fetch power.
-            if record_data.name == "power":
-                this_power = int(record_data.value)
-                if this_power > MAX_REASONABLE_POWER:
-                    this_power = last_power
-                power.append(this_power)
-                last_power = this_power
+    # Done.
+    return LoadedData(
+        start_time=to_datetime(aligned.start),
+        end_time=to_datetime(aligned.end),
+        power=aligned.power,
+        hr=aligned.heart_rate,
+        distance=distance,
+        elevation=calculate_elevation_gain(altitude=aligned.altitude) if aligned.altitude is not None else 0,
+        moving_time=int(aligned.moving.sum()),
+        streams=streams,
+    )
+
+
+def _read_records(*, fitfile: FitFile) -> RecordStreams:
+    """
+    Read the record data from the nominated file using fitparse.
 
-            # Fetch HR.
-            if record_data.name == "heart_rate":
-                hr.append(int(record_data.value))
+    Args:
+        fitfile: The file to load the data from.
 
-            # Fetch distance.
-            if record_data.name == "distance" and record_data.value:
-                distance = float(record_data.value)
+    Returns:
+        The record streams, in file order.
+    """
+
+    # Initialise.
+    timestamp = []
+    power = []
+    hr = []
+    distance = []
+    altitude = []
+    cadence = []
+    speed = []
+
+    # Iterate over the file, skipping any record we can't place in time.
+    for record in fitfile.get_messages("record"):
+        values = record.get_values()
+        if values.get("timestamp") is None:
+            continue
+        timestamp.append(int((values["timestamp"] - FIT_EPOCH).total_seconds()))
+        power.append(values.get("power") or 0)
+        hr.append(values.get("heart_rate") or 0)
+        distance.append(values["distance"] if values.get("distance") is not None else np.nan)
+        record_altitude = values.get("enhanced_altitude")
+        if record_altitude is None:
+            record_altitude = values.get("altitude")
+        altitude.append(record_altitude if record_altitude is not None else np.nan)
+        cadence.append(values.get("cadence") or 0)
+        record_speed = values.get("enhanced_speed")
+        if record_speed is None:
+            record_speed = values.get("speed")
+        speed.append(record_speed if record_speed is not None else np.nan)
+
+    # We need records to do anything useful
+    if not timestamp:
+        raise ValueError("No records found in FIT file")
 
     # Done.
-    return LoadedData(start_time=start_time, end_time=end_time, power=power, hr=hr, distance=distance, moving_time=moving_time)
+    return RecordStreams(
+        timestamp=np.array(timestamp, dtype=np.uint32),
+        power=np.array(power, dtype=np.uint16),
+        heart_rate=np.array(hr, dtype=np.uint8),
+        distance=np.array(distance, dtype=np.float64),
+        altitude=np.array(altitude, dtype=np.float64),
+        cadence=np.array(cadence, dtype=np.uint8),
+        speed=np.array(speed, dtype=np.float64),
+    )
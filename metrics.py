@@ -0,0 +1,159 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from calculation_data import AerobicDecoupling
+from peaks import MeanMaxCurve, Peak, StreamSums, find_mean_max, find_peaks, sum_stream
+
+NORMALISED_POWER_WINDOW = 30  # The rolling average normalised power is built from, in seconds
+
+
+@dataclass
+class ActivityMetrics:
+    """
+    The figures we work out from an activity's power and HR streams.
+    """
+
+    avg_power: int  # Average power over the moving time, in watts
+    max_power: int  # Maximum power, in watts
+    normalised_power: int  # Normalised power, in watts (see calculate_normalised_power)
+    avg_hr: int  # Average HR over the moving time, in bpm
+    max_hr: int  # Maximum HR, in bpm
+    work: int  # The work done, in kJ
+    power_histogram: np.ndarray  # The number of seconds at each wattage, indexed by watts
+    hr_histogram: np.ndarray  # The number of seconds at each HR, indexed by bpm
+    aerobic_decoupling: Optional[AerobicDecoupling]  # How far power:HR drifted from the first half to the second
+    peaks: Dict[str, Dict[int, Optional[Peak]]]  # The peaks for each window asked for, keyed by stream, with zeros dropped
+    peaks_with_zeros: Dict[str, Dict[int, Optional[Peak]]]  # The same peaks, with zeros included
+    mean_max: Dict[str, MeanMaxCurve]  # The mean-maximal curves, keyed by stream, if they were asked for
+
+
+def calculate_metrics(*, power: np.ndarray, hr: np.ndarray, moving_time: int, windows: Iterable[int] = (), curves: bool = False) -> ActivityMetrics:
+    """
+    Work out an activity's figures from its power and HR streams.
+
+    Each stream is summed once (see peaks.sum_stream), and everything else
+    comes from those sums: the averages and the work from their totals, the
+    rolling averages behind normalised power from the differences of entries
+    NORMALISED_POWER_WINDOW apart, the two halves of the ride for aerobic
+    decoupling from where the half way point falls in them, and the peaks (both
+    with zeros dropped and with them included) and curves as find_peaks and
+    find_mean_max work them out. The zone histograms are counts of each
+    reading.
+
+    The figures match what calculate_normalised_power, calculate_peaks and
+    calculate_mean_max give for the same streams.
+
+    The streams should be the same length. Some older activities have less HR
+    than power, or the other way round; the shorter stream is padded with
+    zeros, as a dropout would be recorded.
+
+    Args:
+        power:       The power stream, one reading per second.
+        hr:          The HR stream, aligned with the power.
+        moving_time: The number of moving seconds, which the averages are over.
+        windows:     The windows to find peaks for, in seconds.
+        curves:      Whether to calculate the mean-maximal curves.
+
+    Returns:
+        The figures.
+    """
+
+    # Line the streams up
+    if len(power) != len(hr):
+        length = max(len(power), len(hr))
+        power = np.pad(np.asarray(power, dtype=np.int64), (0, length - len(power)))
+        hr = np.pad(np.asarray(hr, dtype=np.int64), (0, length - len(hr)))
+
+    # Sum each stream
+    power_sums = sum_stream(power)
+    hr_sums = sum_stream(hr)
+    power_total = int(power_sums.cumulative[-1])
+    hr_total = int(hr_sums.cumulative[-1])
+
+    # Take the rolling averages normalised power is built from. Each comes from
+    # NORMALISED_POWER_WINDOW non-zero readings, as get_moving_average has it.
+    window = NORMALISED_POWER_WINDOW
+    rolling = (power_sums.cumulative[window:] - power_sums.cumulative[:-window]) // window
+
+    # Done
+    windows = list(windows)
+    return ActivityMetrics(
+        avg_power=int(power_total / moving_time) if moving_time else 0,
+        max_power=int(np.max(power, initial=0)),
+        normalised_power=_normalise(rolling),
+        avg_hr=int(hr_total / moving_time) if moving_time else 0,
+        max_hr=int(np.max(hr, initial=0)),
+        work=power_total // 1000,
+        power_histogram=np.bincount(np.asarray(power, dtype=np.int64)),
+        hr_histogram=np.bincount(np.asarray(hr, dtype=np.int64)),
+        aerobic_decoupling=_calculate_aerobic_decoupling(length=len(power), power_sums=power_sums, rolling=rolling, hr_sums=hr_sums),
+        peaks={"power": find_peaks(power_sums, windows=windows), "heart_rate": find_peaks(hr_sums, windows=windows)},
+        peaks_with_zeros={
+            "power": find_peaks(power_sums, windows=windows, with_zeros=True),
+            "heart_rate": find_peaks(hr_sums, windows=windows, with_zeros=True),
+        },
+        mean_max={"power": find_mean_max(power_sums), "heart_rate": find_mean_max(hr_sums)} if curves else {},
+    )
+
+
+def _normalise(rolling: np.ndarray) -> int:
+    """
+    Take the normalised power from its rolling averages: the fourth root of the
+    average of their fourth powers.
+
+    The fourth powers are summed exactly, as integers, so we get just what
+    calculate_normalised_power gets.
+
+    Args:
+        rolling: The rolling averages.
+
+    Returns:
+        The normalised power, or 0 if there are no rolling averages.
+    """
+    if not len(rolling):
+        return 0
+    return int(pow(int((rolling**4).sum()) / len(rolling), 0.25))
+
+
+def _calculate_aerobic_decoupling(*, length: int, power_sums: StreamSums, rolling: np.ndarray, hr_sums: StreamSums) -> Optional[AerobicDecoupling]:
+    """
+    Calculate the aerobic decoupling of an activity: how much its ratio of
+    normalised power to average HR fell from the first half to the second.
+
+    Each half's normalised power only takes the rolling averages that lie
+    wholly within it, and its average HR counts every second of it, zeros
+    included.
+
+    Args:
+        length:     The length of the streams.
+        power_sums: The power stream's sums.
+        rolling:    The rolling averages for normalised power.
+        hr_sums:    The HR stream's sums.
+
+    Returns:
+        The aerobic decoupling, or None if we don't have enough data.
+    """
+
+    # Find the half way point, and where it falls in the power's sums
+    half_way_point = length // 2
+    if not half_way_point:
+        return None
+    power_split = int(np.searchsorted(power_sums.positions, half_way_point))
+
+    # Work out each half's normalised power and average HR
+    first_half_power = _normalise(rolling[: max(power_split - NORMALISED_POWER_WINDOW + 1, 0)])
+    second_half_power = _normalise(rolling[power_split:])
+    first_half_hr = int(hr_sums.cumulative_with_zeros[half_way_point]) / half_way_point
+    second_half_hr = int(hr_sums.cumulative_with_zeros[-1] - hr_sums.cumulative_with_zeros[half_way_point]) / (length - half_way_point)
+    if not first_half_hr or not second_half_hr or not first_half_power:
+        return None
+
+    # Calculate the decoupling of the two
+    first_half_ratio = first_half_power / first_half_hr
+    second_half_ratio = second_half_power / second_half_hr
+    coupling = ((first_half_ratio - second_half_ratio) / first_half_ratio) * 100
+
+    # Done
+    return AerobicDecoupling(coupling=coupling, first_half_ratio=first_half_ratio, second_half_ratio=second_half_ratio)
@@ -0,0 +1,457 @@
+import configparser
+import functools
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MEAN_MAX_DENSE_SECONDS = 600  # Mean-maximal curves keep every duration up to this many seconds
+MEAN_MAX_STEP = 1.02  # Beyond that, each duration they keep is this much longer than the last
+MEAN_MAX_DURATION_DTYPE = "<u4"  # How a curve's durations are stored
+MEAN_MAX_VALUE_DTYPE = "<u2"  # How a curve's values are stored
+CONFIG_FILE = str(Path.home()) + "/.fit-peaks.rc"  # Where extra peak windows are configured
+
+# The peaks every activity has, by stream and window (in seconds), along with
+# the activity attribute (and column) each is kept in. Other windows can be
+# configured (see get_peak_windows); those are only kept in the peak table.
+PEAK_COLUMNS = {
+    "power": {
+        5: "peak_5sec_power",
+        30: "peak_30sec_power",
+        60: "peak_60sec_power",
+        300: "peak_5min_power",
+        600: "peak_10min_power",
+        1200: "peak_20min_power",
+        1800: "peak_30min_power",
+        3600: "peak_60min_power",
+        5400: "peak_90min_power",
+        7200: "peak_120min_power",
+    },
+    "heart_rate": {
+        5: "peak_5sec_hr",
+        30: "peak_30sec_hr",
+        60: "peak_60sec_hr",
+        300: "peak_5min_hr",
+        600: "peak_10min_hr",
+        1200: "peak_20min_hr",
+        1800: "peak_30min_hr",
+        3600: "peak_60min_hr",
+        5400: "peak_90min_hr",
+        7200: "peak_120min_hr",
+    },
+}
+PEAK_WINDOWS = list(PEAK_COLUMNS["power"])  # The fixed peaks' windows, in seconds, which curves always keep
+
+ENVELOPE_SECONDS = 12 * 3600  # The longest duration the power-duration envelope covers
+ENVELOPE_RANKS = 3  # How many of the best values the envelope keeps for each duration
+ENVELOPE_PERIODS = {"all": None, "365d": 365, "90d": 90, "42d": 42}  # The envelope's periods, and how many days each goes back
+
+DURATION_PATTERN = re.compile(r"(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?")  # e.g. "1h30m", "8m", "45s", "90"
+
+
+@functools.lru_cache(maxsize=None)
+def get_peak_windows() -> Tuple[int, ...]:
+    """
+    Get the windows we find peaks for: the fixed ones, and any others listed
+    in the config file, e.g.
+
+        [peaks]
+        windows = 3m, 4h
+
+    Activities loaded before a window was added get its peaks from the
+    backfill command.
+
+    Returns:
+        The windows, in seconds, ascending.
+    """
+
+    # Read the extra windows, if there are any
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    extra = config.get("peaks", "windows", fallback="")
+    try:
+        windows = {parse_duration(text) for text in extra.split(",") if text.strip()}
+    except ValueError as e:
+        print(f"Ignoring the peak windows in {CONFIG_FILE}: {e}")
+        windows = set()
+
+    # Done
+    return tuple(sorted(windows.union(PEAK_WINDOWS) - {0}))
+
+
+class Peak(NamedTuple):
+    """
+    The best average of a stream over a window, and where in the stream it was.
+    """
+
+    value: int  # The best average
+    start: int  # The second it started, counting from the start of the stream
+    end: int  # The second after it ended; with zeros dropped, this can be more than the window after the start
+
+
+class StreamSums(NamedTuple):
+    """
+    The cumulative sums of a stream, from which the sum of any window of it is
+    the difference of two entries: one sum with its zeros dropped, and one
+    with them included.
+    """
+
+    positions: np.ndarray  # Where each non-zero reading was, counting from the start of the stream
+    cumulative: np.ndarray  # The cumulative sum of the non-zero readings, with a zero in front
+    cumulative_with_zeros: np.ndarray  # The cumulative sum of every reading, with a zero in front
+
+
+def sum_stream(source: np.ndarray) -> StreamSums:
+    """
+    Take the cumulative sums of a stream.
+
+    The stream is only summed once. Dropping a zero doesn't change the sum, so
+    the sum with the zeros dropped is the sum with them included, taken at
+    each non-zero reading.
+
+    Args:
+        source: The stream, one reading per second.
+
+    Returns:
+        The stream's sums. cumulative[j] - cumulative[i] is the sum of the
+        non-zero readings i to j - 1, and cumulative_with_zeros[j] -
+        cumulative_with_zeros[i] is the sum of the readings i to j - 1.
+    """
+    values = np.asarray(source, dtype=np.int64)
+    cumulative_with_zeros = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(values, out=cumulative_with_zeros[1:])
+    positions = np.flatnonzero(values)
+    cumulative = np.concatenate(([0], cumulative_with_zeros[positions + 1]))
+    return StreamSums(positions=positions, cumulative=cumulative, cumulative_with_zeros=cumulative_with_zeros)
+
+
+def calculate_peaks(*, source: np.ndarray, windows: Iterable[int], with_zeros: bool = False) -> Dict[int, Optional[Peak]]:
+    """
+    Find the best average of a stream over each of a set of windows, and where
+    in the stream each was.
+
+    By default, zero readings are dropped before averaging, as
+    get_moving_average does, so a window covers that many non-zero readings;
+    when coasting, that's longer than the window. With zeros included, a
+    window is that many seconds of the stream, as most other tools have it.
+    Either way, the average is truncated to an integer, again as
+    get_moving_average does.
+
+    Args:
+        source:     The stream, one reading per second.
+        windows:    The window lengths, in seconds.
+        with_zeros: Whether to include the zero readings.
+
+    Returns:
+        The best average for each window, or None if the stream (without its
+        zeros, unless they're included) is shorter than the window. If the best
+        average occurs more than once, we take the first.
+    """
+    return find_peaks(sum_stream(source), windows=windows, with_zeros=with_zeros)
+
+
+def find_peaks(sums: StreamSums, *, windows: Iterable[int], with_zeros: bool = False) -> Dict[int, Optional[Peak]]:
+    """
+    Find the best average of a stream over each of a set of windows from its
+    sums (see calculate_peaks).
+
+    Rather than walking the stream once per window, we use its cumulative sum:
+    the sums of every window of a given length come from a single array
+    subtraction, and the best of them from a single argmax, which gives us
+    where it was as well.
+
+    Args:
+        sums:       The stream's sums (see sum_stream).
+        windows:    The window lengths, in seconds.
+        with_zeros: Whether to include the zero readings.
+
+    Returns:
+        The best average for each window, as calculate_peaks returns them.
+    """
+    cumulative = sums.cumulative_with_zeros if with_zeros else sums.cumulative
+    peaks = {}
+    for window in windows:
+        if len(cumulative) <= window:
+            peaks[window] = None
+        else:
+            window_sums = cumulative[window:] - cumulative[:-window]
+            best = int(window_sums.argmax())
+            if with_zeros:
+                peaks[window] = Peak(value=int(window_sums[best] // window), start=best, end=best + window)
+            else:
+                peaks[window] = Peak(value=int(window_sums[best] // window), start=int(sums.positions[best]), end=int(sums.positions[best + window - 1]) + 1)
+
+    # Done
+    return peaks
+
+
+class MeanMaxCurve(NamedTuple):
+    """
+    The best average of a stream for every duration from one second up to the
+    length of the stream. Short durations are kept for every second; beyond
+    MEAN_MAX_DENSE_SECONDS they're sampled every MEAN_MAX_STEP, along with the
+    PEAK_WINDOWS (see get_mean_max_durations), and the durations in between
+    are interpolated.
+    """
+
+    durations: np.ndarray  # The durations we have, in seconds, ascending
+    values: np.ndarray  # The best average for each
+
+
+def get_mean_max_durations(length: int) -> np.ndarray:
+    """
+    Get the durations we keep in a mean-maximal curve.
+
+    Args:
+        length: The number of readings in the stream.
+
+    Returns:
+        The durations, in seconds, ascending. The last is the length itself.
+    """
+    dense = np.arange(1, min(length, MEAN_MAX_DENSE_SECONDS) + 1)
+    if length <= MEAN_MAX_DENSE_SECONDS:
+        return dense
+    steps = int(np.log(length / MEAN_MAX_DENSE_SECONDS) / np.log(MEAN_MAX_STEP))
+    sparse = (MEAN_MAX_DENSE_SECONDS * MEAN_MAX_STEP ** np.arange(1, steps + 1)).astype(np.int64)
+    windows = [window for window in PEAK_WINDOWS if window <= length]
+    return np.unique(np.concatenate((dense, sparse, windows, [length])))
+
+
+def calculate_mean_max(*, source: np.ndarray) -> MeanMaxCurve:
+    """
+    Calculate the mean-maximal curve of a stream.
+
+    The readings are treated as calculate_peaks treats them: zeros are dropped,
+    and the averages are truncated.
+
+    Args:
+        source: The stream, one reading per second.
+
+    Returns:
+        The curve.
+    """
+    return find_mean_max(sum_stream(source))
+
+
+def find_mean_max(sums: StreamSums) -> MeanMaxCurve:
+    """
+    Calculate the mean-maximal curve of a stream from its sums.
+
+    Args:
+        sums: The stream's sums (see sum_stream).
+
+    Returns:
+        The curve.
+    """
+    cumulative = sums.cumulative
+    durations = get_mean_max_durations(len(cumulative) - 1)
+    best = np.empty(len(durations), dtype=np.int64)
+    for i, duration in enumerate(durations):
+        best[i] = (cumulative[duration:] - cumulative[:-duration]).max() // duration
+
+    # Done
+    return MeanMaxCurve(durations=durations, values=best)
+
+
+def get_mean_max(curve: MeanMaxCurve, duration: int) -> Optional[int]:
+    """
+    Get the best average for a duration from a mean-maximal curve.
+
+    Args:
+        curve:    The curve.
+        duration: The duration, in seconds.
+
+    Returns:
+        The best average, or None if the stream was shorter than the duration.
+    """
+    if duration < 1:
+        return None
+    values = get_mean_max_values(curve, np.array([duration]))
+    return int(values[0]) if len(values) else None
+
+
+def get_mean_max_values(curve: MeanMaxCurve, durations: np.ndarray) -> np.ndarray:
+    """
+    Get the best averages for a set of durations from a mean-maximal curve.
+
+    Durations we didn't keep are interpolated (on a log scale) between the
+    nearest durations we did. They're no more than MEAN_MAX_STEP apart, and the
+    curve changes slowly at those lengths, so the error is small.
+
+    Args:
+        curve:     The curve.
+        durations: The durations, in seconds, ascending, and at least one.
+
+    Returns:
+        The best average for each duration up to the length of the stream; the
+        durations beyond that are left off.
+    """
+
+    # Drop the durations the stream was too short for
+    if not len(curve.durations):
+        return np.empty(0, dtype=np.int64)
+    durations = np.asarray(durations)
+    durations = durations[durations <= curve.durations[-1]]
+
+    # Find the durations we kept, and the neighbours of those we didn't
+    index = np.searchsorted(curve.durations, durations)
+    exact = curve.durations[index] == durations
+    shorter = np.maximum(index - 1, 0)
+
+    # Interpolate between the neighbours where we need to
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.log(durations / curve.durations[shorter]) / np.log(curve.durations[index] / curve.durations[shorter])
+    interpolated = curve.values[shorter] + fraction * (curve.values[index] - curve.values[shorter])
+    return np.where(exact, curve.values[index], np.nan_to_num(interpolated)).astype(np.int64)
+
+
+def encode_mean_max(curve: MeanMaxCurve) -> Tuple[bytes, bytes]:
+    """
+    Encode a mean-maximal curve for storage.
+
+    Args:
+        curve: The curve.
+
+    Returns:
+        The durations and the values, each packed as its stored type.
+    """
+    return curve.durations.astype(MEAN_MAX_DURATION_DTYPE).tobytes(), curve.values.astype(MEAN_MAX_VALUE_DTYPE).tobytes()
+
+
+def decode_mean_max(*, durations: bytes, values: bytes) -> MeanMaxCurve:
+    """
+    Decode a stored mean-maximal curve.
+
+    Args:
+        durations: The stored durations.
+        values:    The stored values.
+
+    Returns:
+        The curve.
+    """
+    return MeanMaxCurve(
+        durations=np.frombuffer(durations, dtype=MEAN_MAX_DURATION_DTYPE).astype(np.int64),
+        values=np.frombuffer(values, dtype=MEAN_MAX_VALUE_DTYPE).astype(np.int64),
+    )
+
+
+class EnvelopeEntry(NamedTuple):
+    """
+    One of the best values for a duration in the power-duration envelope.
+    """
+
+    power: int  # The best average power, in watts
+    zwift_id: str  # The activity it came from
+    start_time: str  # When the activity started, as it's stored
+
+
+# The power-duration envelope for a period: the best values for each duration,
+# best first. Values are distinct; if two activities tie, the older keeps it.
+PowerEnvelope = Dict[int, List[EnvelopeEntry]]
+
+ENVELOPE_DURATIONS = get_mean_max_durations(ENVELOPE_SECONDS)  # The durations the envelope covers
+
+
+def get_envelope_start(period: str) -> str:
+    """
+    Get the earliest start time of the activities in one of the envelope's
+    periods, in the form start times are stored.
+
+    Args:
+        period: The period (see ENVELOPE_PERIODS).
+
+    Returns:
+        The earliest start time, as a string that sorts against stored start
+        times; an empty string if the period goes back forever.
+    """
+    days = ENVELOPE_PERIODS[period]
+    return (datetime.now() - timedelta(days=days)).date().isoformat() if days else ""
+
+
+def merge_envelope(envelope: PowerEnvelope, *, zwift_id: str, start_time: str, curve: MeanMaxCurve) -> Optional[PowerEnvelope]:
+    """
+    Work out how an activity's power curve changes the envelope.
+
+    Args:
+        envelope:   The envelope, which isn't changed.
+        zwift_id:   The activity.
+        start_time: When it started, as it's stored.
+        curve:      Its mean-maximal power curve.
+
+    Returns:
+        The new entries for each duration that changed, or None if the
+        activity is already in the envelope with different values (because it
+        was loaded again), in which case the envelope has to be rebuilt.
+    """
+
+    changes = {}
+    for duration, power in zip(ENVELOPE_DURATIONS.tolist(), get_mean_max_values(curve, ENVELOPE_DURATIONS).tolist()):
+        entries = envelope.get(duration, [])
+
+        # Most of the time it's not even close
+        if len(entries) == ENVELOPE_RANKS and power < entries[-1].power and all(entry.zwift_id != zwift_id for entry in entries):
+            continue
+
+        # Already in it? It'd better not have changed
+        if held := [entry for entry in entries if entry.zwift_id == zwift_id]:
+            if held[0].power != power:
+                return None
+            continue
+
+        # Otherwise it's in if it's a new value that beats one we have, or
+        # ties with one from a later activity
+        if power <= 0:
+            continue
+        entry = EnvelopeEntry(power=power, zwift_id=zwift_id, start_time=start_time)
+        if tied := [held for held in entries if held.power == power]:
+            if tied[0].start_time <= start_time:
+                continue
+            merged = [entry if held is tied[0] else held for held in entries]
+        else:
+            merged = sorted(entries + [entry], key=lambda held: held.power, reverse=True)[:ENVELOPE_RANKS]
+        if merged != entries:
+            changes[duration] = merged
+
+    # Done
+    return changes
+
+
+def parse_duration(text: str) -> int:
+    """
+    Parse a duration such as "90", "45s", "8m", or "1h30m".
+
+    Args:
+        text: The duration.
+
+    Returns:
+        The duration, in seconds.
+
+    Raises:
+        ValueError: If the text isn't a duration.
+    """
+    match = DURATION_PATTERN.fullmatch(text.strip().lower())
+    if not match or not any(match.groups()):
+        raise ValueError(f"{text!r} isn't a duration")
+    hours, minutes, seconds = (int(group) if group else 0 for group in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def format_duration(seconds: int) -> str:
+    """
+    Format a duration the way parse_duration reads it.
+
+    Args:
+        seconds: The duration, in seconds.
+
+    Returns:
+        The formatted duration, e.g. "8 min" or "1h30m".
+    """
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if not hours and not minutes:
+        return f"{seconds} sec"
+    if not hours and not seconds:
+        return f"{minutes} min"
+    return (f"{hours}h" if hours else "") + (f"{minutes}m" if minutes else "") + (f"{seconds}s" if seconds else "")
@@ -1,12 +1,36 @@
+import functools
 import sqlite3
 import os.path
 from enum import Enum, auto
 from pathlib import Path
 from datetime import datetime, date
 from dateutil import tz
-from typing import Optional, List, Tuple, Set
+from typing import Any, Dict, Optional, List, Tuple, Set
+
+import numpy as np
 
 from activity import Activity
+from stream_store import CHANNELS, decode_channel, encode_channel
+from peaks import (
+    ENVELOPE_DURATIONS,
+    ENVELOPE_PERIODS,
+    ENVELOPE_RANKS,
+    PEAK_COLUMNS,
+    EnvelopeEntry,
+    MeanMaxCurve,
+    Peak,
+    PowerEnvelope,
+    calculate_mean_max,
+    calculate_peaks,
+    decode_mean_max,
+    encode_mean_max,
+    find_peaks,
+    get_envelope_start,
+    get_mean_max_values,
+    get_peak_windows,
+    merge_envelope,
+    sum_stream,
+)
 
 DATABASE_NAME = str(Path.home()) + "/.fitpeaks-activity.dat"
 
@@ -58,11 +82,152 @@ CREATE_TABLE = """
             )
             """
 
+CREATE_FIT_FILE_TABLE = """
+            create table if not exists fit_file
+            (
+                zwift_id            varchar         primary key,
+                content_hash        varchar         not null
+            )
+            """
+
+CREATE_FIT_FINGERPRINT_TABLE = """
+            create table if not exists fit_fingerprint
+            (
+                fingerprint         varchar         primary key,
+                zwift_id            varchar         not null
+            )
+            """
+
+CREATE_STREAM_TABLE = """
+            create table if not exists activity_stream
+            (
+                zwift_id            varchar         not null,
+                channel             varchar         not null,
+                dtype               varchar         not null,
+                data                blob            not null,
+                primary key (zwift_id, channel)
+            )
+            """
+
+CREATE_MEAN_MAX_TABLE = """
+            create table if not exists mean_max
+            (
+                zwift_id            varchar         not null,
+                channel             varchar         not null,
+                durations           blob            not null,
+                best                blob            not null,
+                primary key (zwift_id, channel)
+            )
+            """
+
+CREATE_PEAK_TABLE = """
+            create table if not exists peak
+            (
+                zwift_id            varchar         not null,
+                metric              varchar         not null,
+                window_seconds      int             not null,
+                value               int             null,
+                start_offset        int             null,
+                end_offset          int             null,
+                value_with_zeros    int             null,
+                start_offset_with_zeros int         null,
+                end_offset_with_zeros   int         null,
+                with_zeros_known    int             not null default 0,
+                primary key (zwift_id, metric, window_seconds)
+            ) without rowid
+            """
+
+CREATE_PEAK_INDEX = "create index if not exists peak_by_value on peak (metric, window_seconds, value desc)"
+
+CREATE_PEAK_WITH_ZEROS_INDEX = "create index if not exists peak_with_zeros_by_value on peak (metric, window_seconds, value_with_zeros desc)"
+
+# Columns added to tables since they were first created, by table.
+ADDED_COLUMNS = {
+    "peak": {
+        "start_offset": "int null",
+        "end_offset": "int null",
+        "value_with_zeros": "int null",
+        "start_offset_with_zeros": "int null",
+        "end_offset_with_zeros": "int null",
+        "with_zeros_known": "int not null default 0",
+    },
+    "fetch_queue": {
+        "attempts": "int not null default 0",
+    },
+}
+
+CREATE_POWER_ENVELOPE_TABLE = """
+            create table if not exists power_envelope
+            (
+                period              varchar         not null,
+                duration            int             not null,
+                rank                int             not null,
+                power               int             not null,
+                zwift_id            varchar         not null,
+                primary key (period, duration, rank)
+            ) without rowid
+            """
+
+CREATE_POWER_ENVELOPE_STATE_TABLE = """
+            create table if not exists power_envelope_state
+            (
+                period              varchar         primary key,
+                built               varchar         not null
+            )
+            """
+
+CREATE_WATCH_INDEX_TABLE = """
+            create table if not exists watch_index
+            (
+                path                varchar         primary key,
+                mtime               real            not null,
+                size                int             not null
+            )
+            """
+
+CREATE_FETCH_CURSOR_TABLE = """
+            create table if not exists fetch_cursor
+            (
+                id                  int             primary key check (id = 1),
+                zwift_id            varchar         not null,
+                start_date          varchar         null
+            )
+            """
+
+CREATE_FETCH_QUEUE_TABLE = """
+            create table if not exists fetch_queue
+            (
+                zwift_id            varchar         primary key,
+                listing             varchar         not null,
+                state               varchar         not null,
+                content_hash        varchar         null
+            )
+            """
+
+CREATE_FETCH_METRICS_TABLE = """
+            create table if not exists fetch_metrics
+            (
+                started             varchar         primary key,
+                total_seconds       real            not null,
+                activities          int             not null,
+                loaded              int             not null,
+                failed              int             not null,
+                downloaded          int             not null,
+                bytes_downloaded    int             not null,
+                listing_seconds     real            not null,
+                login_seconds       real            not null,
+                download_seconds    real            not null,
+                decode_seconds      real            not null,
+                peaks_seconds       real            not null,
+                store_seconds       real            not null
+            )
+            """
+
 SELECT = """
     select rowid, 
         zwift_id, s3_url,
         start_time, end_time, moving_time, distance, elevation, activity_name,
-        avg_power, max_power, normalised_power, avg_hr, max_hr, raw_power, raw_hr,
+        avg_power, max_power, normalised_power, avg_hr, max_hr,
         peak_5sec_power,  peak_30sec_power, peak_60sec_power, peak_5min_power,  peak_10min_power,
         peak_20min_power, peak_30min_power, peak_60min_power, peak_90min_power, peak_120min_power, 
         peak_5sec_hr,     peak_30sec_hr,    peak_60sec_hr,    peak_5min_hr,     peak_10min_hr,
@@ -72,6 +237,10 @@ SELECT = """
 
 SELECT_ACTIVITY = SELECT + " where rowid = :rowid and peak_5min_power is not null "
 
+SELECT_BY_ZWIFT_ID = SELECT + " where zwift_id = :zwift_id"
+
+SELECT_FROM_START_TIME = SELECT + " where start_time >= :start_date order by start_time"
+
 
 class SelectIndices(Enum):
     RowId = 0
@@ -88,8 +257,6 @@ class SelectIndices(Enum):
     NormalisedPower = auto()
     AvgHr = auto()
     MaxHr = auto()
-    RawPower = auto()
-    RawHr = auto()
     Peak5SecPower = auto()
     Peak30SecPower = auto()
     Peak60SecPower = auto()
@@ -114,6 +281,165 @@ class SelectIndices(Enum):
 
 SELECT_ID_LIST = "select zwift_id from activity"
 
+SELECT_EXISTING_IDS = "select zwift_id from activity where zwift_id in ({ids})"
+
+SELECT_FETCH_CURSOR = "select zwift_id, start_date from fetch_cursor"
+
+INSERT_FETCH_CURSOR_SQL = """
+    insert into fetch_cursor (id, zwift_id, start_date) values (1, :zwift_id, :start_date)
+    on conflict(id) do update set zwift_id = :zwift_id, start_date = :start_date
+"""
+
+INSERT_FETCH_QUEUE_SQL = """
+    insert into fetch_queue (zwift_id, listing, state) values (:zwift_id, :listing, 'listed')
+    on conflict(zwift_id) do nothing
+"""
+
+SELECT_FETCH_QUEUE = "select listing, state, content_hash from fetch_queue where state not in ('stored', 'failed') order by rowid"
+
+UPDATE_FETCH_QUEUE_SQL = """
+    update fetch_queue set state = :state, content_hash = :content_hash where zwift_id = :zwift_id
+"""
+
+FAIL_FETCH_QUEUE_SQL = """
+    update fetch_queue
+    set attempts = attempts + 1, content_hash = null, state = case when attempts + 1 >= :max_attempts then 'failed' else 'listed' end
+    where zwift_id = :zwift_id
+"""
+
+SELECT_FETCH_ATTEMPTS = "select attempts from fetch_queue where zwift_id = :zwift_id"
+
+DELETE_STORED_FETCH_QUEUE_SQL = "delete from fetch_queue where state = 'stored'"
+
+INSERT_FETCH_METRICS_SQL = """
+    insert or replace into fetch_metrics
+    (
+        started, total_seconds, activities, loaded, failed, downloaded, bytes_downloaded,
+        listing_seconds, login_seconds, download_seconds, decode_seconds, peaks_seconds, store_seconds
+    )
+    values
+    (
+        :started, :total_seconds, :activities, :loaded, :failed, :downloaded, :bytes_downloaded,
+        :listing_seconds, :login_seconds, :download_seconds, :decode_seconds, :peaks_seconds, :store_seconds
+    )
+"""
+
+SELECT_ARCHIVED = """
+    select activity.zwift_id, activity.s3_url, activity.activity_name, activity.elevation, fit_file.content_hash
+    from activity join fit_file on fit_file.zwift_id = activity.zwift_id
+    order by activity.rowid
+"""
+
+INSERT_FIT_FILE_SQL = """
+    insert into fit_file (zwift_id, content_hash) values (:zwift_id, :content_hash)
+    on conflict(zwift_id) do update set content_hash = :content_hash
+"""
+
+SELECT_FINGERPRINTS = "select fingerprint, zwift_id from fit_fingerprint"
+
+INSERT_FIT_FINGERPRINT_SQL = """
+    insert into fit_fingerprint (fingerprint, zwift_id) values (:fingerprint, :zwift_id)
+    on conflict(fingerprint) do update set zwift_id = :zwift_id
+"""
+
+SELECT_STREAMS = "select channel, dtype, data from activity_stream where zwift_id = ? and channel in ({channels})"
+
+SELECT_RAW_STREAMS = "select raw_power, raw_hr from activity where zwift_id = ?"
+
+INSERT_STREAM_SQL = """
+    insert into activity_stream (zwift_id, channel, dtype, data) values (:zwift_id, :channel, :dtype, :data)
+    on conflict(zwift_id, channel) do update set dtype = :dtype, data = :data
+"""
+
+SELECT_MEAN_MAX = "select durations, best from mean_max where zwift_id = ? and channel = ?"
+
+SELECT_POWER_CURVES = """
+    select activity.zwift_id, activity.start_time, mean_max.durations, mean_max.best
+    from activity left join mean_max on mean_max.zwift_id = activity.zwift_id and mean_max.channel = 'power'
+    where activity.start_time >= :start_date
+    order by activity.start_time
+"""
+
+INSERT_MEAN_MAX_SQL = """
+    insert into mean_max (zwift_id, channel, durations, best) values (:zwift_id, :channel, :durations, :best)
+    on conflict(zwift_id, channel) do update set durations = :durations, best = :best
+"""
+
+SELECT_PEAKS = """
+    select metric, window_seconds, value, start_offset, end_offset, value is null or start_offset is not null
+    from peak where zwift_id = ?
+"""
+
+SELECT_PEAKS_WITH_ZEROS = """
+    select metric, window_seconds, value_with_zeros, start_offset_with_zeros, end_offset_with_zeros, with_zeros_known
+    from peak where zwift_id = ?
+"""
+
+SELECT_TOP_PEAKS = """
+    select peak.zwift_id, peak.{value}
+    from peak join activity on activity.zwift_id = peak.zwift_id
+    where peak.metric = :metric and peak.window_seconds = :window_seconds and peak.{value} is not null
+        and activity.start_time >= :start_date
+    order by peak.{value} desc, activity.start_time
+    limit :count
+"""
+
+SELECT_PEAK_WINDOWS = """
+    select zwift_id, metric, window_seconds from peak
+    where window_seconds in ({windows}) and (value is null or start_offset is not null) and with_zeros_known
+"""
+
+INSERT_PEAK_SQL = """
+    insert into peak (
+        zwift_id, metric, window_seconds, value, start_offset, end_offset,
+        value_with_zeros, start_offset_with_zeros, end_offset_with_zeros, with_zeros_known
+    )
+    values (
+        :zwift_id, :metric, :window_seconds, :value, :start_offset, :end_offset,
+        :value_with_zeros, :start_offset_with_zeros, :end_offset_with_zeros, 1
+    )
+    on conflict(zwift_id, metric, window_seconds) do update set
+        value = :value, start_offset = :start_offset, end_offset = :end_offset,
+        value_with_zeros = :value_with_zeros, start_offset_with_zeros = :start_offset_with_zeros,
+        end_offset_with_zeros = :end_offset_with_zeros, with_zeros_known = 1
+"""
+
+SELECT_POWER_ENVELOPE = """
+    select power_envelope.duration, power_envelope.power, power_envelope.zwift_id, activity.start_time
+    from power_envelope join activity on activity.zwift_id = power_envelope.zwift_id
+    where power_envelope.period = ? {durations}
+    order by power_envelope.duration, power_envelope.rank
+"""
+
+INSERT_POWER_ENVELOPE_SQL = """
+    insert into power_envelope (period, duration, rank, power, zwift_id) values (:period, :duration, :rank, :power, :zwift_id)
+"""
+
+DELETE_POWER_ENVELOPE_DURATION_SQL = "delete from power_envelope where period = ? and duration = ?"
+
+DELETE_POWER_ENVELOPE_SQL = "delete from power_envelope where period = ?"
+
+SELECT_POWER_ENVELOPE_STATE = "select period from power_envelope_state"
+
+INSERT_POWER_ENVELOPE_STATE_SQL = """
+    insert into power_envelope_state (period, built) values (:period, :built)
+    on conflict(period) do update set built = :built
+"""
+
+DELETE_POWER_ENVELOPE_STATE_SQL = "delete from power_envelope_state where period = ?"
+
+SELECT_WATCH_INDEX = "select path, mtime, size from watch_index"
+
+INSERT_WATCH_INDEX_SQL = """
+    insert into watch_index (path, mtime, size) values (:path, :mtime, :size)
+    on conflict(path) do update set mtime = :mtime, size = :size
+"""
+
+UPDATE_METADATA_SQL = """
+    update activity set activity_name = :activity_name, elevation = :elevation
+    where zwift_id = :zwift_id and (activity_name is not :activity_name or elevation is not :elevation)
+"""
+
 SELECT_ALL = SELECT + " where peak_5min_power is not null order by start_time"
 
 SELECT_FROM_DATE = SELECT + " where peak_5min_power is not null and start_time >= :start_date order by start_time"
@@ -122,7 +448,7 @@ INSERT_SQL = """
     insert into activity 
     (
         zwift_id, s3_url, start_time, end_time, moving_time, distance, elevation, activity_name,
-        avg_power, max_power, normalised_power, avg_hr, max_hr, raw_power, raw_hr,
+        avg_power, max_power, normalised_power, avg_hr, max_hr,
         peak_5sec_power,  peak_30sec_power, peak_60sec_power, peak_5min_power,  peak_10min_power,
         peak_20min_power, peak_30min_power, peak_60min_power, peak_90min_power, peak_120min_power, 
         peak_5sec_hr,     peak_30sec_hr,    peak_60sec_hr,    peak_5min_hr,     peak_10min_hr,
@@ -131,7 +457,7 @@ INSERT_SQL = """
     values 
     (
         :zwift_id, :s3_url, :start_time, :end_time, :moving_time, :distance, :elevation, :activity_name,
-        :avg_power, :max_power, :normalised_power, :avg_hr, :max_hr, :raw_power, :raw_hr,
+        :avg_power, :max_power, :normalised_power, :avg_hr, :max_hr,
         :peak_5sec_power,  :peak_30sec_power, :peak_60sec_power, :peak_5min_power,  :peak_10min_power,
         :peak_20min_power, :peak_30min_power, :peak_60min_power, :peak_90min_power, :peak_120min_power, 
         :peak_5sec_hr,     :peak_30sec_hr,    :peak_60sec_hr,    :peak_5min_hr,     :peak_10min_hr,
@@ -150,8 +476,8 @@ INSERT_SQL = """
         normalised_power    = :normalised_power,
         avg_hr              = :avg_hr,
         max_hr              = :max_hr,
-        raw_power           = :raw_power,
-        raw_hr              = :raw_hr,
+        raw_power           = null,
+        raw_hr              = null,
         peak_5sec_power     = :peak_5sec_power,  
         peak_30sec_power    = :peak_30sec_power,
         peak_60sec_power    = :peak_60sec_power,
@@ -195,6 +521,29 @@ class Persistence:
         if new_database:
             self.conn.execute(CREATE_TABLE)
 
+        # Tables added since the first release are created on demand.
+        self.conn.execute(CREATE_FIT_FILE_TABLE)
+        self.conn.execute(CREATE_FIT_FINGERPRINT_TABLE)
+        self.conn.execute(CREATE_STREAM_TABLE)
+        self.conn.execute(CREATE_MEAN_MAX_TABLE)
+        self.conn.execute(CREATE_PEAK_TABLE)
+        self.conn.execute(CREATE_PEAK_INDEX)
+        self.conn.execute(CREATE_POWER_ENVELOPE_TABLE)
+        self.conn.execute(CREATE_POWER_ENVELOPE_STATE_TABLE)
+        self.conn.execute(CREATE_WATCH_INDEX_TABLE)
+        self.conn.execute(CREATE_FETCH_CURSOR_TABLE)
+        self.conn.execute(CREATE_FETCH_QUEUE_TABLE)
+        self.conn.execute(CREATE_FETCH_METRICS_TABLE)
+
+        # As are columns added to them since, and the indexes on those.
+        self._add_columns()
+        self.conn.execute(CREATE_PEAK_WITH_ZEROS_INDEX)
+
+        # The power-duration envelope's periods that are built, and those
+        # we've read to keep up to date as we store activities.
+        self._built_periods: Optional[Set[str]] = None
+        self._envelopes: Dict[str, PowerEnvelope] = {}
+
     def get_known_ids(self) -> Set[str]:
         """
         Get the list of activity IDs we already have.
@@ -211,6 +560,221 @@ class Persistence:
         finally:
             cursor.close
 
+    def get_existing_ids(self, ids: List[str]) -> Set[str]:
+        """
+        Find which of a list of activity IDs we already have.
+
+        Args:
+            ids: The activity IDs to look for.
+
+        Returns:
+            The IDs we have.
+        """
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_EXISTING_IDS.format(ids=", ".join("?" for _ in ids)), ids)
+            return {record[0] for record in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+    def get_fetch_cursor(self) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Get the newest Zwift activity that fetch has dealt with.
+
+        Returns:
+            The activity's ID and start date (as Zwift formats it), if fetch
+            has run.
+        """
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_FETCH_CURSOR)
+            record = cursor.fetchone()
+            return (record[0], record[1]) if record else None
+        finally:
+            cursor.close()
+
+    def queue_fetch(self, *, listings: List[Tuple[str, str]], cursor: Optional[Tuple[str, Optional[str]]]):
+        """
+        Add activities to the fetch queue, and move the fetch cursor past
+        them, in a single transaction. Activities already in the queue keep
+        their place and state.
+
+        Args:
+            listings: The ID and listing (as Zwift's JSON) of each activity, in
+                      the order they should be stored.
+            cursor:   The ID and start date of the newest activity listed, if any.
+        """
+        with self.conn:
+            self.conn.executemany(INSERT_FETCH_QUEUE_SQL, [{"zwift_id": zwift_id, "listing": listing} for zwift_id, listing in listings])
+            if cursor:
+                self.conn.execute(INSERT_FETCH_CURSOR_SQL, {"zwift_id": cursor[0], "start_date": cursor[1]})
+
+    def load_fetch_queue(self) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Get the activities in the fetch queue that haven't been stored yet,
+        and haven't been given up on.
+
+        Returns:
+            The listing, state, and (once it's downloaded) content hash of each
+            activity, in the order they should be stored.
+        """
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_FETCH_QUEUE)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def set_fetch_state(self, *, zwift_id: str, state: str, content_hash: Optional[str] = None):
+        """
+        Note how far an activity in the fetch queue has got.
+
+        Args:
+            zwift_id:     The activity's ID.
+            state:        Its new state.
+            content_hash: The hash its FIT file is archived under, once it's downloaded.
+        """
+        with self.conn:
+            self.conn.execute(UPDATE_FETCH_QUEUE_SQL, {"zwift_id": zwift_id, "state": state, "content_hash": content_hash})
+
+    def fail_fetch(self, *, zwift_id: str, max_attempts: int) -> int:
+        """
+        Note that an activity in the fetch queue failed to load. It goes back
+        to the start of the queue to be tried again, unless it's failed
+        max_attempts times, in which case it's marked failed and left alone.
+
+        Args:
+            zwift_id:     The activity's ID.
+            max_attempts: The number of times an activity can fail before we give up on it.
+
+        Returns:
+            The number of times it's failed.
+        """
+        with self.conn:
+            self.conn.execute(FAIL_FETCH_QUEUE_SQL, {"zwift_id": zwift_id, "max_attempts": max_attempts})
+            return self.conn.execute(SELECT_FETCH_ATTEMPTS, {"zwift_id": zwift_id}).fetchone()[0]
+
+    def store_fetched(self, *, activity: Activity):
+        """
+        Persist an activity from the fetch queue, and mark it stored, in a
+        single transaction.
+
+        Args:
+            activity: The activity to persist.
+        """
+        try:
+            with self.conn:
+                self._insert(activity=activity)
+                self.conn.execute(UPDATE_FETCH_QUEUE_SQL, {"zwift_id": activity.zwift_id, "state": "stored", "content_hash": activity.content_hash})
+        except BaseException:
+            self._forget_power_envelope()
+            raise
+
+    def clear_fetch_queue(self):
+        """
+        Remove the activities that have been stored from the fetch queue.
+        Those we gave up on are kept, as a record of them.
+        """
+        with self.conn:
+            self.conn.execute(DELETE_STORED_FETCH_QUEUE_SQL)
+
+    def store_fetch_metrics(self, *, metrics: Dict[str, Any]):
+        """
+        Keep the numbers from a fetch, so runs can be compared.
+
+        Args:
+            metrics: The numbers, keyed by column (see FetchMetrics.get_record).
+        """
+        with self.conn:
+            self.conn.execute(INSERT_FETCH_METRICS_SQL, metrics)
+
+    def get_known_fingerprints(self) -> Dict[str, str]:
+        """
+        Get the fingerprints of the FIT files we've already loaded.
+
+        Returns:
+            The ID of the activity loaded from each fingerprinted file, keyed
+            by fingerprint.
+        """
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_FINGERPRINTS)
+            return {fingerprint: zwift_id for fingerprint, zwift_id in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+    def load_watch_index(self) -> Dict[str, Tuple[float, int]]:
+        """
+        Get the files the watch command has already dealt with.
+
+        Returns:
+            The (mtime, size) each file had when we dealt with it, keyed by path.
+        """
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_WATCH_INDEX)
+            return {path: (mtime, size) for path, mtime, size in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+    def store_watch_entry(self, *, path: str, mtime: float, size: int):
+        """
+        Note that the watch command has dealt with a file.
+
+        Args:
+            path:  The file's path.
+            mtime: The file's modification time when we dealt with it.
+            size:  The file's size when we dealt with it.
+        """
+        with self.conn:
+            self.conn.execute(INSERT_WATCH_INDEX_SQL, {"path": path, "mtime": mtime, "size": size})
+
+    def update_metadata(self, *, metadata: List[Dict[str, Any]]) -> int:
+        """
+        Update the names and elevations of activities we already have, in a
+        single transaction. Activities we don't have are ignored.
+
+        Args:
+            metadata: The zwift_id, activity_name, and elevation of each activity.
+
+        Returns:
+            The number of activities that changed.
+        """
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(UPDATE_METADATA_SQL, metadata)
+            return self.conn.total_changes - before
+
+    def load_archived(self) -> List[Activity]:
+        """
+        Load the activities whose FIT files we've archived. Only the details
+        that don't come from the FIT file are loaded.
+
+        Returns:
+            The activities, in row ID order.
+        """
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_ARCHIVED)
+            activities = []
+            for zwift_id, s3_url, activity_name, elevation, content_hash in cursor.fetchall():
+                activity = Activity()
+                activity.zwift_id = zwift_id
+                activity.s3_url = s3_url
+                activity.activity_name = activity_name
+                activity.elevation = elevation
+                activity.content_hash = content_hash
+                activities.append(activity)
+            return activities
+        finally:
+            cursor.close()
+
     def load_by_id(self, id: int) -> Optional[Activity]:
         """
         Load a given activity's data.
@@ -246,6 +810,486 @@ class Persistence:
         finally:
             cursor.close()
 
+    def load_streams(self, *, activity: Activity, channels: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Load some of an activity's per-second channels. Only the channels asked
+        for are read.
+
+        Activities loaded before channels were stored only have power and heart
+        rate, which were stored as text with the activity.
+
+        Args:
+            activity: The activity whose channels we want.
+            channels: The names of the channels we want (see stream_store.CHANNELS).
+
+        Returns:
+            The channels we found, keyed by name.
+        """
+
+        # Read the channels we've stored
+        cursor = self.conn.cursor()
+        try:
+            placeholders = ", ".join("?" for _ in channels)
+            cursor.execute(SELECT_STREAMS.format(channels=placeholders), [activity.zwift_id, *channels])
+            streams = {channel: decode_channel(dtype=dtype, data=data) for channel, dtype, data in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+        # Fill in power and HR for older activities
+        if any(channel in channels and channel not in streams for channel in ["power", "heart_rate"]):
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(SELECT_RAW_STREAMS, [activity.zwift_id])
+                record = cursor.fetchone()
+            finally:
+                cursor.close()
+            for channel, text in zip(["power", "heart_rate"], record or []):
+                if channel in channels and channel not in streams and text:
+                    streams[channel] = np.array(text.split(","), dtype=np.int64)
+
+        # Done.
+        return streams
+
+    def load_mean_max(self, *, activity: Activity, channel: str) -> Optional[MeanMaxCurve]:
+        """
+        Load an activity's mean-maximal curve for a channel.
+
+        Activities loaded before curves were stored have theirs calculated from
+        their stored channel instead.
+
+        Args:
+            activity: The activity whose curve we want.
+            channel:  The channel: "power" or "heart_rate".
+
+        Returns:
+            The curve, if we have the channel.
+        """
+
+        # Read the curve, if we stored it
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_MEAN_MAX, [activity.zwift_id, channel])
+            record = cursor.fetchone()
+        finally:
+            cursor.close()
+        if record:
+            return decode_mean_max(durations=record[0], values=record[1])
+
+        # Otherwise work it out
+        streams = self.load_streams(activity=activity, channels=[channel])
+        return calculate_mean_max(source=streams[channel]) if channel in streams else None
+
+    def load_by_zwift_id(self, zwift_id: str) -> Optional[Activity]:
+        """
+        Load an activity's data, given its Zwift ID.
+
+        Args:
+            zwift_id: The Zwift ID of the activity.
+
+        Returns:
+            The activity, if found.
+        """
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_BY_ZWIFT_ID, {"zwift_id": zwift_id})
+            record = cursor.fetchone()
+            return self._create_activity(record=record) if record else None
+        finally:
+            cursor.close()
+
+    def load_peaks(self, *, activity: Activity, with_zeros: bool = False) -> Dict[str, Dict[int, Optional[Peak]]]:
+        """
+        Load an activity's peaks, and where they were, from the peak table.
+
+        Activities stored before we kept where their peaks were, or their peaks
+        with zeros included, and that haven't been backfilled, have theirs
+        worked out from their stored channels instead.
+
+        Args:
+            activity:   The activity whose peaks we want.
+            with_zeros: Whether we want the peaks with zeros included, rather
+                        than dropped (see peaks.calculate_peaks).
+
+        Returns:
+            The peaks, keyed by stream and then window in seconds.
+        """
+
+        # Read them
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_PEAKS_WITH_ZEROS if with_zeros else SELECT_PEAKS, [activity.zwift_id])
+            records = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        # If we have them all, use them
+        if records and all(known for *_, known in records):
+            peaks: Dict[str, Dict[int, Optional[Peak]]] = {}
+            for metric, window_seconds, value, start, end, _ in records:
+                peaks.setdefault(metric, {})[window_seconds] = Peak(value=value, start=start, end=end) if value is not None else None
+            return peaks
+
+        # Otherwise work them out
+        streams = self.load_streams(activity=activity, channels=list(PEAK_COLUMNS))
+        return {
+            metric: calculate_peaks(source=streams[metric], windows=get_peak_windows(), with_zeros=with_zeros) for metric in PEAK_COLUMNS if metric in streams
+        }
+
+    def load_top_peaks(self, *, metric: str, window_seconds: int, count: int, start_date: str = "", with_zeros: bool = False) -> List[Tuple[int, Activity]]:
+        """
+        Load the activities with the best peaks for a window, best first. Where
+        two are equal, the earlier comes first.
+
+        Args:
+            metric:         The stream: "power" or "heart_rate".
+            window_seconds: The window, in seconds.
+            count:          How many activities to load.
+            start_date:     The earliest start date to look at (e.g. "2022-01-31").
+            with_zeros:     Whether to rank the peaks with zeros included,
+                            rather than dropped (see peaks.calculate_peaks).
+
+        Returns:
+            Each activity's peak, and the activity.
+        """
+
+        # Find the best from the index
+        sql = SELECT_TOP_PEAKS.format(value="value_with_zeros" if with_zeros else "value")
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, {"metric": metric, "window_seconds": window_seconds, "start_date": start_date, "count": count})
+            records = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        # Load their activities
+        return [(value, self.load_by_zwift_id(zwift_id)) for zwift_id, value in records]
+
+    def backfill_peaks(self, *, windows: List[int]) -> int:
+        """
+        Work out any peaks the peak table is missing for a set of windows, such
+        as when a window has been added to the config file, or the activities
+        were stored before there was a peak table, or before we kept where
+        their peaks were, or their peaks with zeros included. They're worked
+        out from the activities' stored channels, with and without zeros
+        from the same sums.
+
+        Args:
+            windows: The windows we want peaks for, in seconds.
+
+        Returns:
+            The number of activities whose peaks we worked out.
+        """
+
+        # Find the peaks we have
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_PEAK_WINDOWS.format(windows=", ".join("?" for _ in windows)), windows)
+            have = set(cursor.fetchall())
+            cursor.execute(SELECT_FROM_START_TIME, {"start_date": ""})
+            records = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        # Work out the rest, one activity at a time
+        backfilled = 0
+        for record in records:
+            activity = self._create_activity(record=record)
+            missing = {metric: [window for window in windows if (activity.zwift_id, metric, window) not in have] for metric in PEAK_COLUMNS}
+            if not any(missing.values()):
+                continue
+            streams = self.load_streams(activity=activity, channels=[metric for metric in missing if missing[metric]])
+            rows = []
+            for metric, metric_windows in missing.items():
+                if metric in streams:
+                    sums = sum_stream(streams[metric])
+                    peaks = find_peaks(sums, windows=metric_windows)
+                    peaks_with_zeros = find_peaks(sums, windows=metric_windows, with_zeros=True)
+                else:
+                    peaks = peaks_with_zeros = dict.fromkeys(metric_windows)
+                rows.extend(_get_peak_rows(zwift_id=activity.zwift_id, metric=metric, peaks=peaks, peaks_with_zeros=peaks_with_zeros))
+            with self.conn:
+                self.conn.executemany(INSERT_PEAK_SQL, rows)
+            backfilled += 1
+
+        # Done.
+        return backfilled
+
+    def load_power_envelope(self, *, period: str, durations: Optional[List[int]] = None) -> PowerEnvelope:
+        """
+        Load the power-duration envelope for a period: the best few values
+        across every activity in it, for each duration.
+
+        The envelope is kept up to date as activities are stored, so this is
+        usually a single read. The first time we read a period it's built from
+        the activities' curves; after that, any durations whose best have aged
+        out of a rolling period are refilled from them.
+
+        Args:
+            period:    The period (see peaks.ENVELOPE_PERIODS).
+            durations: The durations we want, in seconds; all of them if not given.
+
+        Returns:
+            The envelope.
+        """
+
+        # Build it if we haven't
+        if period not in self._get_built_periods():
+            self.rebuild_power_envelope(periods=[period])
+
+        # Read it, and refill any durations that have lost entries to age
+        envelope = self._read_power_envelope(period=period, durations=durations)
+        start_date = get_envelope_start(period)
+        if aged := [duration for duration, entries in envelope.items() if any(entry.start_time < start_date for entry in entries)]:
+            envelope.update(self._refill_power_envelope(period=period, durations=aged))
+            envelope = {duration: entries for duration, entries in envelope.items() if entries}
+
+        # Done.
+        return envelope
+
+    def rebuild_power_envelope(self, *, periods: Optional[List[str]] = None):
+        """
+        Rebuild the power-duration envelope from every activity's power curve.
+
+        Args:
+            periods: The periods to rebuild; all of them if not given.
+        """
+
+        # Find each activity's power at each duration
+        periods = periods or list(ENVELOPE_PERIODS)
+        zwift_ids, start_times, powers = self._load_power_curves(start_date=min(get_envelope_start(period) for period in periods), durations=ENVELOPE_DURATIONS)
+
+        # Work out each period's envelope, and replace what we have
+        with self.conn:
+            for period in periods:
+                in_period = np.flatnonzero(start_times >= get_envelope_start(period)) if len(start_times) else np.empty(0, dtype=np.int64)
+                envelope = _rank_efforts(zwift_ids=zwift_ids, start_times=start_times, powers=powers[in_period], rows=in_period, durations=ENVELOPE_DURATIONS.tolist())
+                self._write_power_envelope(period=period, envelope=envelope)
+
+    def find_best_efforts(self, *, period: str, durations: List[int]) -> PowerEnvelope:
+        """
+        Find the best few efforts in a period for durations the power-duration
+        envelope doesn't keep, from every activity's power curve.
+
+        This reads every curve in the period, so it's much slower than reading
+        the envelope; it's for the odd duration that's asked for.
+
+        Args:
+            period:    The period (see peaks.ENVELOPE_PERIODS).
+            durations: The durations, in seconds, ascending.
+
+        Returns:
+            The best efforts for each duration, as the envelope has them.
+        """
+        zwift_ids, start_times, powers = self._load_power_curves(start_date=get_envelope_start(period), durations=np.array(durations))
+        return _rank_efforts(zwift_ids=zwift_ids, start_times=start_times, powers=powers, rows=np.arange(len(zwift_ids)), durations=durations)
+
+    def _load_power_curves(self, *, start_date: str, durations: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Find the power at each of a set of durations for every activity since a
+        given start date, from their power curves.
+
+        Args:
+            start_date: The earliest start time, as it's stored.
+            durations:  The durations, in seconds, ascending.
+
+        Returns:
+            The activities with a power curve, oldest first; their start times;
+            and their power at each duration, one row per activity (zero where
+            the activity was shorter than the duration).
+        """
+
+        # Read the activities' curves
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(SELECT_POWER_CURVES, {"start_date": start_date})
+            records = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        # Find their power at each duration. Activities stored before curves
+        # were have theirs worked out from their power.
+        zwift_ids = []
+        start_times = []
+        powers = np.zeros((len(records), len(durations)), dtype=np.int64)
+        for zwift_id, start_time, curve_durations, curve_best in records:
+            if curve_durations is not None:
+                curve = decode_mean_max(durations=curve_durations, values=curve_best)
+            else:
+                activity = self.load_by_zwift_id(zwift_id)
+                curve = self.load_mean_max(activity=activity, channel="power") if activity else None
+            if curve:
+                values = get_mean_max_values(curve, durations)
+                powers[len(zwift_ids), : len(values)] = values
+                zwift_ids.append(zwift_id)
+                start_times.append(start_time)
+
+        # Done.
+        return zwift_ids, np.array(start_times, dtype=object), powers[: len(zwift_ids)]
+
+    def _add_columns(self):
+        """
+        Add any columns our tables are missing (see ADDED_COLUMNS).
+        """
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {record[1] for record in self.conn.execute(f"pragma table_info({table})")}
+            for column, definition in columns.items():
+                if column not in existing:
+                    self.conn.execute(f"alter table {table} add column {column} {definition}")
+
+    def _forget_power_envelope(self):
+        """
+        Forget what we've read of the power-duration envelope. We do this when
+        storing fails, as what we kept may no longer match the database.
+        """
+        self._built_periods = None
+        self._envelopes = {}
+
+    def _get_built_periods(self) -> Set[str]:
+        """
+        Get the power-duration envelope's periods that have been built.
+
+        Returns:
+            The periods.
+        """
+        if self._built_periods is None:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(SELECT_POWER_ENVELOPE_STATE)
+                self._built_periods = {record[0] for record in cursor.fetchall()}
+            finally:
+                cursor.close()
+        return self._built_periods
+
+    def _read_power_envelope(self, *, period: str, durations: Optional[List[int]]) -> PowerEnvelope:
+        """
+        Read the power-duration envelope for a period, as it's stored.
+
+        Args:
+            period:    The period.
+            durations: The durations we want; all of them if None.
+
+        Returns:
+            The envelope.
+        """
+
+        # Read it
+        cursor = self.conn.cursor()
+        try:
+            if durations is None:
+                cursor.execute(SELECT_POWER_ENVELOPE.format(durations=""), [period])
+            else:
+                placeholders = ", ".join("?" for _ in durations)
+                cursor.execute(SELECT_POWER_ENVELOPE.format(durations=f"and power_envelope.duration in ({placeholders})"), [period, *durations])
+            records = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        # Gather each duration's entries
+        envelope: PowerEnvelope = {}
+        for duration, power, zwift_id, start_time in records:
+            envelope.setdefault(duration, []).append(EnvelopeEntry(power=power, zwift_id=zwift_id, start_time=start_time))
+
+        # Done.
+        return envelope
+
+    def _write_power_envelope(self, *, period: str, envelope: PowerEnvelope):
+        """
+        Replace the power-duration envelope for a period, without committing.
+
+        Args:
+            period:   The period.
+            envelope: Its envelope.
+        """
+        self.conn.execute(DELETE_POWER_ENVELOPE_SQL, [period])
+        self.conn.executemany(
+            INSERT_POWER_ENVELOPE_SQL,
+            [
+                {"period": period, "duration": duration, "rank": rank, "power": entry.power, "zwift_id": entry.zwift_id}
+                for duration, entries in envelope.items()
+                for rank, entry in enumerate(entries, 1)
+            ],
+        )
+        self.conn.execute(INSERT_POWER_ENVELOPE_STATE_SQL, {"period": period, "built": datetime.now().isoformat(timespec="seconds")})
+        self._get_built_periods().add(period)
+        self._envelopes[period] = envelope
+
+    def _update_power_envelope(self, *, activity: Activity, curve: MeanMaxCurve):
+        """
+        Bring the power-duration envelope up to date with a newly stored
+        activity, without committing.
+
+        Args:
+            activity: The activity.
+            curve:    Its mean-maximal power curve.
+        """
+
+        start_time = str(activity.start_time)
+        for period in list(self._get_built_periods()):
+
+            # Is the activity in this period?
+            if start_time < get_envelope_start(period):
+                continue
+
+            # Read the envelope, the first time we need it
+            if period not in self._envelopes:
+                self._envelopes[period] = self._read_power_envelope(period=period, durations=None)
+            envelope = self._envelopes[period]
+
+            # If the activity was already in it, and has changed, it'll have
+            # to be rebuilt when it's next read
+            if (changes := merge_envelope(envelope, zwift_id=activity.zwift_id, start_time=start_time, curve=curve)) is None:
+                self.conn.execute(DELETE_POWER_ENVELOPE_SQL, [period])
+                self.conn.execute(DELETE_POWER_ENVELOPE_STATE_SQL, [period])
+                self._built_periods.discard(period)
+                del self._envelopes[period]
+                continue
+
+            # Otherwise replace the durations it's improved
+            self._write_power_envelope_durations(period=period, changes=changes)
+
+    def _refill_power_envelope(self, *, period: str, durations: List[int]) -> PowerEnvelope:
+        """
+        Work out the power-duration envelope afresh for some of a period's
+        durations, from the curves of the activities in it, and store it.
+
+        Args:
+            period:    The period.
+            durations: The durations, in seconds, ascending.
+
+        Returns:
+            The new entries for each duration; an empty list for those no
+            activity in the period reaches.
+        """
+        zwift_ids, start_times, powers = self._load_power_curves(start_date=get_envelope_start(period), durations=np.array(durations))
+        efforts = _rank_efforts(zwift_ids=zwift_ids, start_times=start_times, powers=powers, rows=np.arange(len(zwift_ids)), durations=durations)
+        changes = {duration: efforts.get(duration, []) for duration in durations}
+        with self.conn:
+            self._write_power_envelope_durations(period=period, changes=changes)
+        return changes
+
+    def _write_power_envelope_durations(self, *, period: str, changes: PowerEnvelope):
+        """
+        Replace some of the durations of the power-duration envelope for a
+        period, without committing.
+
+        Args:
+            period:  The period.
+            changes: The new entries for each duration; an empty list drops
+                     the duration.
+        """
+        for duration, entries in changes.items():
+            self.conn.execute(DELETE_POWER_ENVELOPE_DURATION_SQL, [period, duration])
+            self.conn.executemany(
+                INSERT_POWER_ENVELOPE_SQL,
+                [{"period": period, "duration": duration, "rank": rank, "power": entry.power, "zwift_id": entry.zwift_id} for rank, entry in enumerate(entries, 1)],
+            )
+            if period in self._envelopes:
+                if entries:
+                    self._envelopes[period][duration] = entries
+                else:
+                    self._envelopes[period].pop(duration, None)
+
     def load_for_week(self, start_date: date) -> List[Activity]:
         cursor = self.conn.cursor()
         try:
@@ -316,9 +1360,8 @@ class Persistence:
         activity.avg_hr = record[SelectIndices.AvgHr.value]
         activity.max_hr = record[SelectIndices.MaxHr.value]
 
-        # Fetch raw power and HR
-        activity.raw_power = [int(p) for p in record[SelectIndices.RawPower.value].split(",")]
-        activity.raw_hr = [int(hr) for hr in record[SelectIndices.RawHr.value].split(",")]
+        # Its per-second channels are read when they're asked for
+        activity.read_streams = functools.partial(self.load_streams, activity=activity)
 
         # Fetch power peaks
         activity.peak_5sec_power = record[SelectIndices.Peak5SecPower.value]
@@ -351,6 +1394,33 @@ class Persistence:
         """
         Persist an activity in the SQLite database.
 
+        Args:
+            activity: The activity to persist.
+        """
+        self.store_all(activities=[activity])
+
+    def store_all(self, *, activities: List[Activity]):
+        """
+        Persist a batch of activities in the SQLite database, in a single
+        transaction.
+
+        Args:
+            activities: The activities to persist, in the order they should be stored.
+        """
+
+        try:
+            with self.conn:
+                for activity in activities:
+                    self._insert(activity=activity)
+
+        except BaseException:
+            self._forget_power_envelope()
+            raise
+
+    def _insert(self, *, activity: Activity):
+        """
+        Insert (or update) an activity, without committing.
+
         Args:
             activity: The activity to persist.
         """
@@ -359,16 +1429,14 @@ class Persistence:
         params = {}
 
         for key, value in activity.__dict__.items():
-            if key in ["raw_power", "raw_hr"]:
-                params[key] = ",".join(str(x) for x in value)
-            else:
-                params[key] = value
+            if key in ["streams", "read_streams", "mean_max", "peaks", "peaks_with_zeros", "load_seconds"]:
+                continue
+            params[key] = value
 
         # Insert the record.
         self.conn.execute(INSERT_SQL, params)
-        self.conn.commit()
 
-        # Fetch the row ID
+        # Fetch the row ID, before anything else is inserted
         cursor = self.conn.cursor()
         try:
             cursor.execute('select last_insert_rowid() as "last_row_id"')
@@ -377,3 +1445,101 @@ class Persistence:
             activity.rowid = int(records[0][0])
         finally:
             cursor.close()
+
+        # Note where its FIT file is archived, if it is.
+        if activity.content_hash:
+            self.conn.execute(INSERT_FIT_FILE_SQL, params)
+
+        # Note its FIT file's fingerprint, so we can spot it if it turns up again.
+        if activity.fingerprint:
+            self.conn.execute(INSERT_FIT_FINGERPRINT_SQL, params)
+
+        # Store its per-second channels, each as its own typed array.
+        if activity.streams:
+            self.conn.executemany(
+                INSERT_STREAM_SQL,
+                [
+                    {"zwift_id": activity.zwift_id, "channel": channel, "dtype": CHANNELS[channel], "data": encode_channel(channel=channel, values=values)}
+                    for channel, values in activity.streams.items()
+                ],
+            )
+
+        # Store its peaks, with zeros dropped and included side by side.
+        if activity.peaks:
+            for metric, peaks in activity.peaks.items():
+                rows = _get_peak_rows(zwift_id=activity.zwift_id, metric=metric, peaks=peaks, peaks_with_zeros=activity.peaks_with_zeros[metric])
+                self.conn.executemany(INSERT_PEAK_SQL, rows)
+
+        # Store its mean-maximal curves.
+        for channel, curve in (activity.mean_max or {}).items():
+            durations, best = encode_mean_max(curve)
+            self.conn.execute(INSERT_MEAN_MAX_SQL, {"zwift_id": activity.zwift_id, "channel": channel, "durations": durations, "best": best})
+
+        # Bring the power-duration envelope up to date.
+        if activity.mean_max and "power" in activity.mean_max:
+            self._update_power_envelope(activity=activity, curve=activity.mean_max["power"])
+
+
+def _get_peak_rows(*, zwift_id: str, metric: str, peaks: Dict[int, Optional[Peak]], peaks_with_zeros: Dict[int, Optional[Peak]]) -> List[Dict[str, Any]]:
+    """
+    Get the peak table rows for an activity's peaks for a stream.
+
+    Args:
+        zwift_id:         The activity.
+        metric:           The stream.
+        peaks:            Its peaks with zeros dropped, keyed by window.
+        peaks_with_zeros: Its peaks with zeros included, for the same windows.
+
+    Returns:
+        The rows.
+    """
+    rows = []
+    for window, peak in peaks.items():
+        peak_with_zeros = peaks_with_zeros[window]
+        rows.append(
+            {
+                "zwift_id": zwift_id,
+                "metric": metric,
+                "window_seconds": window,
+                "value": peak.value if peak else None,
+                "start_offset": peak.start if peak else None,
+                "end_offset": peak.end if peak else None,
+                "value_with_zeros": peak_with_zeros.value if peak_with_zeros else None,
+                "start_offset_with_zeros": peak_with_zeros.start if peak_with_zeros else None,
+                "end_offset_with_zeros": peak_with_zeros.end if peak_with_zeros else None,
+            }
+        )
+
+    # Done
+    return rows
+
+
+def _rank_efforts(*, zwift_ids: List[str], start_times: np.ndarray, powers: np.ndarray, rows: np.ndarray, durations: List[int]) -> PowerEnvelope:
+    """
+    Rank the best few efforts for each of a set of durations, as the
+    power-duration envelope keeps them: the best ENVELOPE_RANKS distinct
+    values, best first, with the oldest activity keeping a tied value.
+
+    Args:
+        zwift_ids:   The activities, oldest first.
+        start_times: Their start times.
+        powers:      The power at each duration for the activities we're ranking,
+                     one row per activity.
+        rows:        Which activity each row of powers belongs to.
+        durations:   The durations, one for each column of powers.
+
+    Returns:
+        The best efforts for each duration that has any.
+    """
+    efforts: PowerEnvelope = {}
+    for column, duration in enumerate(durations):
+        entries: List[EnvelopeEntry] = []
+        for row in np.argsort(-powers[:, column], kind="stable"):
+            power = int(powers[row, column])
+            if power <= 0 or len(entries) == ENVELOPE_RANKS:
+                break
+            if not entries or power != entries[-1].power:
+                entries.append(EnvelopeEntry(power=power, zwift_id=zwift_ids[rows[row]], start_time=start_times[rows[row]]))
+        if entries:
+            efforts[duration] = entries
+    return efforts
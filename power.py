@@ -1,9 +1,10 @@
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from collections import defaultdict
 from dataclasses import dataclass, field
 
 from persistence import Persistence
+from peaks import PEAK_COLUMNS, PowerEnvelope, format_duration
 from activity import Activity
 from athlete import get_ftp
 from calculations import calculate_progressive_fitness, calculate_transient_values, calculate_fitness
@@ -11,6 +12,11 @@ from calculation_data import AerobicDecoupling
 from formatting import format_aero_decoupling, format_aero_efficiency, format_variability_index, format_atl, format_ctl, format_tsb
 
 
+# The power peaks, and the labels we find their maximums under: "5sec" for
+# peak_5sec_power, and so on.
+POWER_PEAKS = {window: column[len("peak_") : -len("_power")] for window, column in PEAK_COLUMNS["power"].items()}
+
+
 @dataclass
 class WeeklyFigures:
     def __init__(self):
@@ -178,7 +184,7 @@ class WeeklyFigures:
             self.max_if = intensity_factor
 
 
-def power_report(all: bool):
+def power_report(all: bool, durations: Optional[List[int]] = None):
     """
     Print a power report.
 
@@ -188,6 +194,12 @@ def power_report(all: bool):
     - Print the activity data for each activity, sorted in date order with a break
       between each week.
     - Print the maximum we found for each power peak as a final summary.
+    - Print the best efforts for any other durations we were asked for, read
+      from each activity's mean-maximal power curve.
+
+    Args:
+        all:       Report on every activity, rather than the last 90 days.
+        durations: Extra peak durations to report, in seconds.
     """
 
     # Calculate the start date we should use
@@ -205,8 +217,11 @@ def power_report(all: bool):
     # Calculate transient values
     _calculate_transient_values(activities)
 
-    # Find the maximum for each value.
-    max_values = _load_max_values(activities)
+    # Find the maximum for each value. The power peaks come from the
+    # power-duration envelope for the period.
+    period = "all" if all else "90d"
+    envelope = db.load_power_envelope(period=period, durations=list(POWER_PEAKS))
+    max_values = _load_max_values(activities, envelope=envelope)
 
     # Establish the prevailing FTP
     prevailing_ftp = None
@@ -257,6 +272,10 @@ def power_report(all: bool):
     # Print the summary.
     _print_summary(max_values)
 
+    # Print the best efforts for any other durations.
+    if durations:
+        _print_best_efforts(db=db, period=period, activities=activities, durations=durations)
+
 
 def _accumulate_weekly_figures(weekly_figures: WeeklyFigures, activity: Activity):
     """
@@ -491,6 +510,48 @@ def _print_summary(max: Dict[str, List[int]]):
     )
 
 
+def _print_best_efforts(*, db: Persistence, period: str, activities: List[Activity], durations: List[int]):
+    """
+    Print the three best efforts for each of a set of durations.
+
+    These come from the power-duration envelope. It only keeps some durations;
+    the best efforts for the others are found from the power curves of every
+    activity in the period.
+
+    Args:
+        db:         The database, which holds the envelope and the power curves.
+        period:     The envelope's period to report on.
+        activities: The activities we're reporting on, by which we find most of
+                    those in the envelope.
+        durations:  The durations, in seconds.
+    """
+
+    # Read the envelope, and find the best efforts for the durations it doesn't keep
+    durations = sorted(set(durations))
+    envelope = db.load_power_envelope(period=period)
+    if others := [duration for duration in durations if duration not in envelope and duration > 0]:
+        envelope.update(db.find_best_efforts(period=period, durations=others))
+    by_id = {activity.zwift_id: activity for activity in activities}
+
+    # Helper to find an activity we're not reporting on
+    def _get_activity(zwift_id: str) -> Optional[Activity]:
+        if zwift_id not in by_id:
+            by_id[zwift_id] = db.load_by_zwift_id(zwift_id)
+        return by_id[zwift_id]
+
+    # Print the best three for each
+    print()
+    print("Best efforts (W)   \x1B[37;41mFirst\x1B[0m                             \x1B[30;43mSecond\x1B[0m                            \x1B[30;47mThird\x1B[0m")
+    print("────────────────   ───────────────────────────────   ───────────────────────────────   ───────────────────────────────")
+    for duration in durations:
+        columns = []
+        for entry in envelope.get(duration, []):
+            if activity := _get_activity(entry.zwift_id):
+                columns.append(f"{entry.power:4}  #{activity.rowid:<5} {activity.start_time.strftime('%a %d %b, %Y')}")
+        print((f"{format_duration(duration):16}   " + "   ".join(column.ljust(31) for column in columns or ["-"])).rstrip())
+    print("────────────────   ───────────────────────────────   ───────────────────────────────   ───────────────────────────────")
+
+
 def _print_fitness(fitness):
     """
     Print a summary of our current fitness.
@@ -647,12 +708,14 @@ def _calculate_transient_values(activities: List[Activity]):
     calculate_progressive_fitness(activities=activities)
 
 
-def _load_max_values(activities: List[Activity]) -> Dict[str, List[int]]:
+def _load_max_values(activities: List[Activity], *, envelope: PowerEnvelope) -> Dict[str, List[int]]:
     """
     Given a list of activities, find the overall maximum for each of the peaks.
 
     Args:
         activities: Our activity data.
+        envelope:   The power-duration envelope for the same period, which has
+                    the best values for the power peaks.
 
     Returns:
         Dict[str, Any]: The maximum peak for each time period.
@@ -673,18 +736,13 @@ def _load_max_values(activities: List[Activity]) -> Dict[str, List[int]]:
         if val not in l:
             l.append(val)
 
-    # Visit each time period to find the maximum value.
+    # The power peaks we already have.
+    for window, label in POWER_PEAKS.items():
+        for entry in envelope.get(window, []):
+            _max(entry.power, label)
+
+    # Visit each activity to find the maximum of everything else.
     for activity in activities:
-        _max(activity.peak_5sec_power, "5sec")
-        _max(activity.peak_30sec_power, "30sec")
-        _max(activity.peak_60sec_power, "60sec")
-        _max(activity.peak_5min_power, "5min")
-        _max(activity.peak_10min_power, "10min")
-        _max(activity.peak_20min_power, "20min")
-        _max(activity.peak_30min_power, "30min")
-        _max(activity.peak_60min_power, "60min")
-        _max(activity.peak_90min_power, "90min")
-        _max(activity.peak_120min_power, "120min")
         _max(activity.max_power, "pMax")
         _max(int(activity.avg_power), "pAvg")
         _max(int(activity.normalised_power), "pNor")
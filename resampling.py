@@ -0,0 +1,102 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from fit_decoder import RecordStreams
+
+MAX_FILLED_GAP = 10  # Gaps up to this many seconds are interpolated (smart recording); longer ones are pauses.
+MAX_ACTIVITY_SECONDS = 7 * 86400  # The longest span of time we'll lay out on the grid.
+
+
+@dataclass
+class AlignedStreams:
+    """
+    This class represents record data laid out on an exact 1 Hz grid. There is
+    one entry in each array for each second from the first record to the last.
+    """
+
+    start: int  # The FIT timestamp of the first second
+    end: int  # The FIT timestamp of the last second
+    power: np.ndarray  # Power in watts; zero while paused (int64)
+    heart_rate: np.ndarray  # Heart rate in bpm; zero while paused (int64)
+    distance: np.ndarray  # Cumulative distance in metres (float64)
+    altitude: Optional[np.ndarray]  # Altitude in metres (float64), if it was recorded
+    cadence: np.ndarray  # Cadence in rpm; zero while paused (int64)
+    speed: np.ndarray  # Speed in metres per second; zero while paused (float64)
+    moving: np.ndarray  # True for each second that was recorded or interpolated
+
+
+def resample(streams: RecordStreams) -> AlignedStreams:
+    """
+    Lay record data out on an exact 1 Hz grid.
+
+    Records are put into time order, and where several land on the same second
+    the last one wins. Short gaps (smart recording, dropouts) are interpolated
+    from the samples either side; longer gaps are pauses, and are filled with
+    zeroes.
+
+    Args:
+        streams: The record data, in file order.
+
+    Returns:
+        The aligned data.
+    """
+
+    # Put the records into time order, keeping the last record for each second
+    order = np.argsort(streams.timestamp, kind="stable")
+    timestamps = streams.timestamp[order].astype(np.int64)
+    last_for_second = np.append(timestamps[1:] != timestamps[:-1], True)
+    order = order[last_for_second]
+    timestamps = timestamps[last_for_second]
+
+    # Find each record's place on the grid
+    seconds = timestamps - timestamps[0]
+    length = int(seconds[-1]) + 1
+    if length > MAX_ACTIVITY_SECONDS:
+        raise ValueError(f"Activity spans {length} seconds; its timestamps can't be right")
+
+    # Mark the seconds we recorded, and those in short gaps we'll interpolate
+    moving = np.zeros(length, dtype=bool)
+    moving[seconds] = True
+    gaps = np.diff(seconds) - 1
+    short = (gaps > 0) & (gaps <= MAX_FILLED_GAP)
+    if short.any():
+        edges = np.zeros(length + 1, dtype=np.int64)
+        np.add.at(edges, seconds[:-1][short] + 1, 1)
+        np.add.at(edges, seconds[1:][short], -1)
+        moving |= np.cumsum(edges[:-1]) > 0
+
+    # Interpolate power and HR across the grid, then zero the pauses
+    grid = np.arange(length)
+    power = np.where(moving, np.rint(np.interp(grid, seconds, streams.power[order])), 0).astype(np.int64)
+    heart_rate = np.where(moving, np.rint(np.interp(grid, seconds, streams.heart_rate[order])), 0).astype(np.int64)
+    cadence = np.where(moving, np.rint(np.interp(grid, seconds, streams.cadence[order])), 0).astype(np.int64)
+
+    # Speed is interpolated from the records that have it, and zeroed in the pauses
+    speeds = streams.speed[order]
+    recorded = ~np.isnan(speeds)
+    speed = np.where(moving, np.interp(grid, seconds[recorded], speeds[recorded]), 0.0) if recorded.any() else np.zeros(length)
+
+    # Distance only ever accumulates, so we interpolate it everywhere
+    distances = streams.distance[order]
+    recorded = ~np.isnan(distances)
+    distance = np.interp(grid, seconds[recorded], distances[recorded]) if recorded.any() else np.zeros(length)
+
+    # Altitude is continuous too, so the same goes for it
+    altitudes = streams.altitude[order]
+    recorded = ~np.isnan(altitudes)
+    altitude = np.interp(grid, seconds[recorded], altitudes[recorded]) if recorded.any() else None
+
+    # Done
+    return AlignedStreams(
+        start=int(timestamps[0]),
+        end=int(timestamps[-1]),
+        power=power,
+        heart_rate=heart_rate,
+        distance=distance,
+        altitude=altitude,
+        cadence=cadence,
+        speed=speed,
+        moving=moving,
+    )
@@ -9,16 +9,33 @@ setup(
         "calculation_data.py",
         "detail.py",
         "file_loader.py",
+        "fit_archive.py",
+        "fit_prescan.py",
+        "elevation.py",
+        "peaks.py",
+        "metrics.py",
+        "stream_store.py",
+        "watcher.py",
+        "fetch_pipeline.py",
+        "fetch_metrics.py",
+        "http_client.py",
+        "zwift_api.py",
+        "zwift_standin.py",
+        "fit_decoder.py",
+        "fit_sources.py",
         "formatting.py",
         "load_file_data.py",
         "power.py",
         "week.py",
+        "top.py",
         "athlete.py",
+        "bulk_loader.py",
         "calculations.py",
         "detail_plot.py",
         "fitpeaks.py",
         "hr.py",
         "persistence.py",
+        "resampling.py",
         "zwift_loader.py"
     ],
     # metadata to display on PyPI
@@ -51,6 +68,7 @@ setup(
         "Click>=7.0",
         "termcolor>=1.1.0",
         "fitparse>=1.1.0",
-        "zwift-client>=0.2.0"
+        "numpy>=1.20",
+        "requests>=2.20"
     ],
 )
@@ -0,0 +1,43 @@
+from typing import Dict
+
+import numpy as np
+
+# This dictionary describes the per-second channels we store for each activity,
+# along with the type each is stored as. A channel can be added here without
+# any change to the database schema.
+CHANNELS: Dict[str, str] = {
+    "power": "<u2",  # Watts
+    "heart_rate": "u1",  # Beats per minute
+    "cadence": "u1",  # Revolutions per minute
+    "speed": "<f4",  # Metres per second
+    "altitude": "<f4",  # Metres
+    "distance": "<f4",  # Metres travelled so far
+}
+
+
+def encode_channel(*, channel: str, values: np.ndarray) -> bytes:
+    """
+    Encode a channel's values for storage.
+
+    Args:
+        channel: The channel's name.
+        values:  The channel's values, one per second.
+
+    Returns:
+        The values, packed as the channel's type.
+    """
+    return np.asarray(values).astype(CHANNELS[channel]).tobytes()
+
+
+def decode_channel(*, dtype: str, data: bytes) -> np.ndarray:
+    """
+    Decode a stored channel's values.
+
+    Args:
+        dtype: The type the values were stored as.
+        data:  The stored values.
+
+    Returns:
+        The values, one per second.
+    """
+    return np.frombuffer(data, dtype=dtype)
@@ -0,0 +1,25 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The database, archive and config files all live in the home directory, and
+# their paths are fixed when the modules are imported, so the tests get a
+# home of their own before anything is imported.
+HOME = tempfile.mkdtemp(prefix="fitpeaks-tests-")
+os.environ["HOME"] = HOME
+
+
+@pytest.fixture
+def home():
+    """
+    Give a test an empty home directory: no database, no archive.
+
+    Returns:
+        The home directory.
+    """
+    for name in os.listdir(HOME):
+        path = os.path.join(HOME, name)
+        shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+    return HOME
@@ -0,0 +1,222 @@
+import os
+import random
+import struct
+from typing import List, Optional, Tuple
+
+from fitparse.records import Crc
+
+FIXTURES = os.path.dirname(os.path.abspath(__file__))  # Where the fixtures are written
+START = 1_000_000_000  # The first timestamp in each fixture, in seconds since the FIT epoch
+
+# The record fields we write, as (field number, size, FIT base type)
+TIMESTAMP = (253, 4, 0x86)
+POWER = (7, 2, 0x84)
+HEART_RATE = (3, 1, 0x02)
+DISTANCE = (5, 4, 0x86)
+ALTITUDE = (2, 2, 0x84)
+ENHANCED_ALTITUDE = (78, 4, 0x86)
+CADENCE = (4, 1, 0x02)
+SPEED = (6, 2, 0x84)
+
+# The struct format of each field, by field number
+FORMATS = {253: "I", 7: "H", 3: "B", 5: "I", 2: "H", 78: "I", 4: "B", 6: "H"}
+
+
+def main():
+    """
+    Write the FIT files the decoder tests use.
+
+    Each is small, and built by hand, so it exercises one thing fitparse
+    handles that a plain Zwift file doesn't: compressed timestamps, developer
+    fields, big-endian messages, several segments, and a truncated file. The
+    files are checked in; run this again only to change them.
+    """
+    _write("plain.fit", _segment(_file_id() + _records(fields=[TIMESTAMP, POWER, HEART_RATE, DISTANCE, ALTITUDE, CADENCE, SPEED], count=240, seed=1)))
+    _write("big_endian.fit", _segment(_file_id() + _records(fields=[TIMESTAMP, POWER, HEART_RATE, DISTANCE, ENHANCED_ALTITUDE, CADENCE], count=240, seed=2, big=True)))
+    _write("developer_fields.fit", _segment(_file_id() + _developer_field() + _records(fields=[TIMESTAMP, POWER, HEART_RATE, DISTANCE, SPEED], count=240, seed=3, developer=True)))
+    _write("compressed_timestamps.fit", _segment(_file_id() + _compressed_records(count=240, seed=4)))
+    _write(
+        "multi_segment.fit",
+        _segment(_file_id() + _records(fields=[TIMESTAMP, POWER, HEART_RATE, DISTANCE, ALTITUDE, CADENCE, SPEED], count=150, seed=5))
+        + _segment(_file_id() + _records(fields=[TIMESTAMP, POWER, HEART_RATE, DISTANCE], count=150, seed=6, start=START + 200, distance=1500.0)),
+    )
+    plain = _segment(_file_id() + _records(fields=[TIMESTAMP, POWER, HEART_RATE, DISTANCE, ALTITUDE, CADENCE, SPEED], count=240, seed=7))
+    _write("truncated.fit", plain[: len(plain) * 2 // 3])
+
+
+def _write(name: str, content: bytes):
+    """
+    Write a fixture.
+
+    Args:
+        name:    The fixture's file name.
+        content: Its content.
+    """
+    with open(os.path.join(FIXTURES, name), "wb") as f:
+        f.write(content)
+
+
+def _segment(messages: bytes) -> bytes:
+    """
+    Wrap messages in a FIT header and CRC.
+
+    Args:
+        messages: The messages.
+
+    Returns:
+        The segment.
+    """
+    header = struct.pack("<BBHI4s", 14, 0x20, 2140, len(messages), b".FIT")
+    header += struct.pack("<H", Crc.calculate(header))
+    content = header + messages
+    return content + struct.pack("<H", Crc.calculate(content))
+
+
+def _definition(*, local_type: int, global_number: int, fields: List[Tuple[int, int, int]], big: bool = False, developer: Optional[List[Tuple[int, int, int]]] = None) -> bytes:
+    """
+    Build a definition message.
+
+    Args:
+        local_type:    The local message type being defined.
+        global_number: The global message number.
+        fields:        The fields, as (field number, size, base type).
+        big:           Whether the messages are big-endian.
+        developer:     Any developer fields, as (field number, size, developer data index).
+
+    Returns:
+        The definition message.
+    """
+    header = 0x40 | local_type | (0x20 if developer else 0)
+    message = bytes([header, 0, 1 if big else 0]) + struct.pack(">H" if big else "<H", global_number) + bytes([len(fields)])
+    message += b"".join(bytes(field) for field in fields)
+    if developer:
+        message += bytes([len(developer)]) + b"".join(bytes(field) for field in developer)
+    return message
+
+
+def _file_id() -> bytes:
+    """
+    Build a file_id message, with its definition.
+
+    Returns:
+        The messages.
+    """
+    definition = _definition(local_type=0, global_number=0, fields=[(0, 1, 0x00), (4, 4, 0x86), (3, 4, 0x8C)])
+    return definition + bytes([0]) + struct.pack("<BII", 4, START, 12345678)
+
+
+def _developer_field() -> bytes:
+    """
+    Build the developer_data_id and field_description messages that describe
+    one developer field: a uint16 with field number 0, for developer data
+    index 0.
+
+    Returns:
+        The messages.
+    """
+    messages = _definition(local_type=2, global_number=207, fields=[(3, 1, 0x02)]) + bytes([2, 0])
+    messages += _definition(local_type=3, global_number=206, fields=[(0, 1, 0x02), (1, 1, 0x02), (2, 1, 0x02), (3, 8, 0x07)])
+    return messages + bytes([3, 0, 0, 0x84]) + b"smo2\0\0\0\0"
+
+
+def _readings(*, rnd: random.Random, second: int) -> dict:
+    """
+    Make up one second's readings. Some power and HR readings are missing, and
+    some power readings are zero.
+
+    Args:
+        rnd:    The random numbers to use.
+        second: The second we're making readings for.
+
+    Returns:
+        The raw readings, by field number.
+    """
+    power = 0xFFFF if rnd.random() < 0.02 else 0 if rnd.random() < 0.05 else max(0, int(rnd.gauss(220, 60)))
+    heart_rate = 0xFF if rnd.random() < 0.02 else 120 + second // 10 + rnd.randint(-3, 3)
+    return {7: power, 3: heart_rate, 2: int((100 + rnd.uniform(-5, 5) + 500) * 5), 78: int((100 + rnd.uniform(-5, 5) + 500) * 5), 4: rnd.randint(80, 95), 6: rnd.randint(8000, 10000)}
+
+
+def _records(*, fields: List[Tuple[int, int, int]], count: int, seed: int, big: bool = False, developer: bool = False, start: int = START, distance: float = 0.0) -> bytes:
+    """
+    Build record messages, with their definition. There's a gap of a few
+    seconds a third of the way through.
+
+    Args:
+        fields:    The fields each record has.
+        count:     The number of records.
+        seed:      Seeds the made up readings.
+        big:       Whether the records are big-endian.
+        developer: Whether each record has a developer field too.
+        start:     The first record's timestamp.
+        distance:  The distance at the first record, in metres.
+
+    Returns:
+        The messages.
+    """
+
+    # Define the records
+    rnd = random.Random(seed)
+    messages = _definition(local_type=1, global_number=20, fields=fields, big=big, developer=[(0, 2, 0)] if developer else None)
+    layout = (">" if big else "<") + "".join(FORMATS[field[0]] for field in fields) + ("H" if developer else "")
+
+    # Add each record
+    timestamp = start
+    for second in range(count):
+        if second == count // 3:
+            timestamp += 5
+        readings = _readings(rnd=rnd, second=second)
+        readings[253] = timestamp
+        readings[5] = int(distance * 100)
+        values = [readings[field[0]] for field in fields] + ([rnd.randint(0, 100)] if developer else [])
+        messages += bytes([1]) + struct.pack(layout, *values)
+        timestamp += 1
+        distance += 9.0
+
+    # Done
+    return messages
+
+
+def _compressed_records(*, count: int, seed: int) -> bytes:
+    """
+    Build record messages that use compressed timestamp headers, with their
+    definitions. The first record carries a full timestamp, and the rest are
+    offsets from it, which roll over every 32 seconds. There's a gap of 20
+    seconds a third of the way through.
+
+    Args:
+        count: The number of records.
+        seed:  Seeds the made up readings.
+
+    Returns:
+        The messages.
+    """
+
+    # Define the records: one with a timestamp, one without
+    rnd = random.Random(seed)
+    fields = [POWER, HEART_RATE, DISTANCE, ALTITUDE, CADENCE, SPEED]
+    messages = _definition(local_type=0, global_number=20, fields=[TIMESTAMP] + fields)
+    messages += _definition(local_type=1, global_number=20, fields=fields)
+    layout = "<" + "".join(FORMATS[field[0]] for field in fields)
+
+    # Add each record
+    timestamp = START
+    distance = 0.0
+    for second in range(count):
+        if second == count // 3:
+            timestamp += 20
+        readings = _readings(rnd=rnd, second=second)
+        readings[5] = int(distance * 100)
+        values = struct.pack(layout, *[readings[field[0]] for field in fields])
+        if not second:
+            messages += bytes([0]) + struct.pack("<I", timestamp) + values
+        else:
+            messages += bytes([0x80 | (1 << 5) | (timestamp & 0x1F)]) + values
+        timestamp += 1
+        distance += 9.0
+
+    # Done
+    return messages
+
+
+if __name__ == "__main__":
+    main()
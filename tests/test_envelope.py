@@ -0,0 +1,56 @@
+import os
+from datetime import datetime
+
+from load_file_data import load_file_data
+from persistence import Persistence
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")  # See fixtures/make_fixtures.py
+
+
+def _store_ride(db: Persistence, *, zwift_id: str, start_time: datetime):
+    """
+    Store the plain fixture as an activity of its own.
+
+    Args:
+        db:         The database.
+        zwift_id:   The activity's ID.
+        start_time: When it started.
+    """
+    activity = load_file_data(source=os.path.join(FIXTURES, "plain.fit"))
+    activity.zwift_id = zwift_id
+    activity.s3_url = f"file://{zwift_id}"
+    activity.start_time = start_time
+    db.store(activity=activity)
+
+
+def test_ties_go_to_the_older_activity_however_they_are_stored(home):
+    db = Persistence()
+    db.load_power_envelope(period="all")
+
+    # Store the same ride twice, the newer first
+    _store_ride(db, zwift_id="newer", start_time=datetime(2024, 2, 1, 7, 0, 0))
+    _store_ride(db, zwift_id="older", start_time=datetime(2024, 1, 1, 7, 0, 0))
+    merged = db.load_power_envelope(period="all")
+    assert merged and all(entries[0].zwift_id == "older" for entries in merged.values())
+
+    # Rebuilding it from scratch gives the same envelope
+    db.rebuild_power_envelope(periods=["all"])
+    assert Persistence().load_power_envelope(period="all") == merged
+
+
+def test_aged_out_entries_are_refilled(home, monkeypatch):
+    db = Persistence()
+    _store_ride(db, zwift_id="old", start_time=datetime(2020, 1, 1, 7, 0, 0))
+    _store_ride(db, zwift_id="recent", start_time=datetime.now().replace(microsecond=0))
+
+    # Build the period while the old ride was still in it
+    monkeypatch.setattr("persistence.get_envelope_start", lambda period: "")
+    assert all(entries[0].zwift_id == "old" for entries in db.load_power_envelope(period="42d").values())
+    monkeypatch.undo()
+
+    # Once it's aged out, the recent ride takes its place
+    refilled = db.load_power_envelope(period="42d")
+    assert refilled and all([entry.zwift_id for entry in entries] == ["recent"] for entries in refilled.values())
+    assert Persistence().load_power_envelope(period="42d") == refilled
+    db.rebuild_power_envelope(periods=["42d"])
+    assert Persistence().load_power_envelope(period="42d") == refilled
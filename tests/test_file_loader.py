@@ -0,0 +1,59 @@
+import gzip
+import os
+import shutil
+
+from bulk_loader import load_from_directory
+from file_loader import load_from_file
+from persistence import Persistence
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")  # See fixtures/make_fixtures.py
+
+
+def _copy_ride(directory: str, name: str) -> str:
+    """
+    Copy a ride into a directory.
+
+    Args:
+        directory: The directory, which is made if need be.
+        name:      The ride's file name.
+
+    Returns:
+        The ride's path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    shutil.copyfile(os.path.join(FIXTURES, "plain.fit"), path)
+    return path
+
+
+def test_title_comes_from_the_file_name(home, tmp_path):
+    path = _copy_ride(str(tmp_path / "rides.2024"), "Morning_Ride.fit")
+    load_from_file(filename=os.path.relpath(path))
+    assert Persistence().get_known_ids() == {os.path.realpath(path)}
+    assert Persistence().load_by_zwift_id(os.path.realpath(path)).activity_name == "Morning Ride"
+
+
+def test_load_keeps_the_title_load_dir_gave(home, tmp_path):
+    path = _copy_ride(str(tmp_path / "rides.2024"), "Morning_Ride.fit")
+    load_from_directory(directory=str(tmp_path), workers=1)
+    load_from_file(filename=path)
+    assert Persistence().load_by_zwift_id(os.path.realpath(path)).activity_name == "Morning Ride"
+
+
+def test_unreadable_files_are_skipped(home, tmp_path, capsys):
+    good = _copy_ride(str(tmp_path), "Good_Ride.fit")
+    (tmp_path / "broken.zip").write_bytes(b"PK\x03\x04 not really a zip")
+    (tmp_path / "short.fit.gz").write_bytes(gzip.compress(b"x" * 1000)[:20])
+    (tmp_path / "garbled.fit.gz").write_bytes(b"\x1f\x8b" + b"\x00" * 30)
+
+    # load-dir stores the good file, and reports the others
+    load_from_directory(directory=str(tmp_path), workers=1)
+    assert Persistence().get_known_ids() == {os.path.realpath(good)}
+    output = capsys.readouterr().out
+    assert "Skipping " + os.path.realpath(tmp_path / "broken.zip") in output
+    assert "2 failed" in output
+
+    # load skips them, the way it skips damaged FIT files
+    for name in ["broken.zip", "short.fit.gz", "garbled.fit.gz"]:
+        load_from_file(filename=str(tmp_path / name))
+        assert capsys.readouterr().out.startswith("Skipping " + os.path.realpath(tmp_path / name) + ": ")
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import pytest
+from fitparse import FitFile
+from fitparse.utils import FitParseError
+
+from fit_decoder import FitDecodeError, decode_records
+from load_file_data import _build_loaded_data, _read_records, load_file_data
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")  # See fixtures/make_fixtures.py
+
+# The streams the two decoders should agree on
+STREAMS = ["timestamp", "power", "heart_rate", "distance", "altitude", "cadence", "speed"]
+
+
+def _read_fixture(name: str) -> bytes:
+    """
+    Read a fixture's content.
+
+    Args:
+        name: The fixture's file name.
+
+    Returns:
+        Its content.
+    """
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name", ["plain.fit", "big_endian.fit", "developer_fields.fit", "multi_segment.fit"])
+def test_decoder_matches_fitparse(name):
+    content = _read_fixture(name)
+    ours = decode_records(content)
+    theirs = _read_records(fitfile=FitFile(content))
+    for stream in STREAMS:
+        np.testing.assert_array_equal(getattr(ours, stream), getattr(theirs, stream), err_msg=stream)
+        assert getattr(ours, stream).dtype == getattr(theirs, stream).dtype, stream
+
+
+@pytest.mark.parametrize("name", ["plain.fit", "big_endian.fit", "developer_fields.fit", "multi_segment.fit"])
+def test_loaded_data_matches_fitparse(name):
+    content = _read_fixture(name)
+    ours = _build_loaded_data(streams=decode_records(content))
+    theirs = _build_loaded_data(streams=_read_records(fitfile=FitFile(content)))
+    assert (ours.start_time, ours.end_time, ours.distance, ours.elevation, ours.moving_time) == (
+        theirs.start_time,
+        theirs.end_time,
+        theirs.distance,
+        theirs.elevation,
+        theirs.moving_time,
+    )
+    np.testing.assert_array_equal(ours.power, theirs.power)
+    np.testing.assert_array_equal(ours.hr, theirs.hr)
+    assert ours.streams.keys() == theirs.streams.keys()
+    for stream in ours.streams:
+        np.testing.assert_array_equal(ours.streams[stream], theirs.streams[stream], err_msg=stream)
+
+
+def test_multi_segment_covers_both_segments():
+    streams = decode_records(_read_fixture("multi_segment.fit"))
+    assert len(streams.timestamp) == 300
+    assert np.isnan(streams.altitude[150:]).all()
+    assert not np.isnan(streams.altitude[:150]).any()
+
+
+def test_compressed_timestamps_fall_back_to_fitparse():
+    content = _read_fixture("compressed_timestamps.fit")
+    with pytest.raises(FitDecodeError):
+        decode_records(content)
+
+    # The load falls back to fitparse, which resolves the timestamps, gap and all
+    activity = load_file_data(source=content)
+    expected = _build_loaded_data(streams=_read_records(fitfile=FitFile(content)))
+    assert (activity.start_time, activity.end_time) == (expected.start_time, expected.end_time)
+    assert (activity.end_time - activity.start_time).total_seconds() == 239 + 20
+    np.testing.assert_array_equal(activity.streams["power"], expected.power)
+    np.testing.assert_array_equal(activity.streams["heart_rate"], expected.hr)
+
+
+def test_truncated_file_is_refused():
+    content = _read_fixture("truncated.fit")
+    with pytest.raises(FitDecodeError):
+        decode_records(content)
+    with pytest.raises(FitParseError):
+        _read_records(fitfile=FitFile(content))
+    with pytest.raises(FitParseError):
+        load_file_data(source=content)
@@ -0,0 +1,86 @@
+from typing import List, Optional
+
+import numpy as np
+import pytest
+
+from calculation_data import AerobicDecoupling
+from calculations import calculate_normalised_power
+from metrics import calculate_metrics
+
+STREAMS = 200  # The number of random streams we check
+
+
+def _baseline_aerobic_decoupling(*, power: List[int], hr: List[int]) -> Optional[AerobicDecoupling]:
+    """
+    Calculate the aerobic decoupling the way calculations.calculate_aerobic_decoupling
+    did before calculate_metrics replaced it: the normalised power and average
+    HR of each half, taken from lists.
+
+    That raised a ZeroDivisionError when the first half's normalised power was
+    zero; calculate_metrics gives None, so this does too.
+
+    Args:
+        power: The power stream.
+        hr:    The HR stream.
+
+    Returns:
+        The aerobic decoupling.
+    """
+    half_way_point = int(len(power) / 2)
+    if not power[0:half_way_point] or not power[half_way_point:]:
+        return None
+    ratios = []
+    for half_power, half_hr in ((power[0:half_way_point], hr[0:half_way_point]), (power[half_way_point:], hr[half_way_point:])):
+        hr_avg = sum(half_hr) / len(half_hr)
+        if not hr_avg:
+            return None
+        ratios.append(calculate_normalised_power(power=half_power) / hr_avg)
+    if not ratios[0]:
+        return None
+    return AerobicDecoupling(coupling=((ratios[0] - ratios[1]) / ratios[0]) * 100, first_half_ratio=ratios[0], second_half_ratio=ratios[1])
+
+
+def _random_rides():
+    """
+    Make up random rides, of random lengths, with anything from none to all of
+    their power readings zero, and some HR dropouts.
+
+    Returns:
+        Each ride's power and HR streams.
+    """
+    rng = np.random.default_rng(24)
+    rides = []
+    for zeros in np.linspace(0, 1, STREAMS):
+        length = int(rng.integers(0, 9000))
+        power = rng.integers(1, 900, length)
+        power[rng.random(length) < zeros] = 0
+        hr = rng.integers(90, 190, length)
+        hr[rng.random(length) < 0.05] = 0
+        rides.append((power, hr))
+    return rides
+
+
+@pytest.mark.parametrize("power,hr", _random_rides())
+def test_metrics_match_baseline(power, hr):
+    metrics = calculate_metrics(power=power, hr=hr, moving_time=len(power))
+    assert metrics.normalised_power == calculate_normalised_power(power=power.tolist())
+    assert metrics.aerobic_decoupling == _baseline_aerobic_decoupling(power=power.tolist(), hr=hr.tolist())
+    assert metrics.avg_power == (int(power.sum() / len(power)) if len(power) else 0)
+    assert metrics.work == int(power.sum()) // 1000
+
+
+@pytest.mark.parametrize("power_length,hr_length", [(3600, 3000), (3000, 3600), (100, 0)])
+def test_unequal_streams_are_padded(power_length, hr_length):
+    rng = np.random.default_rng(power_length + hr_length)
+    power = rng.integers(0, 900, power_length)
+    hr = rng.integers(90, 190, hr_length)
+    length = max(power_length, hr_length)
+    metrics = calculate_metrics(power=power, hr=hr, moving_time=length)
+    padded = calculate_metrics(power=np.pad(power, (0, length - power_length)), hr=np.pad(hr, (0, length - hr_length)), moving_time=length)
+    assert (metrics.normalised_power, metrics.aerobic_decoupling, metrics.avg_hr, metrics.work) == (
+        padded.normalised_power,
+        padded.aerobic_decoupling,
+        padded.avg_hr,
+        padded.work,
+    )
+    np.testing.assert_array_equal(metrics.hr_histogram, padded.hr_histogram)
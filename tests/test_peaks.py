@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from calculations import get_moving_average
+from peaks import PEAK_WINDOWS, calculate_peaks
+
+STREAMS = 300  # The number of random streams we check
+WINDOWS = sorted({1, 2, 7, 45, *PEAK_WINDOWS})  # The fixed windows, and a few odd ones
+
+
+def _random_streams():
+    """
+    Make up random streams, of random lengths, with anything from none to all
+    of their readings zero.
+
+    Returns:
+        The streams.
+    """
+    rng = np.random.default_rng(19)
+    streams = []
+    for zeros in np.linspace(0, 1, STREAMS):
+        length = int(rng.integers(0, 8000))
+        stream = rng.integers(1, 1000, length)
+        stream[rng.random(length) < zeros] = 0
+        streams.append(stream)
+    return streams
+
+
+@pytest.mark.parametrize("stream", _random_streams())
+def test_peaks_match_moving_average(stream):
+    peaks = calculate_peaks(source=stream, windows=WINDOWS)
+    for window in WINDOWS:
+        averages = get_moving_average(source=stream.tolist(), window=window)
+        expected = int(max(averages)) if averages else None
+        assert (peaks[window].value if peaks[window] else None) == expected, window
+
+        # The peak sits where it says it does
+        if peaks[window]:
+            readings = stream[peaks[window].start : peaks[window].end]
+            readings = readings[readings != 0]
+            assert len(readings) == window and stream[peaks[window].end - 1] != 0
+            assert int(readings.sum() / window) == peaks[window].value
+
+
+@pytest.mark.parametrize("stream", _random_streams()[::10])
+def test_peaks_with_zeros(stream):
+    peaks = calculate_peaks(source=stream, windows=WINDOWS, with_zeros=True)
+    for window in WINDOWS:
+        if len(stream) < window:
+            assert peaks[window] is None
+            continue
+        sums = np.convolve(stream, np.ones(window, dtype=np.int64), mode="valid")
+        assert peaks[window] == (int(sums.max()) // window, int(sums.argmax()), int(sums.argmax()) + window)
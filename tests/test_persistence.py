@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+from calculations import get_activity_metrics
+from load_file_data import load_file_data
+from persistence import Persistence
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")  # See fixtures/make_fixtures.py
+
+
+def _store_ride(db: Persistence):
+    """
+    Store the plain fixture.
+
+    Args:
+        db: The database.
+
+    Returns:
+        The activity, as it was loaded from the file.
+    """
+    activity = load_file_data(source=os.path.join(FIXTURES, "plain.fit"))
+    activity.zwift_id = "plain"
+    activity.s3_url = "file://plain"
+    db.store(activity=activity)
+    return activity
+
+
+def test_streams_are_read_when_asked_for(home):
+    db = Persistence()
+    loaded = _store_ride(db)
+
+    # Only the channels are stored, not the text we used to keep
+    assert db.conn.execute("select raw_power, raw_hr from activity").fetchall() == [(None, None)]
+
+    # The figures come out the same from the stored channels
+    activity = db.load_by_zwift_id("plain")
+    assert activity.streams is None
+    metrics, expected = get_activity_metrics(activity), get_activity_metrics(loaded)
+    assert (metrics.normalised_power, metrics.aerobic_decoupling, metrics.work) == (expected.normalised_power, expected.aerobic_decoupling, expected.work)
+    np.testing.assert_array_equal(metrics.power_histogram, expected.power_histogram)
+    np.testing.assert_array_equal(metrics.hr_histogram, expected.hr_histogram)
+
+
+def test_older_activities_read_their_text(home):
+    db = Persistence()
+    loaded = _store_ride(db)
+
+    # Make it look like it was stored before its channels were
+    power, hr = loaded.streams["power"], loaded.streams["heart_rate"]
+    with db.conn:
+        db.conn.execute("delete from activity_stream")
+        db.conn.execute("update activity set raw_power = ?, raw_hr = ?", [",".join(map(str, power)), ",".join(map(str, hr))])
+
+    streams = db.load_by_zwift_id("plain").read_streams(channels=["power", "heart_rate", "cadence"])
+    assert streams.keys() == {"power", "heart_rate"}
+    np.testing.assert_array_equal(streams["power"], power)
+    np.testing.assert_array_equal(streams["heart_rate"], hr)
@@ -0,0 +1,42 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from persistence import Persistence
+from watcher import _scan, watch_directory
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")  # See fixtures/make_fixtures.py
+
+
+def _copy_ride(path: str):
+    """
+    Copy a ride to a path, and date it far enough back that the watcher will
+    load it.
+
+    Args:
+        path: Where to copy it to.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    shutil.copyfile(os.path.join(FIXTURES, "plain.fit"), path)
+    an_hour_ago = time.time() - 3600
+    os.utime(path, (an_hour_ago, an_hour_ago))
+
+
+def test_symlink_loops_are_not_followed(home, tmp_path):
+    _copy_ride(str(tmp_path / "a" / "ride.fit"))
+    os.symlink("..", tmp_path / "a" / "loop")
+    watch_directory(directory=str(tmp_path), once=True)
+    assert Persistence().get_known_ids() == {os.path.realpath(tmp_path / "a" / "ride.fit")}
+
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() == 0, reason="root can read any directory")
+def test_unreadable_directories_are_passed_over(tmp_path):
+    _copy_ride(str(tmp_path / "readable" / "ride.fit"))
+    os.makedirs(tmp_path / "unreadable")
+    os.chmod(tmp_path / "unreadable", 0)
+    try:
+        assert [path for path, _, _ in _scan(str(tmp_path))] == [os.path.realpath(tmp_path / "readable" / "ride.fit")]
+    finally:
+        os.chmod(tmp_path / "unreadable", 0o755)
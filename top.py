@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from persistence import Persistence
+from peaks import format_duration, get_peak_windows
+
+
+def top_report(*, window: int, metric: str, count: int, days: Optional[int], with_zeros: bool = False):
+    """
+    Print the activities with the best peaks for a window.
+
+    These are read straight from the peak table's index, so the window has to
+    be one we find peaks for (see peaks.get_peak_windows).
+
+    Args:
+        window:     The window, in seconds.
+        metric:     The stream: "power" or "heart_rate".
+        count:      How many activities to print.
+        days:       Only look at the activities from this many days back, if given.
+        with_zeros: Whether to rank the peaks with zeros included, rather than
+                    dropped (see peaks.calculate_peaks).
+    """
+
+    # Is it a window we have peaks for?
+    if window not in get_peak_windows():
+        print(f"We don't keep {format_duration(window)} peaks. Add the window to the [peaks] section of the config file, then run: fitpeaks backfill")
+        return
+
+    # Load the best
+    db = Persistence()
+    start_date = (datetime.now() - timedelta(days=days)).date().isoformat() if days else ""
+    if not (top := db.load_top_peaks(metric=metric, window_seconds=window, count=count, start_date=start_date, with_zeros=with_zeros)):
+        print("No data to report on (if the window was just added, run: fitpeaks backfill)")
+        return
+
+    # Print them
+    unit = "W" if metric == "power" else "bpm"
+    zeros = ", zeros included" if with_zeros else ""
+    print(f"\x1B[34m\x1B[1mBest {format_duration(window)} {'power' if metric == 'power' else 'HR'} ({unit}{zeros})\x1B[0m")
+    print()
+    print("Rank   Peak   ID      Date               Activity")
+    print("────   ────   ─────   ────────────────   ────────────────────────────────────────────────────────────────────────────────")
+    for rank, (value, activity) in enumerate(top, 1):
+        print(f"{rank:4}   {value:4}   {activity.rowid:<5}   {activity.start_time.strftime('%a %d %b, %Y')}   {activity.activity_name or ''}")
+    print("────   ────   ─────   ────────────────   ────────────────────────────────────────────────────────────────────────────────")
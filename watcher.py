@@ -0,0 +1,111 @@
+import os
+import time
+from typing import Iterator, Tuple
+
+from persistence import Persistence
+from file_loader import load_from_file
+from fit_sources import get_canonical_path, is_archive_name, is_fit_name
+
+POLL_INTERVAL = 10.0  # How often we look for new files, in seconds
+SETTLE_SECONDS = 30.0  # How long a file must go unmodified before we'll load it
+IN_PROGRESS_NAMES = {"inprogressactivity.fit"}  # Files Zwift writes while a ride is under way (any case)
+
+
+def watch_directory(*, directory: str, interval: float = POLL_INTERVAL, once: bool = False):
+    """
+    Watch a directory tree, loading FIT files as they appear or change.
+
+    Args:
+        directory: The directory to watch.
+        interval:  How often to look for new files, in seconds.
+        once:      True to look once and stop, rather than keep watching.
+    """
+    try:
+        _watch_directory(directory=os.path.realpath(directory), interval=interval, once=once)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+def _watch_directory(*, directory: str, interval: float, once: bool):
+    """
+    Watch a directory tree.
+
+    Each pass stats every file, and compares its mtime and size with what they
+    were when we last loaded it; only new or changed files are read. A file
+    that's been modified recently may still be being written, so it's left
+    until a later pass. The index of what we've loaded is kept in the
+    database, so a restart carries on where we left off rather than loading
+    everything again.
+    """
+
+    # Initialise
+    db = Persistence()
+    index = db.load_watch_index()
+    known_ids = db.get_known_ids()
+    print(f"Watching {directory} ({len(index)} files already seen)")
+
+    # Look for files until we're stopped
+    while True:
+
+        # Visit every file that's new or changed since we loaded it
+        now = time.time()
+        for path, mtime, size in _scan(directory):
+            if index.get(path) == (mtime, size):
+                continue
+
+            # Files loaded some other way (e.g. load-dir) just join the index
+            if path not in index and path in known_ids:
+                db.store_watch_entry(path=path, mtime=mtime, size=size)
+                index[path] = (mtime, size)
+                continue
+
+            # Leave files that may still be being written for a later pass
+            if now - mtime < SETTLE_SECONDS:
+                continue
+
+            # Load it through the usual path, then note we've done so, whether
+            # or not it loaded; we'll look at it again if it changes
+            print(f"Loading {path}")
+            try:
+                load_from_file(filename=path)
+            except Exception as e:
+                print(f"Couldn't load {path}: {str(e) or type(e).__name__}")
+            db.store_watch_entry(path=path, mtime=mtime, size=size)
+            index[path] = (mtime, size)
+
+        # Wait for the next pass
+        if once:
+            return
+        time.sleep(interval)
+
+
+def _scan(directory: str) -> Iterator[Tuple[str, float, int]]:
+    """
+    Find the FIT files (and archives of them) in a directory tree.
+
+    Symbolic links to directories aren't followed, so a link back up the tree
+    can't send us round in circles. Anything we can't read (e.g. a directory
+    we don't have permission for, or a file that's gone by the time we look)
+    is passed over.
+
+    Args:
+        directory: The directory to search.
+
+    Returns:
+        The canonical path (see fit_sources.get_canonical_path), modification
+        time, and size of each file.
+    """
+    try:
+        dir_entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for dir_entry in dir_entries:
+        try:
+            if dir_entry.is_dir(follow_symlinks=False):
+                yield from _scan(dir_entry.path)
+            elif dir_entry.is_file() and (is_fit_name(dir_entry.name) or is_archive_name(dir_entry.name)):
+                if dir_entry.name.lower() not in IN_PROGRESS_NAMES:
+                    stat = dir_entry.stat()
+                    yield get_canonical_path(dir_entry.path), stat.st_mtime, stat.st_size
+        except OSError:
+            pass
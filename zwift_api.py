@@ -0,0 +1,220 @@
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import http_client
+
+API_URL = "https://us-or-rly101.zwift.com"  # Where the Zwift API lives
+AUTH_URL = "https://secure.zwift.com/auth/realms/zwift/tokens/access/codes"  # Where we log in
+FIT_FILE_URL = "https://{bucket}.s3.amazonaws.com/{key}"  # Where FIT files live, given their S3 bucket and key
+CLIENT_ID = "Zwift_Mobile_Link"  # The client we log in as
+USER_AGENT = "Zwift/115 CFNetwork/758.0.2 Darwin/15.0.0"  # The user agent the API expects
+
+TOKEN_EXPIRY_MARGIN = 5  # Seconds before a token expires that we stop using it
+
+
+class ZwiftApiError(Exception):
+    """
+    Raised when a Zwift API call fails.
+    """
+
+
+class ZwiftApi:
+    """
+    This class talks to the parts of the Zwift API we use. Every request goes
+    through the shared HTTP client, so connections are reused and transient
+    failures are retried.
+    """
+
+    def __init__(self, *, username: str, password: str, api_url: str = API_URL, auth_url: str = AUTH_URL, token_file: Optional[str] = None):
+        """
+        Initialise ourself.
+
+        Args:
+            username:   The Zwift username.
+            password:   The Zwift password.
+            api_url:    Where the Zwift API lives.
+            auth_url:   Where we log in.
+            token_file: Where to keep our tokens between runs, if anywhere.
+        """
+        self.username = username
+        self.password = password
+        self.api_url = api_url
+        self.auth_url = auth_url
+        self.token_file = token_file
+
+        # Our current tokens, once we've logged in
+        self.access_token: Optional[str] = None
+        self.access_token_expiration = 0.0
+        self.refresh_token: Optional[str] = None
+        self.refresh_token_expiration = 0.0
+
+        # How we got our access token ("saved", "refreshed", or "password"),
+        # and how long it took
+        self.login_method: Optional[str] = None
+        self.login_seconds = 0.0
+
+        # Pick up the tokens from our last run
+        self._load_tokens()
+
+    def list_activities(self, *, player_id: str, start: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        List a player's activities, newest first.
+
+        Args:
+            player_id: The player whose activities we want.
+            start:     How many activities to skip.
+            limit:     The most activities to list.
+
+        Returns:
+            The activities.
+        """
+        return self._get_json(f"/api/profiles/{player_id}/activities/", params={"start": start, "limit": limit})
+
+    def _get_json(self, path: str, *, params: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Make an API request.
+
+        Args:
+            path:   The API path.
+            params: The query parameters.
+
+        Returns:
+            The decoded JSON response.
+        """
+
+        # Make the request
+        r = self._get(path, params=params)
+
+        # A saved token may have been revoked; if so, log in again and retry
+        if r.status_code == 401 and self.login_method == "saved":
+            self.access_token = None
+            self.refresh_token = None
+            r = self._get(path, params=params)
+
+        # Done
+        if not r.ok:
+            raise ZwiftApiError(f"{r.status_code} - {r.reason}")
+        return r.json()
+
+    def _get(self, path: str, *, params: Optional[Dict[str, Any]]):
+        """
+        Make an authorised GET request to the API.
+
+        Args:
+            path:   The API path.
+            params: The query parameters.
+
+        Returns:
+            The response.
+        """
+        headers = {
+            "Accept": "application/json",
+            "Authorization": "Bearer " + self._get_access_token(),
+            "User-Agent": USER_AGENT,
+        }
+        return http_client.get(self.api_url + path, params=params, headers=headers)
+
+    def _get_access_token(self) -> str:
+        """
+        Get an access token. We use the one we have while it's good; when it
+        isn't, we use the refresh token to get another, and only if that fails
+        do we log in with the password.
+
+        Returns:
+            The access token.
+        """
+
+        # Use the token we have, if it's still good
+        now = time.time()
+        if self.access_token and now < self.access_token_expiration:
+            if not self.login_method:
+                self.login_method = "saved"
+            return self.access_token
+
+        # Otherwise refresh it if we can, or log in again if we can't
+        started = time.perf_counter()
+        token_data = None
+        if self.refresh_token and now < self.refresh_token_expiration:
+            token_data = self._request_tokens({"refresh_token": self.refresh_token, "grant_type": "refresh_token"})
+            self.login_method = "refreshed"
+        if not token_data:
+            token_data = self._request_tokens({"username": self.username, "password": self.password, "grant_type": "password"})
+            self.login_method = "password"
+        if not token_data:
+            raise ZwiftApiError("Couldn't log in to Zwift")
+
+        # Note the new tokens, and keep them for next time
+        self.access_token = token_data["access_token"]
+        self.access_token_expiration = now + token_data["expires_in"] - TOKEN_EXPIRY_MARGIN
+        self.refresh_token = token_data.get("refresh_token")
+        self.refresh_token_expiration = now + token_data.get("refresh_expires_in", 0) - TOKEN_EXPIRY_MARGIN
+        self._save_tokens()
+        self.login_seconds += time.perf_counter() - started
+
+        # Done
+        return self.access_token
+
+    def _request_tokens(self, data: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        Ask Zwift for tokens.
+
+        Args:
+            data: The grant we're asking with.
+
+        Returns:
+            The token data, if Zwift gave us any.
+        """
+        r = http_client.post(self.auth_url, data={**data, "client_id": CLIENT_ID})
+        return r.json() if r.ok else None
+
+    def _load_tokens(self):
+        """
+        Load the tokens we saved on our last run, if they're for this user.
+        """
+
+        # Read the file, if there is one
+        if not self.token_file or not os.path.exists(self.token_file):
+            return
+        try:
+            with open(self.token_file) as token_file:
+                saved = json.load(token_file)
+        except (OSError, ValueError):
+            return
+
+        # Use the tokens, if they're for this user and this server
+        if saved.get("username") == self.username and saved.get("auth_url") == self.auth_url:
+            self.access_token = saved.get("access_token")
+            self.access_token_expiration = saved.get("access_token_expiration", 0.0)
+            self.refresh_token = saved.get("refresh_token")
+            self.refresh_token_expiration = saved.get("refresh_token_expiration", 0.0)
+
+    def _save_tokens(self):
+        """
+        Save our tokens for the next run. Only the user can read the file.
+        """
+
+        # Nowhere to save them?
+        if not self.token_file:
+            return
+
+        # Write a temporary file that only we can read, then move it into place
+        saved = {
+            "username": self.username,
+            "auth_url": self.auth_url,
+            "access_token": self.access_token,
+            "access_token_expiration": self.access_token_expiration,
+            "refresh_token": self.refresh_token,
+            "refresh_token_expiration": self.refresh_token_expiration,
+        }
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.token_file), suffix=".tmp")
+        try:
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, "w") as token_file:
+                json.dump(saved, token_file)
+            os.replace(temp_path, self.token_file)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
@@ -1,85 +1,189 @@
-import os
 import configparser
-from typing import Tuple, List, Optional, Any
+from typing import Tuple, List, Optional, Any, Dict
 from pathlib import Path
 from datetime import datetime, timedelta
-from dateutil import parser
+from dateutil import parser, tz
+from concurrent.futures import ThreadPoolExecutor
 from collections import namedtuple
+from dataclasses import dataclass
+import functools
+import json
+import time
 import traceback
 import sys
-import requests
 
-import fitparse.utils
+import http_client
 from persistence import Persistence
 from activity import Activity
 from load_file_data import load_file_data
-from zwift import Client
+from fit_archive import FitArchive
+from fit_prescan import InvalidFitFile, prescan, verify_crc
+from fetch_pipeline import run_fetch_pipeline
+from fetch_metrics import FetchMetrics
+from zwift_api import API_URL, AUTH_URL, FIT_FILE_URL, ZwiftApi
 
 CONFIG_FILE = str(Path.home()) + "/.fit-peaks.rc"
+TOKEN_FILE = str(Path.home()) + "/.fit-peaks.token"  # Where we keep the Zwift tokens between runs
+PAGE_SIZE = 100  # The number of activities we ask Zwift for at once
+LISTING_WORKERS = 4  # The number of pages a backfill lists at once
+MAX_FETCH_ATTEMPTS = 3  # The number of fetches an activity can fail in before we give up on it
 
-TEMP_FILE = "./xyzzy.fit"
 
-
-def load_from_zwift():
+def load_from_zwift(*, metadata_only: bool = False, since: Optional[datetime] = None, max_activities: Optional[int] = None):
     """
     Load the latest data from Zwift.
+
+    Args:
+        metadata_only:  Only refresh the names and elevations of the activities
+                        we already have.
+        since:          Also load any older activities that started on or
+                        after this date (a backfill).
+        max_activities: The most activities to load in this run; the rest
+                        stay queued for the next.
+    """
+    if metadata_only:
+        _refresh_zwift_metadata()
+    else:
+        _load_zwift_data(since=since, max_activities=max_activities)
+
+
+@dataclass
+class QueuedActivity:
     """
-    _load_zwift_data()
+    An activity from the fetch queue, on its way through the pipeline.
+    """
+
+    activity: Dict[str, Any]  # The activity, as Zwift lists it
+    content_hash: Optional[str] = None  # The hash its FIT file is archived under, once it's downloaded
 
 
-def _load_zwift_data():
+def _load_zwift_data(*, since: Optional[datetime], max_activities: Optional[int]):
     """
     Fetch any new data Zwift has for us.
+
+    New activities go into a queue in the database before anything is
+    downloaded, and each one's progress (listed, downloaded, parsed, stored)
+    is recorded as it goes, so if a fetch is interrupted the next one picks up
+    where it stopped: nothing is listed again, and nothing that was downloaded
+    is downloaded again. Activities that fail stay in the queue and are tried
+    again next time, up to MAX_FETCH_ATTEMPTS times; after that they're
+    reported, marked failed, and left out of later fetches.
+
+    The queue is drained through a pipeline (see fetch_pipeline), so several
+    activities are in progress at once; they're still stored oldest first.
+
+    A backfill (since) queues everything back to a date, and max_activities
+    limits how much of the queue one run loads, so a long history can be
+    loaded a chunk at a time, oldest first.
+
+    Args:
+        since:          Also load any older activities that started on or after this date.
+        max_activities: The most activities to load in this run.
     """
 
     # Initialise
     db = Persistence()
-    loaded = 0
-
-    # Get the list of activities we already have
-    known_activities = db.get_known_ids()
-
-    # Get the list of activities to load
-    new_activities = _find_new_activities(known_activities)
-    if new_activities:
-        plural = "activity" if len(new_activities) == 1 else "activities"
-        print(f"Found {len(new_activities)} {plural} to load")
-
-    # Load each new activity
-    for activity in new_activities:
-
-        # Fetch the FIT file
-        zwift_id = activity["id_str"]
-        s3_url = "https://" + activity["fitFileBucket"] + ".s3.amazonaws.com/" + activity["fitFileKey"]
-        if not (activity_record := _load_fit_file_content(s3_url)):
-            print(f"Failed to load FIT file for {zwift_id=} ({s3_url=})")
-            continue
-
-        # Add in extra details
-        activity_record.zwift_id = zwift_id
-        activity_record.s3_url = s3_url
-        activity_name = activity["name"]
-        if activity_name.startswith("Zwift - "):
-            activity_name = activity_name[8:]
-        activity_record.activity_name = activity_name
-
-        # Fetch the elevation
-        activity_record.elevation = int(activity["totalElevation"])
-
-        # Store this record
-        db.store(activity=activity_record)
-        print(f'Loaded activity "{activity_record.activity_name}" ({activity_record.start_time}) (id={activity_record.rowid})')
-        loaded += 1
-
-    # Done.
-    if loaded:
-        plural = "activity" if loaded == 1 else "activities"
-        print(f"Loaded {loaded} {plural}")
+    archive = FitArchive()
+    metrics = FetchMetrics()
 
-
-def _find_new_activities(known_ids: set) -> Optional[List[Any]]:
+    try:
+        # Get the list of activities Zwift has added since we last looked, or
+        # back to the date we're backfilling to
+        fit_file_url = load_zwift_urls()[2]
+        if since:
+            listed = _find_activities_since(since=since, metrics=metrics)
+        else:
+            listed = _find_new_activities(db=db, metrics=metrics)
+        if listed is None:
+            return
+
+        # Queue those we don't already have, and that aren't blank, and move the
+        # cursor past them all, since the queue now remembers them. A backfill
+        # only sets the cursor if there isn't one; it's looking backwards.
+        known_ids = db.get_existing_ids([activity["id_str"] for activity in listed])
+        new_activities = [activity for activity in listed if activity["id_str"] not in known_ids and int(activity["distanceInMeters"])]
+        cursor = (listed[-1]["id_str"], listed[-1].get("startDate")) if listed else None
+        if since and db.get_fetch_cursor():
+            cursor = None
+        db.queue_fetch(listings=[(activity["id_str"], json.dumps(activity)) for activity in new_activities], cursor=cursor)
+
+        # Load whatever's in the queue, including anything left from last time,
+        # as far as we're allowed to in this run
+        queue = [QueuedActivity(activity=json.loads(listing), content_hash=content_hash) for listing, _, content_hash in db.load_fetch_queue()]
+        if not queue:
+            return
+        queued = len(queue)
+        if max_activities is not None:
+            queue = queue[:max_activities]
+        plural = "activity" if queued == 1 else "activities"
+        print(f"Found {queued} {plural} to load" + (f"; loading {len(queue)} now" if len(queue) < queued else ""))
+
+        # Note each activity's progress as it goes
+        def advance(queued: QueuedActivity, state: str):
+            db.set_fetch_state(zwift_id=queued.activity["id_str"], state=state, content_hash=queued.content_hash)
+
+        # Store each activity as it comes out of the pipeline
+        def store(queued: QueuedActivity, activity_record: Activity):
+            activity = queued.activity
+            started = time.perf_counter()
+
+            # Add in extra details
+            activity_record.zwift_id = activity["id_str"]
+            activity_record.s3_url = get_s3_url(activity, fit_file_url=fit_file_url)
+            activity_record.activity_name = _get_activity_name(activity)
+            activity_record.content_hash = queued.content_hash
+
+            # Fetch the elevation
+            activity_record.elevation = int(activity["totalElevation"])
+
+            # Store this record
+            db.store_fetched(activity=activity_record)
+            metrics.add_time("store", time.perf_counter() - started)
+            for stage, seconds in activity_record.load_seconds.items():
+                metrics.add_time(stage, seconds)
+            metrics.print(f'Loaded activity "{activity_record.activity_name}" ({activity_record.start_time}) (id={activity_record.rowid})')
+            metrics.finish_activity(loaded=True)
+
+        # Report any we couldn't load; they'll be downloaded again next time, in
+        # case what we got was damaged on the way, unless they keep failing
+        def fail(queued: QueuedActivity, error: str):
+            activity = queued.activity
+            s3_url = get_s3_url(activity, fit_file_url=fit_file_url)
+            metrics.print(f"Failed to load FIT file for zwift_id={activity['id_str']!r} (s3_url={s3_url!r}): {error}")
+            metrics.finish_activity(loaded=False)
+            queued.content_hash = None
+            attempts = db.fail_fetch(zwift_id=activity["id_str"], max_attempts=MAX_FETCH_ATTEMPTS)
+            if attempts >= MAX_FETCH_ATTEMPTS:
+                metrics.print(f"Giving up on zwift_id={activity['id_str']!r} (s3_url={s3_url!r}) after {attempts} failed attempts; it won't be fetched again")
+
+        # Load each queued activity
+        download = functools.partial(_download_fit_file, fit_file_url=fit_file_url, archive=archive, metrics=metrics)
+        metrics.start_loading(total=len(queue))
+        run_fetch_pipeline(items=queue, download=download, parse=_parse_fit_file, store=store, fail=fail, advance=advance)
+        db.clear_fetch_queue()
+
+        # Say where the time went
+        metrics.summarise()
+
+        # Done.
+        plural = "activity" if metrics.loaded == 1 else "activities"
+        left = f"; {queued - len(queue)} left to load next time" if len(queue) < queued else ""
+        print(f"Loaded {metrics.loaded} {plural}{left}")
+
+    # Keep the numbers so we can compare runs, even those with nothing to load
+    # and those that stopped part way
+    finally:
+        db.store_fetch_metrics(metrics=metrics.get_record())
+
+
+def _find_new_activities(*, db: Persistence, metrics: FetchMetrics) -> Optional[List[Any]]:
     """
-    Fetch the list of new activities to load.
+    Fetch the list of activities Zwift has added since we last looked.
+
+    We keep a cursor: the newest activity we've dealt with. Zwift lists
+    activities newest first, so we page through the list until we reach the
+    cursor (or anything older than it). Usually that's in the first page.
+    Before we have a cursor, we page back until we find an activity we have.
 
     Note: We have to load activities in oldest-first, otherwise the activity ID
           list is screwed up. If we find two new activites, for example, the newest
@@ -87,24 +191,28 @@ def _find_new_activities(known_ids: set) -> Optional[List[Any]]:
           older one first.
 
     Args:
-        known_ids: The list of IDs we already know about.
+        db:      The database, which holds our cursor.
+        metrics: Where we note how long the listing took.
 
     Returns:
-        The list of activities to load, in the order they should be loaded.
+        The activities newer than the cursor, in the order they should be loaded.
     """
 
-    # Fetch the Zwift credentials
-    username, password, player_id = _load_zwift_credentials()
-    if not username:
+    # Create the client
+    client, player_id = _create_client()
+    if not client:
         return None
+    started = time.perf_counter()
 
-    # Create the client
-    client = Client(username, password)
-    activity_client = client.get_activity(player_id)
+    # Find where we got to last time; without a cursor, we stop at any
+    # activity we already have
+    cursor = db.get_fetch_cursor()
+    cursor_id, cursor_date = cursor if cursor else (None, None)
+    known_ids = db.get_known_ids() if not cursor else set()
 
     # Initialise to fetch new activities
     start = 0
-    limit = 2
+    limit = load_page_size()
     keep_searching = True
 
     # The new activity list
@@ -114,66 +222,259 @@ def _find_new_activities(known_ids: set) -> Optional[List[Any]]:
     while keep_searching:
 
         # Fetch the activity list
-        activities = activity_client.list(start=start, limit=limit)
-        if not activities:
-            break
+        activities = client.list_activities(player_id=player_id, start=start, limit=limit)
 
         # Visit each activity
         for activity in activities:
 
-            # If we've seen this activity, we're digging into old data
-            if activity["id_str"] in known_ids:
+            # If we've reached the cursor, or an activity we have, we're
+            # digging into old data
+            if activity["id_str"] == cursor_id or activity["id_str"] in known_ids or _is_before(activity, cursor_date):
                 keep_searching = False
                 break
 
-            # Discard blank entries
-            if not int(activity["distanceInMeters"]):
-                continue
-
             # Add into the list
             new_activity_list.append(activity)
 
-        # Move on.
+        # Move on; a short page is the end of the list
+        if len(activities) < limit:
+            break
         start += limit
 
+    # Note how long that took, and how much of it was logging in
+    metrics.add_time("listing", time.perf_counter() - started)
+    metrics.login_seconds = client.login_seconds
+    metrics.login_method = client.login_method
+
     # Done -- return the list in reverse order, so older activities load first
     return new_activity_list[::-1]
 
 
-def _load_fit_file_content(s3_url: str) -> Optional[Activity]:
+def _find_activities_since(*, since: datetime, metrics: FetchMetrics) -> Optional[List[Any]]:
     """
-    Load the content of a FIT file into an activity.
+    Fetch the list of activities that started on or after a date, for a
+    backfill.
+
+    The first page is fetched on its own (which logs us in, if we need to),
+    then the pages after it are fetched LISTING_WORKERS at a time, until we
+    reach a page that ends before the date, or the end of the list.
 
     Args:
-        s3_url: The S3 URL to load from.
+        since:   The date to go back to.
+        metrics: Where we note how long the listing took.
 
     Returns:
-        The activity, if it loaded ok.
+        The activities, in the order they should be loaded.
     """
 
-    # Setup a request
-    r = requests.get(s3_url)
-    if not (r.status_code == 200):
-        print(f"Failed to load from S3: {r.status_code=}")
+    # Create the client
+    client, player_id = _create_client()
+    if not client:
         return None
+    started = time.perf_counter()
+    limit = load_page_size()
+    if not since.tzinfo:
+        since = since.replace(tzinfo=tz.tzlocal())
+
+    # A page is the last we need if it's short, or it reaches back past the date
+    def is_last_page(page: List[Any]) -> bool:
+        return len(page) < limit or parser.parse(page[-1]["startDate"]) < since
+
+    # Fetch the first page, then the rest a batch at a time
+    pages = [client.list_activities(player_id=player_id, start=0, limit=limit)]
+    with ThreadPoolExecutor(max_workers=LISTING_WORKERS) as executor:
+        while not is_last_page(pages[-1]):
+            first = len(pages)
+            batch = executor.map(lambda page: client.list_activities(player_id=player_id, start=page * limit, limit=limit), range(first, first + LISTING_WORKERS))
+            for page in batch:
+                pages.append(page)
+                if is_last_page(page):
+                    break
+
+    # Note how long that took, and how much of it was logging in
+    metrics.add_time("listing", time.perf_counter() - started)
+    metrics.login_seconds = client.login_seconds
+    metrics.login_method = client.login_method
+
+    # Done -- return those in range, oldest first
+    activities = [activity for page in pages for activity in page if parser.parse(activity["startDate"]) >= since]
+    return activities[::-1]
+
+
+def _refresh_zwift_metadata():
+    """
+    Refresh the names and elevations of the activities we already have, from
+    the full activity list. This never downloads a FIT file, so it's a cheap
+    way to pick up renamed rides or corrected elevations.
+    """
 
-    # Store the content in our temporary file
-    with open(TEMP_FILE, "wb") as fit_file:
-        fit_file.write(r.content)
+    # Create the client
+    client, player_id = _create_client()
+    if not client:
+        return
 
-    # Now load the file
-    if not (new_activity := load_file_data(path=TEMP_FILE)):
-        print(f"Failed to load temporary FIT file")
-        return None
+    # Page through the whole list
+    metadata = []
+    start = 0
+    limit = load_page_size()
+    while True:
+        activities = client.list_activities(player_id=player_id, start=start, limit=limit)
+        metadata += [
+            {"zwift_id": activity["id_str"], "activity_name": _get_activity_name(activity), "elevation": int(activity["totalElevation"])}
+            for activity in activities
+        ]
+        if len(activities) < limit:
+            break
+        start += limit
+
+    # Update the activities we have, all at once
+    updated = Persistence().update_metadata(metadata=metadata)
+
+    # Done.
+    plural = "activity" if updated == 1 else "activities"
+    print(f"Checked {len(metadata)} activities; updated {updated} {plural}")
+
+
+def _create_client() -> Tuple[Optional[ZwiftApi], Optional[str]]:
+    """
+    Create a Zwift API client. It picks up the tokens from our last run, so we
+    don't usually need to log in.
+
+    Returns:
+        A tuple containing the client and the player ID, or Nones if the
+        config file isn't set up.
+    """
+
+    # Fetch the Zwift credentials
+    username, password, player_id = load_zwift_credentials()
+    if not username:
+        return None, None
+
+    # Create the client
+    api_url, auth_url, _ = load_zwift_urls()
+    client = ZwiftApi(username=username, password=password, api_url=api_url, auth_url=auth_url, token_file=TOKEN_FILE)
+
+    # Done
+    return client, player_id
+
+
+def _get_activity_name(activity: Any) -> str:
+    """
+    Get an activity's name, without Zwift's prefix.
+
+    Args:
+        activity: The activity, as Zwift lists it.
+
+    Returns:
+        The activity's name.
+    """
+    activity_name = activity["name"]
+    if activity_name.startswith("Zwift - "):
+        activity_name = activity_name[8:]
+    return activity_name
 
-    # Delete the temporary file
-    os.remove(TEMP_FILE)
+
+def _is_before(activity: Any, date: Optional[str]) -> bool:
+    """
+    Check whether an activity started no later than a given date.
+
+    Args:
+        activity: The activity, as Zwift lists it.
+        date:     The date, as Zwift formats them.
+
+    Returns:
+        True if the activity started on or before the date. If either date is
+        missing, we can't tell, so we say it didn't.
+    """
+    if not date or not activity.get("startDate"):
+        return False
+    return parser.parse(activity["startDate"]) <= parser.parse(date)
+
+
+def get_s3_url(activity: Any, *, fit_file_url: str) -> str:
+    """
+    Find where an activity's FIT file lives.
+
+    Args:
+        activity:     The activity, as Zwift lists it.
+        fit_file_url: Where FIT files live, given their S3 bucket and key.
+
+    Returns:
+        The S3 URL of its FIT file.
+    """
+    return fit_file_url.format(bucket=activity["fitFileBucket"], key=activity["fitFileKey"])
+
+
+def _download_fit_file(queued: QueuedActivity, *, fit_file_url: str, archive: FitArchive, metrics: FetchMetrics) -> bytes:
+    """
+    Download an activity's FIT file, check it arrived whole, and archive it.
+    If it was downloaded by an earlier fetch, it's read from the archive
+    instead; only files that passed the check are archived, so it isn't
+    checked again. This runs in a download thread.
+
+    Args:
+        queued:       The activity.
+        fit_file_url: Where FIT files live, given their S3 bucket and key.
+        archive:      The FIT file archive.
+        metrics:      Where we note how long it took.
+
+    Returns:
+        The FIT file's content.
+    """
+
+    # Already downloaded?
+    started = time.perf_counter()
+    if queued.content_hash and archive.contains(queued.content_hash):
+        content = archive.get(queued.content_hash)
+        metrics.add_download(seconds=time.perf_counter() - started, size=len(content), from_archive=True)
+        return content
+
+    # Download it
+    r = http_client.get(get_s3_url(queued.activity, fit_file_url=fit_file_url))
+    if not (r.status_code == 200):
+        raise IOError(f"Failed to load from S3: {r.status_code=}")
+    metrics.add_download(seconds=time.perf_counter() - started, size=len(r.content), from_archive=False)
+
+    # Make sure we got the whole file
+    try:
+        verify_crc(r.content)
+    except InvalidFitFile as e:
+        raise ValueError(f"Downloaded FIT file is damaged: {e}") from e
+
+    # Keep a copy, so we never need to download it again
+    queued.content_hash = archive.put(r.content)
+
+    # Done
+    return r.content
+
+
+def _parse_fit_file(content: bytes) -> Activity:
+    """
+    Load the content of a FIT file into an activity. This runs in a worker
+    process.
+
+    Args:
+        content: The FIT file's content.
+
+    Returns:
+        The activity.
+    """
+
+    # Find its fingerprint; its CRC was checked when it was downloaded
+    try:
+        fingerprint = prescan(content, check_crc=False)
+    except InvalidFitFile as e:
+        raise ValueError(f"Downloaded FIT file is damaged: {e}") from e
+
+    # Load the activity straight from the response body
+    new_activity = load_file_data(source=content)
+    new_activity.fingerprint = fingerprint
 
     # Done
     return new_activity
 
 
-def _load_zwift_credentials() -> Tuple[str, str, str]:
+def load_zwift_credentials() -> Tuple[str, str, str]:
     """
     Load our Zwift credentials.
 
@@ -193,3 +494,32 @@ def _load_zwift_credentials() -> Tuple[str, str, str]:
     except KeyError:
         print("Create config file properly! See README.md for details.")
         return None, None, None
+
+
+def load_zwift_urls() -> Tuple[str, str, str]:
+    """
+    Load where the Zwift services live. These only need setting to point
+    fit-peaks at a stand-in server (see zwift_standin.py).
+
+    Returns:
+        A tuple containing the API URL, the login URL, and the FIT file URL
+        template.
+    """
+
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    section = config["zwift"] if config.has_section("zwift") else {}
+    return section.get("api-url", API_URL), section.get("auth-url", AUTH_URL), section.get("fit-file-url", FIT_FILE_URL)
+
+
+def load_page_size() -> int:
+    """
+    Load the number of activities to ask Zwift for at once.
+
+    Returns:
+        The page size.
+    """
+
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    return config.getint("zwift", "page-size", fallback=PAGE_SIZE)
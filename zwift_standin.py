@@ -0,0 +1,230 @@
+import json
+import os
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+import http_client
+from zwift_api import ZwiftApi
+from zwift_loader import TOKEN_FILE, get_s3_url, load_zwift_credentials, load_zwift_urls
+
+DEFAULT_PORT = 8780  # The port we serve on by default
+LISTING_FILE = "activities.json"  # The recorded activity listing, newest first
+FIT_DIRECTORY = "fit"  # Where the recorded FIT files are, named by their S3 key
+
+# The requests we answer
+LISTING_PATH = re.compile(r"^/api/profiles/[^/]+/activities/?$")
+FIT_FILE_PATH = re.compile(r"^/s3/[^/]+/(?P<key>.+)$")
+AUTH_PATH = "/auth"
+
+# The token we hand out when someone logs in
+TOKEN = {"access_token": "stand-in", "expires_in": 3600, "refresh_token": "stand-in", "refresh_expires_in": 86400}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    This class answers requests as the Zwift API and S3 would, from a recording.
+
+    The recording is a directory holding the activity listing (activities.json,
+    newest first, as the API returns it) and a "fit" directory holding the FIT
+    files, named by their S3 keys. The server can be told to be slow, and to
+    fail some requests, to see how fetch copes.
+    """
+
+    # Keep connections alive, as the real services do
+    protocol_version = "HTTP/1.1"
+
+    # Set up by serve()
+    directory: str = None
+    activities: List[Dict[str, Any]] = []
+    latency: float = 0.0
+    failure_rate: float = 0.0
+
+    def do_POST(self):
+        """
+        Answer a login.
+        """
+        if not self._before_request():
+            return
+        if self.path.split("?")[0] != AUTH_PATH:
+            self.send_error(404)
+            return
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._send(200, "application/json", json.dumps(TOKEN).encode("utf-8"))
+
+    def do_GET(self):
+        """
+        Answer an activity listing, or a FIT file download.
+        """
+        if not self._before_request():
+            return
+        url = urlparse(self.path)
+
+        # An activity listing
+        if LISTING_PATH.match(url.path):
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                self.send_error(401)
+                return
+            query = parse_qs(url.query)
+            start = int(query.get("start", ["0"])[0])
+            limit = int(query.get("limit", ["20"])[0])
+            self._send(200, "application/json", json.dumps(self.activities[start : start + limit]).encode("utf-8"))
+            return
+
+        # A FIT file
+        if match := FIT_FILE_PATH.match(url.path):
+            path = os.path.join(self.directory, FIT_DIRECTORY, os.path.basename(match.group("key")))
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            with open(path, "rb") as fit_file:
+                self._send(200, "application/octet-stream", fit_file.read())
+            return
+
+        # Anything else
+        self.send_error(404)
+
+    def log_message(self, format: str, *args):
+        """
+        Keep quiet about each request.
+        """
+
+    def _before_request(self) -> bool:
+        """
+        Delay the request, and maybe fail it, as configured.
+
+        Returns:
+            True if the request should be answered.
+        """
+        if self.latency:
+            time.sleep(random.uniform(0, 2 * self.latency))
+        if random.random() < self.failure_rate:
+            self.send_error(503)
+            return False
+        return True
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        """
+        Send a response.
+
+        Args:
+            status:       The HTTP status.
+            content_type: The body's content type.
+            body:         The body.
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(*, directory: str, port: int = DEFAULT_PORT, latency: float = 0.0, failure_rate: float = 0.0):
+    """
+    Serve a recording until we're stopped.
+
+    Args:
+        directory:    The recording.
+        port:         The port to serve on.
+        latency:      The average delay before answering each request, in seconds.
+        failure_rate: The fraction of requests to answer with a 503.
+    """
+
+    # Load the listing
+    with open(os.path.join(directory, LISTING_FILE)) as listing_file:
+        StandInHandler.activities = json.load(listing_file)
+    StandInHandler.directory = directory
+    StandInHandler.latency = latency
+    StandInHandler.failure_rate = failure_rate
+
+    # Tell the user how to use us
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"Serving {len(StandInHandler.activities)} activities from {directory}. Put this in ~/.fit-peaks.rc to use it:")
+    print()
+    print("    [zwift]")
+    print(f"    api-url = {base_url}")
+    print(f"    auth-url = {base_url}{AUTH_PATH}")
+    print(f"    fit-file-url = {base_url}/s3/{{bucket}}/{{key}}")
+    print()
+
+    # Serve until we're stopped
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandInHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def record(*, directory: str, count: int):
+    """
+    Record the latest activities from Zwift, for the stand-in server to serve.
+
+    Args:
+        directory: Where to save the recording.
+        count:     The number of activities to record.
+    """
+
+    # Log in
+    username, password, player_id = load_zwift_credentials()
+    if not username:
+        return
+    api_url, auth_url, fit_file_url = load_zwift_urls()
+    client = ZwiftApi(username=username, password=password, api_url=api_url, auth_url=auth_url, token_file=TOKEN_FILE)
+
+    # Save the listing
+    activities = client.list_activities(player_id=player_id, start=0, limit=count)
+    os.makedirs(os.path.join(directory, FIT_DIRECTORY), exist_ok=True)
+    with open(os.path.join(directory, LISTING_FILE), "w") as listing_file:
+        json.dump(activities, listing_file, indent=2)
+
+    # Save the FIT files
+    for activity in activities:
+        r = http_client.get(get_s3_url(activity, fit_file_url=fit_file_url))
+        if not r.ok:
+            print(f"Couldn't record {activity['fitFileKey']}: {r.status_code}")
+            continue
+        with open(os.path.join(directory, FIT_DIRECTORY, os.path.basename(activity["fitFileKey"])), "wb") as fit_file:
+            fit_file.write(r.content)
+
+    # Done
+    print(f"Recorded {len(activities)} activities in {directory}")
+
+
+@click.group()
+def cli():
+    """
+    A local stand-in for the Zwift API and S3, for testing fetch offline.
+    """
+
+
+@cli.command("serve")
+@click.argument("directory", required=True, type=click.Path(exists=True, file_okay=False))
+@click.option("--port", type=int, default=DEFAULT_PORT, help="The port to serve on.")
+@click.option("--latency", type=float, default=0.0, help="Average seconds to wait before answering each request.")
+@click.option("--failure-rate", type=float, default=0.0, help="Fraction of requests to fail with a 503.")
+def do_serve(directory: str, port: int, latency: float, failure_rate: float):
+    """
+    Serve a recording
+    """
+    serve(directory=directory, port=port, latency=latency, failure_rate=failure_rate)
+
+
+@cli.command("record")
+@click.argument("directory", required=True, type=click.Path(file_okay=False))
+@click.option("--count", type=int, default=20, help="The number of activities to record.")
+def do_record(directory: str, count: int):
+    """
+    Record the latest activities from Zwift
+    """
+    record(directory=directory, count=count)
+
+
+if __name__ == "__main__":
+    cli()